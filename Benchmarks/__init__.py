@@ -0,0 +1 @@
+#Benchmarks of the dendrogram & electrotonic code - see README.md in this folder.
@@ -0,0 +1,115 @@
+#Import times of the packages, and a budget for them.
+#
+#The dendrogram and electrotonic modules import matplotlib, plotly, networkx/graphviz,
+#scipy & pymaid only once they are used, so that importing them (e.g. in every worker
+#process of batch_render & batch_electrotonic_properties) is cheap. This checks that it
+#stays that way: every module is imported in a fresh python process, the best of --repeat
+#runs is compared with the time of importing numpy & pandas alone (which everything needs
+#anyway), and the check fails if a module takes more than its budget on top of that or
+#loads one of the heavy packages:
+#
+#    $ python -m Benchmarks.import_times
+#
+#The exit code is 1 if a module is over budget.
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import pandas as ps
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Seconds a module may take to import, on top of numpy & pandas
+IMPORT_BUDGET = {'Skeleton_Data':0.1,
+                 'Dendrogram_code':0.2,
+                 'Dendrogram_code.Interactive_Dendrograms':0.2,
+                 'Dendrogram_code.batch_render':0.2,
+                 'Dendrogram_code.compare_dendrograms':0.2,
+                 'Electrotonic_Properties.electrotonic_properties_dataframe':0.2,
+                 'Electrotonic_Properties.batch_electrotonic_properties':0.2,
+                 'Electrotonic_Properties.neuron_export':0.2,
+                 'Skeleton_Data.store':0.1}
+
+#Must not be imported by any of the modules above
+HEAVY_MODULES = ['matplotlib', 'plotly', 'networkx', 'pygraphviz', 'scipy', 'pymaid']
+
+_SNIPPET = """
+import sys, time, json
+import numpy, pandas
+start = time.perf_counter()
+{}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds':seconds, 'loaded':[m for m in {!r} if m in sys.modules]}}))
+"""
+
+
+def _import_once(module):
+    out = subprocess.check_output([sys.executable, '-c', _SNIPPET.format('import ' + module, HEAVY_MODULES)], cwd = ROOT)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def baseline_time(repeat = 5):
+    """ Best time of starting python and importing numpy & pandas, in seconds """
+
+    script = 'import time; start = time.perf_counter(); import numpy, pandas; print(time.perf_counter() - start)'
+
+    return min(float(subprocess.check_output([sys.executable, '-c', script], cwd = ROOT)) for _ in range(repeat))
+
+
+def import_times(modules = None, repeat = 5):
+    """ Import time of every module in a fresh python process.
+
+    Parameters
+    ----------
+    modules :       list of str, optional
+                    Defaults to the modules of IMPORT_BUDGET
+    repeat :        int
+                    Best of this many imports is reported
+
+    Returns
+    -------
+    pandas.DataFrame
+                    module, seconds (on top of numpy & pandas), budget, loaded
+                    (heavy modules that were imported) & ok
+    """
+
+    if modules is None:
+        modules = list(IMPORT_BUDGET)
+
+    rows = []
+
+    for module in modules:
+        runs = [_import_once(module) for _ in range(repeat)]
+        budget = IMPORT_BUDGET.get(module, max(IMPORT_BUDGET.values()))
+        seconds = min(r['seconds'] for r in runs)
+        loaded = sorted(set(m for r in runs for m in r['loaded']))
+
+        rows.append({'module':module, 'seconds':seconds, 'budget':budget, 'loaded':' '.join(loaded),
+                     'ok':seconds <= budget and not loaded})
+
+    return ps.DataFrame(rows, columns = ['module', 'seconds', 'budget', 'loaded', 'ok'])
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Check the import times of the packages against their budget')
+    parser.add_argument('modules', nargs = '*', help = 'Modules to check (default: all of IMPORT_BUDGET)')
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args(argv)
+
+    results = import_times(args.modules or None, repeat = args.repeat)
+
+    print('numpy & pandas: {:.3f}s\n'.format(baseline_time(args.repeat)))
+    print(results.to_string(index = False, float_format = '{:.3f}'.format))
+
+    if not results.ok.all():
+        print('\n{} modules over budget or loading heavy packages'.format(int((~results.ok).sum())))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#Benchmarks of the dendrogram and electrotonic code on synthetic neurons.
+#
+#Every stage of plot_nx, plotly_plot_nx and electrotonic_properties_dataframe is timed on
+#its own, on synthetic neurons (see Skeleton_Data/synthetic.py) from 1,000 to 500,000
+#treenodes, so no CATMAID server is needed. For each stage & size the best of --repeat runs
+#is reported, with throughput (treenodes per second) and the peak memory the stage
+#allocated (measured with tracemalloc in a separate run, so it does not slow the timings).
+#
+#Results are stored as json in Benchmarks/results/, together with the git commit and the
+#versions of python & numpy, and can be compared with an earlier run:
+#
+#    $ python -m Benchmarks.run_benchmarks
+#    $ python -m Benchmarks.run_benchmarks --sizes 1000 10000 --compare Benchmarks/results/<earlier run>.json
+#
+#Stages whose dependencies are missing (plotly, pygraphviz, pymaid) are skipped.
+
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.synthetic import synthetic_neuron
+from Skeleton_Data.skeleton import tree_arrays
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+DEFAULT_SIZES = [1000, 10000, 100000, 500000]
+
+#graphviz layouts of larger neurons take too long to benchmark
+GRAPHVIZ_MAX_NODES = 20000
+
+#A stage this much slower than in the compared run is reported as a regression
+REGRESSION_FACTOR = 1.25
+
+
+class SkipStage(Exception):
+    """ Raised by a stage that cannot run here (missing dependency, too large) """
+
+
+def _tree_arrays(ctx):
+    #Like pymaid.calc_cable: the parent index & the distance to the parent
+    ctx['parent'], ctx['parent_dist'] = tree_arrays(ctx['nodes'])
+
+
+def _graph_build(ctx):
+    #As plot_nx & plotly_plot_nx do for graphviz layouts
+    import networkx as nx
+
+    nodes = ctx['nodes'].assign(parent_dist = ctx['parent_dist'] / 1000)
+
+    g = nx.DiGraph()
+    g.add_nodes_from(nodes.treenode_id.values)
+    for e in nodes[['treenode_id','parent_id','parent_dist']].values:
+        if e[1] is None:
+            continue
+        g.add_edge(e[0], e[1], len = e[2])
+
+    ctx['graph'] = g
+
+
+def _layout(prog):
+    def stage(ctx):
+        from Dendrogram_code.tree_layout import tree_layout
+        ctx['pos'] = tree_layout(ctx['nodes'], prog = prog)
+    return stage
+
+
+def _layout_dot(ctx):
+    if len(ctx['nodes']) > GRAPHVIZ_MAX_NODES:
+        raise SkipStage('more than {} nodes'.format(GRAPHVIZ_MAX_NODES))
+    try:
+        import pygraphviz
+    except ImportError:
+        raise SkipStage('pygraphviz not installed')
+
+    import networkx as nx
+    nx.nx_agraph.graphviz_layout(ctx['graph'], prog = 'dot')
+
+
+def _plotly():
+    try:
+        from Dendrogram_code.Interactive_Dendrograms import traces
+    except ImportError:
+        raise SkipStage('plotly not installed')
+    return traces
+
+
+def _traces_svg(ctx):
+    traces = _plotly()
+    index, xy = traces.position_index(ctx['pos'])
+    traces.svg_traces(ctx['nodes'], ctx['soma'], index, xy)
+
+
+def _traces_webgl(ctx):
+    traces = _plotly()
+    index, xy = traces.position_index(ctx['pos'])
+    traces.webgl_traces(ctx['nodes'], ctx['soma'], index, xy, lod = True)
+
+
+def _traces_connectors(ctx):
+    traces = _plotly()
+    index, xy = traces.position_index(ctx['pos'])
+    traces.connector_traces(ctx['connectors'], index, xy, plot_connectors = True)
+
+
+def _radius_kdtree(ctx):
+    from Skeleton_Data.radii import estimate_radii
+    ctx['radii'] = estimate_radii(ctx['nodes'], ctx['connectors'])
+
+
+def _radius_pymaid(ctx):
+    try:
+        import pymaid
+    except ImportError:
+        raise SkipStage('pymaid not installed')
+
+    from Skeleton_Data.skeleton import neuron_from_tables
+
+    #Includes making the CatmaidNeuron, which guess_radius copies anyway
+    x = neuron_from_tables(1, ctx['nodes'], ctx['connectors'])
+    pymaid.guess_radius(x, method = 'linear', smooth = True)
+
+
+def _segment_geometry(ctx):
+    from Electrotonic_Properties.segment_geometry import SegmentGeometry
+    ctx['geometry'] = SegmentGeometry.from_nodes(ctx['nodes'], radii = ctx['radii'])
+
+
+def _electrical(ctx):
+    from Electrotonic_Properties.segment_geometry import electrical_properties
+    electrical_properties(ctx['geometry'])
+
+
+#In order: later stages use what earlier ones left in the context
+STAGES = [('tree_arrays', _tree_arrays),
+          ('graph_build', _graph_build),
+          ('layout_tree', _layout('tree')),
+          ('layout_radial', _layout('radial')),
+          ('layout_dot', _layout_dot),
+          ('traces_svg', _traces_svg),
+          ('traces_webgl', _traces_webgl),
+          ('traces_connectors', _traces_connectors),
+          ('radius_kdtree', _radius_kdtree),
+          ('radius_pymaid', _radius_pymaid),
+          ('segment_geometry', _segment_geometry),
+          ('electrical', _electrical)]
+
+
+def _time(stage, ctx, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        stage(ctx)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(stage, ctx):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage(ctx)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes = DEFAULT_SIZES, stages = None, repeat = 3, memory = True, seed = 0, **neuron_kwargs):
+    """ Times every stage on synthetic neurons of the given sizes.
+
+    Parameters
+    ----------
+    sizes :         list of int
+                    Numbers of treenodes
+    stages :        list of str, optional
+                    Names of the stages to report (all of STAGES by default). Stages
+                    the chosen ones depend on are run as well
+    repeat :        int
+                    Best of this many runs is reported
+    memory :        bool
+                    Also measure the peak memory of every stage
+    seed :          int
+    neuron_kwargs : Passed to synthetic_neuron, e.g. branch_length or connector_density
+
+    Returns
+    -------
+    pandas.DataFrame
+                    stage, n_nodes, n_connectors, seconds, nodes_per_s, peak_mb, status
+    """
+
+    names = [n for n, _ in STAGES]
+    report = set(names if stages is None else stages)
+    unknown = report - set(names)
+    if unknown:
+        raise ValueError('Unknown stages: {}'.format(sorted(unknown)))
+
+    #Warm up (imports, caches) on a small neuron, so that they are not timed with the first size
+    ctx = dict(zip(['nodes', 'connectors'], synthetic_neuron(200, seed = seed)))
+    ctx['soma'] = int(ctx['nodes'].treenode_id.values[ctx['nodes'].parent_id.isnull().values][0])
+    for name, stage in STAGES:
+        try:
+            stage(ctx)
+        except SkipStage:
+            pass
+
+    rows = []
+
+    for n in sizes:
+        nodes, connectors = synthetic_neuron(int(n), seed = seed, **neuron_kwargs)
+        ctx = {'nodes':nodes, 'connectors':connectors,
+               'soma':int(nodes.treenode_id.values[nodes.parent_id.isnull().values][0])}
+
+        print('{} treenodes, {} connectors'.format(len(nodes), len(connectors)))
+
+        for name, stage in STAGES:
+            row = {'stage':name, 'n_nodes':len(nodes), 'n_connectors':len(connectors),
+                   'seconds':np.nan, 'nodes_per_s':np.nan, 'peak_mb':np.nan, 'status':'ok'}
+
+            try:
+                if name not in report:
+                    #Only needed by later stages
+                    stage(ctx)
+                    continue
+
+                row['seconds'] = _time(stage, ctx, repeat)
+                row['nodes_per_s'] = len(nodes) / row['seconds'] if row['seconds'] > 0 else np.inf
+                if memory:
+                    row['peak_mb'] = _peak_memory(stage, ctx) / 1e6
+            except SkipStage as e:
+                row['status'] = 'skipped: {}'.format(e)
+
+            if name in report:
+                rows.append(row)
+                print('  {:<18} {:>10}  {}'.format(name, '-' if row['status'] != 'ok' else
+                                                   '{:.4f}s'.format(row['seconds']), '' if row['status'] == 'ok' else
+                                                   row['status']))
+
+        ctx.clear()
+
+    return ps.DataFrame(rows, columns = ['stage', 'n_nodes', 'n_connectors', 'seconds', 'nodes_per_s', 'peak_mb', 'status'])
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr = subprocess.DEVNULL,
+                                       cwd = os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save(results, path = None, **meta):
+    """ Stores results (and where they were measured) as json. Returns the path """
+
+    commit = _git_commit()
+
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok = True)
+        path = os.path.join(RESULTS_DIR, '{}_{}.json'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), commit))
+
+    meta.update({'date':datetime.datetime.now().isoformat(timespec = 'seconds'), 'commit':commit,
+                 'python':platform.python_version(), 'numpy':np.__version__, 'pandas':ps.__version__,
+                 'machine':platform.platform(), 'cpu_count':os.cpu_count()})
+
+    with open(path, 'w') as f:
+        json.dump({'meta':meta, 'results':json.loads(results.to_json(orient = 'records'))}, f, indent = 1)
+
+    return path
+
+
+def load(path):
+    """ Results stored by save() """
+
+    with open(path) as f:
+        return ps.DataFrame(json.load(f)['results'])
+
+
+def compare(results, baseline, factor = REGRESSION_FACTOR):
+    """ Timings of two runs side by side, by stage & size.
+
+    Returns
+    -------
+    pandas.DataFrame
+                    stage, n_nodes, seconds (this run), baseline_seconds, ratio, regression
+    """
+
+    keys = ['stage', 'n_nodes']
+    both = results[keys + ['seconds']].merge(baseline[keys + ['seconds']].rename(columns = {'seconds':'baseline_seconds'}),
+                                             on = keys).dropna()
+
+    both['ratio'] = both.seconds / both.baseline_seconds
+    both['regression'] = both.ratio > factor
+
+    return both
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the dendrogram & electrotonic code on synthetic neurons')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs = '+', choices = [n for n, _ in STAGES])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--no-memory', action = 'store_true', help = 'Skip the peak memory measurements')
+    parser.add_argument('--branch-length', type = float, default = 30, help = 'Mean treenodes between branch points')
+    parser.add_argument('--connector-density', type = float, default = 0.5, help = 'Connectors per µm of cable')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = 'json file for the results (default: Benchmarks/results/<date>_<commit>.json)')
+    parser.add_argument('--compare', help = 'json file of an earlier run')
+    parser.add_argument('--factor', type = float, default = REGRESSION_FACTOR,
+                        help = 'Slow-down counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, stages = args.stages, repeat = args.repeat, memory = not args.no_memory,
+                  seed = args.seed, branch_length = args.branch_length, connector_density = args.connector_density)
+
+    path = save(results, args.output, sizes = args.sizes, repeat = args.repeat, seed = args.seed,
+                branch_length = args.branch_length, connector_density = args.connector_density)
+
+    with ps.option_context('display.width', 200, 'display.max_rows', None):
+        print()
+        print(results.to_string(index = False, float_format = '{:.4g}'.format))
+        print('\nSaved to {}'.format(path))
+
+        if args.compare:
+            diff = compare(results, load(args.compare), factor = args.factor)
+            print()
+            print(diff.to_string(index = False, float_format = '{:.4g}'.format))
+            if diff.regression.any():
+                print('\n{} regressions (more than {}x slower)'.format(int(diff.regression.sum()), args.factor))
+                return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
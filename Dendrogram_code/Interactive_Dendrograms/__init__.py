@@ -0,0 +1,3 @@
+#Interactive (plotly) dendrograms - see README.md in this folder.
+
+from .plot_nx_plotly import plotly_plot_nx
@@ -0,0 +1,94 @@
+#Benchmark of connector trace construction in plotly_plot_nx.
+#
+#Compares the original nested loops (every node compared with every connector) with the
+#indexed lookup in traces.py on a synthetic neuron. The nested loops are far too slow to
+#run at full size, so they are timed on a subset of connectors and extrapolated (their
+#cost is proportional to nodes x connectors).
+#
+#Run from the top folder of this repository:
+#
+#    $ python -m Dendrogram_code.Interactive_Dendrograms.benchmark_traces
+
+import time
+import argparse
+
+import numpy as np
+import pandas as ps
+
+from Dendrogram_code.Interactive_Dendrograms.traces import position_index, connector_traces
+
+
+def synthetic_layout(n_nodes, n_connectors, seed = 0):
+    """ Random node positions and a connector table attached to random treenodes """
+
+    rng = np.random.RandomState(seed)
+
+    treenode_ids = rng.permutation(n_nodes).astype(np.int64) + 1
+    pos = dict(zip(treenode_ids.tolist(), map(tuple, rng.uniform(0, 1000, (n_nodes, 2)).tolist())))
+
+    connectors = ps.DataFrame({'treenode_id':rng.choice(treenode_ids, n_connectors),
+                               'connector_id':np.arange(n_connectors, dtype = np.int64) + 10**6,
+                               'relation':rng.randint(0, 2, n_connectors)})
+
+    return pos, connectors
+
+
+def nested_loop_positions(pos, connectors):
+    """ The original implementation: for node in nodes: for tn in connector treenodes """
+
+    results = []
+
+    for relation in (0, 1):
+        connector_list = list(connectors[connectors.relation == relation].treenode_id.values)
+
+        x_c = []
+        y_c = []
+        info = []
+
+        for node in pos:
+            for tn in connector_list:
+                if node == tn:
+                    x, y = pos[node]
+                    x_c.append(x)
+                    y_c.append(y)
+                    info.append('connector: {}'.format(tn))
+
+        results.append((x_c, y_c, info))
+
+    return results
+
+
+def indexed_traces(pos, connectors):
+    index, xy = position_index(pos)
+    return connector_traces(connectors, index, xy, plot_connectors = True)
+
+
+def main(n_nodes = 100000, n_connectors = 20000, n_loop_connectors = 200):
+
+    pos, connectors = synthetic_layout(n_nodes, n_connectors)
+
+    print('Synthetic neuron: {} nodes, {} connectors'.format(n_nodes, n_connectors))
+
+    start = time.perf_counter()
+    indexed_traces(pos, connectors)
+    indexed = time.perf_counter() - start
+
+    subset = connectors.iloc[:n_loop_connectors]
+    start = time.perf_counter()
+    nested_loop_positions(pos, subset)
+    loop = (time.perf_counter() - start) * n_connectors / len(subset)
+
+    print('Nested loops (before): {:10.2f}s  (extrapolated from {} connectors)'.format(loop, len(subset)))
+    print('Indexed lookup (after):{:10.2f}s'.format(indexed))
+    print('Speed-up:              {:10.0f}x'.format(loop / indexed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark connector trace construction')
+    parser.add_argument('--nodes', type = int, default = 100000)
+    parser.add_argument('--connectors', type = int, default = 20000)
+    parser.add_argument('--loop-connectors', type = int, default = 200,
+                        help = 'Number of connectors to time the nested loops on')
+    args = parser.parse_args()
+
+    main(args.nodes, args.connectors, args.loop_connectors)
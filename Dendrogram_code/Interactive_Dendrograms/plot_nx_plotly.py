@@ -1,281 +1,190 @@
-import pymaid
-import time
-import matplotlib.pyplot as plt
-import networkx as nx
-import numpy as np
-import pandas as ps
+#plotly (and networkx/graphviz, for the dot & neato layouts) are only imported once a plot
+#is made, so importing this module stays cheap, e.g. in the workers of batch_render.py
 
-from mpl_toolkits.mplot3d import Axes3D
-import matplotlib.pyplot as plt
+from Skeleton_Data.cache import cached_layout
+from Dendrogram_code.tree_layout import tree_layout, NATIVE_PROGS
+from Dendrogram_code.incremental_layout import update_layout, graphviz_layout
+from Dendrogram_code.parallel_layout import parallel_graphviz_layout
+from Skeleton_Data.skeleton import Skeleton
+from Skeleton_Data.volumes import in_volumes
+from Skeleton_Data.instrument import instrumented, stage, count, progress
 
-from scipy import stats
-from plotly.offline import download_plotlyjs, init_notebook_mode, plot, iplot
-init_notebook_mode(connected=True)
 
-import plotly as py
-from plotly.graph_objs import *
-import plotly.graph_objs as go
-
-import collections
-from itertools import chain
-
-import powerlaw
-import colormap
-from colormap import rgb2hex
-
-
-
-def plotly_plot_nx(z, plot_connectors = True, highlight_connectors = None, in_volume = None, prog = 'dot', inscreen = True, filename = None):
-    
-    
-    if not isinstance(z,(pymaid.CatmaidNeuron, pymaid.CatmaidNeuronList)):
-        raise ValueError('Need to pass a CatmaidNeuron')
-    elif isinstance(z, pymaid.CatmaidNeuronList):
-        if len(z) >1:
-            raise ValueError('Need to pass a SINGLE CatmaidNeuron')
-        else:
-            z = z[0]
-    
-    valid_progs = ['neato','dot']
+@instrumented('plotly_plot_nx')
+def plotly_plot_nx(z, plot_connectors = True, highlight_connectors = None, in_volume = None, prog = 'dot', inscreen = True, filename = None, cache = None,
+                   render = 'svg', lod = True, incremental = False, auto_open = True, include_plotlyjs = True, n_cores = None):
+    
+    
+    if not isinstance(z, Skeleton):
+        import pymaid
+        if not isinstance(z,(pymaid.CatmaidNeuron, pymaid.CatmaidNeuronList)):
+            raise ValueError('Need to pass a CatmaidNeuron or Skeleton')
+        elif isinstance(z, pymaid.CatmaidNeuronList):
+            if len(z) >1:
+                raise ValueError('Need to pass a SINGLE CatmaidNeuron')
+            else:
+                z = z[0]
+    
+    #'tree' & 'radial' are fast built-in versions of dot & neato, see tree_layout.py
+    valid_progs = ['neato','dot'] + NATIVE_PROGS
     if prog not in valid_progs:
         raise ValueError('Unknown program parameter!')
     
-    #save start time
+    if render not in ['svg', 'webgl']:
+        raise ValueError('Unknown render parameter!')
+    
+    import plotly.graph_objs as go
+    from plotly.offline import init_notebook_mode, plot, iplot
+    from Dendrogram_code.Interactive_Dendrograms.traces import position_index, connector_traces, volume_trace, VOLUME_COLORS
+    from Dendrogram_code.Interactive_Dendrograms.traces import webgl_traces, svg_traces, level_of_detail_menu, attach_level_of_detail
     
-    start = time.time()
+    #render = 'webgl' uses WebGL (Scattergl) traces for neurons with 100,000s of nodes.
+    #With lod = True, segments are drawn as single straight lines while zoomed out
+    
+    #Time, memory & counters of every stage are recorded (see Skeleton_Data/instrument.py)
     
     #reroot neuron to soma if necessary
     
-    if z.root != z.soma:
-        z.reroot(z.soma)
+    with stage('reroot'):
+        if z.root != z.soma:
+            z.reroot(z.soma)
 
     #Necessary for neato layouts for preservation of segment lengths
     
-    if 'parent_dist' not in z.nodes:
-        z = pymaid.calc_cable(z, return_skdata = True)
+    with stage('calc_cable'):
+        #A Skeleton always has parent_dist; z.nodes would build its node table
+        if not isinstance(z, Skeleton) and 'parent_dist' not in z.nodes:
+            import pymaid
+            z = pymaid.calc_cable(z, return_skdata = True)
         
-    #Generation of networkx diagram
+    #A Skeleton is used as is, so its arrays never have to go through a node table
     
-    g = nx.DiGraph()
-    g.add_nodes_from(z.nodes.treenode_id.values)
-    for e in z.nodes[['treenode_id','parent_id','parent_dist']].values:
-        #skipping root node
-        if e[1] == None:
-            continue
-        g.add_edge(e[0],e[1],len = e[2])
-        
+    tree = z if isinstance(z, Skeleton) else z.nodes
+    
+    count(nodes = len(tree.treenode_id), connectors = len(z.connectors))
         
     #Calculate Layout
-    print ('Calculating node positions...')
-    pos = nx.nx_agraph.graphviz_layout(g, prog = prog)
-    print ('Finished calculating node positions...')
-    
-    print('Now converting for plotly...')
-    
-    #Convering networkx nodes for plotly
-    #NODES
-    
-    x = []
-    y = []
-    node_info = []
-    
-    for n in g.nodes():
-        x_, y_ = pos[n]
+    progress('Calculating node positions...')
+    if prog in NATIVE_PROGS:
+        layout = lambda: tree_layout(tree, prog = prog)
+    elif n_cores is not None:
+        #Huge neurons: subtrees are laid out by graphviz on n_cores worker processes and
+        #stitched together, see parallel_layout.py
+        
+        layout = lambda: parallel_graphviz_layout(z.nodes, prog = prog, n_cores = n_cores)
+    else:
+        #Generation of networkx diagram, only needed by graphviz
+        
+        import networkx as nx
         
-        x.append(x_)
-        y.append(y_)
-        node_info.append("Treenode_id: {}".format(n))
+        with stage('graph_build'):
+            g = nx.DiGraph()
+            g.add_nodes_from(z.nodes.treenode_id.values)
+            for e in z.nodes[['treenode_id','parent_id','parent_dist']].values:
+                #skipping root node
+                if e[1] == None:
+                    continue
+                g.add_edge(e[0],e[1],len = e[2])
         
-    node_trace = go.Scatter(x = x, y = y, mode = 'markers', text = node_info,
-                            hoverinfo = 'text', marker = go.scatter.Marker(showscale=False))
+        layout = lambda: nx.nx_agraph.graphviz_layout(g, prog = prog)
 
-    #EDGES
+    with stage('layout'):
+        if cache is None:
+            pos = layout()
+        else:
+            #Node positions are reused for as long as the skeleton does not change.
+            #With incremental = True, only the edited parts of a changed skeleton are laid out again
+            update = None
+            if incremental and prog not in NATIVE_PROGS:
+                update = lambda old_nodes, old_pos: update_layout(old_nodes, old_pos, z.nodes,
+                                                                  lambda nodes: graphviz_layout(nodes, prog = prog))
+            key = prog if n_cores is None or prog in NATIVE_PROGS else '{} parallel'.format(prog)
+            pos = cached_layout(z.nodes, z.skeleton_id, cache, key, layout, update = update)
+    progress('Finished calculating node positions...')
     
-    xe = []
-    ye = []
+    progress('Now converting for plotly...')
     
-    for e in g.edges():
-        
-        x0, y0 = pos[e[0]]
-        x1, y1 = pos[e[1]]
+    with stage('trace_build'):
         
-        xe += [x0, x1, None]
-        ye += [y0, y1, None]
+        pos_index, pos_xy = position_index(pos)
         
-    edge_trace = go.Scatter(x = xe, y = ye, 
-                            line = go.scatter.Line(width = 1.0, color = '#000'), 
-                            hoverinfo = 'none', mode = 'lines')
-    
-    #SOMA
-    
-    xs = []
-    ys = []
-    
-    for n in g.nodes():
-        if n != z.soma:
-            continue
-        elif n == z.soma:
+        if render == 'webgl':
+            
+            #Edges as polylines in preallocated buffers, hover info via customdata
+            
+            scatter = go.Scattergl
             
-            x__, y__ = pos[n]
-            xs.append(x__)
-            ys.append(y__)
+            tree_traces = webgl_traces(tree, z.soma, pos_index, pos_xy, lod = lod)
             
         else:
             
-            break
+            scatter = go.Scatter
             
-    soma_trace = go.Scatter(x = xs, y = ys,
-                            mode = 'markers',
-                            hoverinfo = 'text',
-                            marker = dict(size = 20, color = 'rgb(0,0,0)'),
-                            text = 'Soma, treenode_id:{}'.format(z.soma))
-    
-    #CONNECTORS:
-    #RELATION  = 0 ARE PRESYNAPSES, RELATION = 1 ARE POSTSYNAPSES
-    
-    if plot_connectors == False:
-        
-        presynapse_connector_trace = go.Scatter()
-        
-        postsynapse_connector_trace = go.Scatter()
-        
-    elif plot_connectors == True:
-        
-
-        presynapse_connector_list = list(z.connectors[z.connectors.relation==0].treenode_id.values)
-        
-        x_pre = []
-        y_pre = []
-        presynapse_connector_info = []
-    
-        for node in g.nodes():
-            for tn in presynapse_connector_list:
+            #Edges, nodes & soma straight from the parent index array of the neuron
             
-                if node == tn:
-                
-                    x,y = pos[node]
-                
-                    x_pre.append(x)
-                    y_pre.append(y)
-                    presynapse_connector_info.append("Presynapse, connector_id: {}".format(tn))
-    
-        presynapse_connector_trace = go.Scatter(x = x_pre, y = y_pre, 
-                                            text = presynapse_connector_info, mode = 'markers', hoverinfo = 'text',
-                                            marker = dict(size = 10, color = 'rgb(0,255,0)'))
+            tree_traces = svg_traces(tree, z.soma, pos_index, pos_xy)
+            
+        #CONNECTORS:
+        #RELATION  = 0 ARE PRESYNAPSES, RELATION = 1 ARE POSTSYNAPSES
+        #Connector positions are looked up in one go (treenode_id -> row of node positions)
+        
+        presynapse_connector_trace, postsynapse_connector_trace, HC_trace = connector_traces(z.connectors, pos_index, pos_xy,
+                                                                                             plot_connectors = plot_connectors,
+                                                                                             highlight_connectors = highlight_connectors,
+                                                                                             scatter = scatter)
     
-        postsynapse_connectors_list = list(z.connectors[z.connectors.relation==1].treenode_id.values)
     
-        x_post = []
-        y_post = []
-        postsynapse_connector_info = []
+    ##Highlight the nodes that are in particular volumes, one trace per volume
+    #Meshes are fetched once per session (kept on disk with a cache) and the neuron is not modified
     
-        for node in g.nodes():
-            for tn in postsynapse_connectors_list:
-            
-                if node == tn:
-                
-                    x,y = pos[node]
-                
-                    x_post.append(x)
-                    y_post.append(y)
-                
-                    postsynapse_connector_info.append("Postsynapse, connector id: {}".format(tn))
-                
-        postsynapse_connector_trace = go.Scatter(x = x_post, y = y_post, 
-                                             text = postsynapse_connector_info, mode = 'markers', hoverinfo = 'text', 
-                                             marker = dict(size = 10, color = 'rgb(0,0,255)'))
-
-
-    if highlight_connectors == None:
+    if in_volume is None:
         
-        HC_trace = go.Scatter()
+        in_volume_traces = [scatter()]
         
-    elif highlight_connectors != None: 
-        
-        HC_nodes = []
+    else:
         
-        for i in highlight_connectors:
-            
-            HC_nodes.append(z.connectors[z.connectors.connector_id == i].treenode_id.values[0])
+        with stage('volumes'):
             
-            HC_x = []
-            HC_y = []
+            inside = in_volumes(tree, in_volume, cache = cache)
             
-            HC_info = []
-            
-            for node in g.nodes():
-                
-                for tn in HC_treenodes:
-                    
-                    if node == tn:
-                        
-                        x,y = pos[node]
-                        
-                        HC_x.append(x)
-                        HC_y.append(y) 
-                        
-                        HC_info.append("Connector of Interest, connector_id: {}, treenode_id: {}".format(z.connectors[z.connectors.treenode_id == node].connector_id.values[0],node))
-                        
-            HC_trace = go.Scatter(x = HC_x, y = HC_y, 
-                                  text = HC_info, mode = 'markers', hoverinfo = 'text', 
-                                  marker = dict(size = 15, color = 'rgb(238,0,255)'))
-            
-                        
-    
-    
-    ##Highlight the nodes that are in a particular volume
+            in_volume_traces = [volume_trace(inside.index.values, inside[name].values, pos_index, pos_xy, name, scatter,
+                                             color = VOLUME_COLORS[i % len(VOLUME_COLORS)])
+                                for i, name in enumerate(inside.columns)]
+
     
+    progress("Creating Plotly Graph")
     
-    if in_volume == None:
-        
-        in_volume_trace = go.Scatter()
+    with stage('figure'):
         
-    elif in_volume != None:
+        fig = go.Figure(data = tree_traces + [
+                                     presynapse_connector_trace, postsynapse_connector_trace, HC_trace] + in_volume_traces, 
+                        layout = go.Layout(title = dict(text = "Plotly graph of {} with {} layout".format(z.neuron_name, prog),
+                                                        font = dict(size = 16)),
+                                           showlegend = False, 
+                                           hovermode = 'closest', margin = dict(b = 20, l = 50, r = 5, t = 40), annotations= [dict(showarrow = False, xref = 'paper', yref = 'paper', x = 0.005, y = -0.002)],
+                                           xaxis = go.layout.XAxis(showgrid = False, zeroline = False, showticklabels = False),
+                                           yaxis = go.layout.YAxis(showgrid = False, zeroline = False, showticklabels = False)))
         
-        #Volume of interest
+        if render == 'webgl' and lod:
+            
+            fig.update_layout(updatemenus = level_of_detail_menu())
         
-        res = pymaid.in_volume(z.nodes, volume = in_volume, mode = "IN")
-        z.nodes['IN_VOLUME'] = res
+    #With inscreen = False nothing needs a notebook, e.g. for batch_render.py. include_plotlyjs = 'cdn'
+    #keeps html files small by loading plotly.js from the web instead of embedding it
+    
+    with stage('output'):
         
-        x_VOI = []
-        y_VOI = []
+        if inscreen == True:
         
-        VOI_info = []
+            init_notebook_mode(connected = True)
         
-        for nodes in g.nodes():
+            if render == 'webgl' and lod:
             
-            for tn in list(z.nodes[z.nodes.IN_VOLUME == True].treenode_id.values):
-                
-                if nodes == tn:
-                    
-                    x,y = pos[tn]
-                    
-                    x_VOI.append(x)
-                    y_VOI.append(y)
-                    
-                    VOI_info.append("Treenode {} is in {} volume".format(tn, in_volume))
-                    
-        in_volume_trace = go.Scatter(x = x_VOI, y = y_VOI, 
-                                     text = VOI_info, mode = 'markers', hoverinfo = 'text', 
-                                     marker = dict(size = 5, color = 'rgb(35,119,0)'))        
-
-    
-    print("Creating Plotly Graph")
-    
-    fig = go.Figure(data = [edge_trace, node_trace, soma_trace, 
-                                 presynapse_connector_trace, postsynapse_connector_trace, HC_trace, in_volume_trace], 
-                    layout = go.Layout(title = "Plotly graph of {} with {} layout".format(z.neuron_name, prog), 
-                                       titlefont = dict(size = 16), 
-                                       showlegend = False, 
-                                       hovermode = 'closest', margin = dict(b = 20, l = 50, r = 5, t = 40), annotations= [dict(showarrow = False, xref = 'paper', yref = 'paper', x = 0.005, y = -0.002)],
-                                       xaxis = go.layout.XAxis(showgrid = False, zeroline = False, showticklabels = False),
-                                       yaxis = go.layout.YAxis(showgrid = False, zeroline = False, showticklabels = False)))
-    
-    if inscreen == True:
+                #Switches between overview & detailed edges as you zoom
+                return(attach_level_of_detail(fig, pos_xy))
         
-        return(iplot(fig))
+            return(iplot(fig))
     
-    else:
+        else:
         
-        return(plot(fig, filename = filename))
-    
\ No newline at end of file
+            return(plot(fig, filename = filename, auto_open = auto_open, include_plotlyjs = include_plotlyjs))
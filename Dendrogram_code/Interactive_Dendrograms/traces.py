@@ -0,0 +1,370 @@
+#Construction of the traces of plotly_plot_nx.
+#
+#Node positions are held in one array with a treenode_id -> row index, so placing the
+#connectors of a neuron is a single vectorised lookup instead of comparing every node
+#with every connector.
+#
+#For render = 'webgl', edges are written into preallocated numpy buffers (NaN separates
+#lines), unbranched runs of the neuron are drawn as single polylines, and an 'overview'
+#version of the edges with one straight line per segment is used when zoomed out
+#(level of detail). Hover info comes from customdata + a hovertemplate rather than
+#one Python string per node.
+
+import numpy as np
+import pandas as ps
+
+import plotly.graph_objs as go
+
+from Skeleton_Data.tree import child_counts, depth_first_order, segments
+from Skeleton_Data.skeleton import tree_arrays
+
+#Above this many visible treenodes, the overview edges are drawn instead of every edge
+LOD_MAX_POINTS = 20000
+
+
+def position_index(pos):
+    """ Converts a layout {treenode_id: (x, y)} into an index & position array.
+
+    Parameters
+    ----------
+    pos :       dict
+                Layout as returned by graphviz_layout or tree_layout
+
+    Returns
+    -------
+    index :     pandas.Index
+                treenode_id -> row of xy
+    xy :        numpy.ndarray
+                (N, 2) positions
+    """
+
+    ids = np.fromiter(pos.keys(), dtype = np.int64, count = len(pos))
+    xy = np.array(list(pos.values()), dtype = np.float64).reshape(-1, 2)
+
+    return ps.Index(ids), xy
+
+
+def lookup_positions(index, xy, treenodes):
+    """ Positions of the given treenodes. Treenodes that are not in the
+    layout (e.g. removed by downsampling) are dropped.
+
+    Returns
+    -------
+    positions :     numpy.ndarray
+                    (M, 2) positions of the treenodes that were found
+    found :         numpy.ndarray
+                    Boolean mask of which treenodes were found
+    """
+
+    ix = index.get_indexer(np.asarray(treenodes, dtype = np.int64))
+    found = ix >= 0
+
+    return xy[ix[found]], found
+
+
+def _marker_trace(index, xy, treenodes, text, marker, scatter = go.Scatter):
+    positions, found = lookup_positions(index, xy, treenodes)
+
+    return scatter(x = positions[:, 0], y = positions[:, 1],
+                   text = list(np.asarray(text, dtype = object)[found]),
+                   mode = 'markers', hoverinfo = 'text', marker = marker)
+
+
+def connector_traces(connectors, index, xy, plot_connectors = True, highlight_connectors = None, scatter = go.Scatter):
+    """ Presynapse, postsynapse & highlighted connector traces.
+
+    Parameters
+    ----------
+    connectors :            pandas.DataFrame
+                            Connector table of a CatmaidNeuron.
+                            RELATION = 0 ARE PRESYNAPSES, RELATION = 1 ARE POSTSYNAPSES
+    index, xy :             see position_index()
+    plot_connectors :       bool
+    highlight_connectors :  list of int, optional
+                            connector_ids to highlight
+    scatter :               go.Scatter | go.Scattergl
+
+    Returns
+    -------
+    presynapse_connector_trace, postsynapse_connector_trace, HC_trace : go.Scatter
+    """
+
+    if plot_connectors:
+
+        pre = connectors[connectors.relation == 0]
+        post = connectors[connectors.relation == 1]
+
+        presynapse_connector_trace = _marker_trace(index, xy, pre.treenode_id.values,
+                                                   ['Presynapse, connector_id: {}'.format(c) for c in pre.connector_id.values],
+                                                   dict(size = 10, color = 'rgb(0,255,0)'), scatter)
+
+        postsynapse_connector_trace = _marker_trace(index, xy, post.treenode_id.values,
+                                                    ['Postsynapse, connector id: {}'.format(c) for c in post.connector_id.values],
+                                                    dict(size = 10, color = 'rgb(0,0,255)'), scatter)
+
+    else:
+
+        presynapse_connector_trace = go.Scatter()
+
+        postsynapse_connector_trace = go.Scatter()
+
+    if highlight_connectors is None:
+
+        HC_trace = go.Scatter()
+
+    else:
+
+        hc = connectors[connectors.connector_id.isin(list(highlight_connectors))]
+
+        HC_trace = _marker_trace(index, xy, hc.treenode_id.values,
+                                 ['Connector of Interest, connector_id: {}, treenode_id: {}'.format(c, tn)
+                                  for c, tn in zip(hc.connector_id.values, hc.treenode_id.values)],
+                                 dict(size = 15, color = 'rgb(238,0,255)'), scatter)
+
+    return presynapse_connector_trace, postsynapse_connector_trace, HC_trace
+
+
+#Marker colours of the in-volume traces, one per volume
+VOLUME_COLORS = ['rgb(35,119,0)', 'rgb(230,97,1)', 'rgb(94,60,153)', 'rgb(0,150,170)', 'rgb(204,0,102)', 'rgb(153,112,0)']
+
+
+def volume_trace(treenode_ids, in_volume, index, xy, volume_name, scatter = go.Scatter, color = VOLUME_COLORS[0]):
+    """ Trace of the treenodes inside a volume.
+
+    Parameters
+    ----------
+    treenode_ids :  numpy.ndarray
+    in_volume :     numpy.ndarray
+                    Boolean mask (same length as treenode_ids), e.g. a column of
+                    Skeleton_Data.volumes.in_volumes
+    index, xy :     see position_index()
+    volume_name :   str
+    scatter :       go.Scatter | go.Scattergl
+    color :         str
+
+    Returns
+    -------
+    go.Scatter
+    """
+
+    tn = np.asarray(treenode_ids)[np.asarray(in_volume, dtype = bool)]
+
+    return _marker_trace(index, xy, tn,
+                         ['Treenode {} is in {} volume'.format(t, volume_name) for t in tn],
+                         dict(size = 5, color = color), scatter)
+
+
+def node_positions(nodes, index, xy):
+    """ Positions of all treenodes of a node table, in the same order
+    (NaN for treenodes missing from the layout) """
+
+    ix = index.get_indexer(np.asarray(nodes.treenode_id).astype(np.int64))
+
+    node_xy = np.full((len(ix), 2), np.nan)
+    node_xy[ix >= 0] = xy[ix[ix >= 0]]
+
+    return node_xy
+
+
+def polyline_buffers(parent, node_xy):
+    """ x & y arrays drawing every unbranched run of the neuron as one
+    polyline, runs separated by NaN.
+
+    In depth-first order, every run (from the node after a branch point down to
+    the next branch point or leaf) is a contiguous stretch, so each run only
+    needs its branch point put in front of it and a NaN after it.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array, see Skeleton_Data/tree.py
+    node_xy :   numpy.ndarray
+                (N, 2) positions of the nodes
+
+    Returns
+    -------
+    xe, ye :    numpy.ndarray
+    """
+
+    order = depth_first_order(parent)[1:]
+
+    #Runs start at nodes whose parent is a branch point or the root
+    up = parent[order]
+    is_first = (child_counts(parent)[up] > 1) | (parent[up] < 0)
+
+    k = np.cumsum(is_first)
+    slot = np.arange(len(order)) + 2 * k - 1
+
+    buf = np.full((len(order) + 2 * k[-1], 2), np.nan) if len(order) else np.full((0, 2), np.nan)
+
+    buf[slot] = node_xy[order]
+    buf[slot[is_first] - 1] = node_xy[up[is_first]]
+
+    return buf[:, 0], buf[:, 1]
+
+
+def overview_buffers(parent, node_xy):
+    """ x & y arrays with one straight line per segment (branch point/leaf
+    to the next branch point/root), separated by NaN """
+
+    start, end = segments(parent)
+
+    buf = np.full((len(start), 3, 2), np.nan)
+    buf[:, 0] = node_xy[end]
+    buf[:, 1] = node_xy[start]
+
+    return buf[:, :, 0].ravel(), buf[:, :, 1].ravel()
+
+
+def edge_buffers(parent, node_xy):
+    """ x & y arrays with one line per edge (child to parent), separated by NaN """
+
+    child = np.flatnonzero(parent >= 0)
+
+    buf = np.full((len(child), 3, 2), np.nan)
+    buf[:, 0] = node_xy[child]
+    buf[:, 1] = node_xy[parent[child]]
+
+    return buf[:, :, 0].ravel(), buf[:, :, 1].ravel()
+
+
+def svg_traces(nodes, soma, index, xy):
+    """ Edge, node & soma traces for render = 'svg', built from the parent
+    index array of the neuron rather than a networkx graph.
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame | Skeleton
+                    Node table
+    soma :          int
+                    treenode_id of the soma
+    index, xy :     see position_index()
+
+    Returns
+    -------
+    list of go.Scatter
+                    [edges, nodes, soma]
+    """
+
+    parent = tree_arrays(nodes)[0]
+    node_xy = node_positions(nodes, index, xy)
+
+    xe, ye = edge_buffers(parent, node_xy)
+    edge_trace = go.Scatter(x = xe, y = ye,
+                            line = go.scatter.Line(width = 1.0, color = '#000'),
+                            hoverinfo = 'none', mode = 'lines')
+
+    node_trace = go.Scatter(x = node_xy[:, 0], y = node_xy[:, 1], mode = 'markers',
+                            text = ['Treenode_id: {}'.format(n) for n in np.asarray(nodes.treenode_id).tolist()],
+                            hoverinfo = 'text', marker = go.scatter.Marker(showscale = False))
+
+    soma_xy, _ = lookup_positions(index, xy, [soma])
+    soma_trace = go.Scatter(x = soma_xy[:, 0], y = soma_xy[:, 1],
+                            mode = 'markers',
+                            hoverinfo = 'text',
+                            marker = dict(size = 20, color = 'rgb(0,0,0)'),
+                            text = 'Soma, treenode_id:{}'.format(soma))
+
+    return [edge_trace, node_trace, soma_trace]
+
+
+def webgl_traces(nodes, soma, index, xy, lod = True):
+    """ WebGL edge, node & soma traces for large neurons.
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame | Skeleton
+                    Node table
+    soma :          int
+                    treenode_id of the soma
+    index, xy :     see position_index()
+    lod :           bool
+                    If True, also returns an overview edge trace (one line per
+                    segment), see attach_level_of_detail()
+
+    Returns
+    -------
+    list of go.Scattergl
+                    [edges, (overview edges,) nodes, soma]
+    """
+
+    parent = tree_arrays(nodes)[0]
+    node_xy = node_positions(nodes, index, xy)
+
+    line = dict(width = 1.0, color = '#000')
+
+    xe, ye = polyline_buffers(parent, node_xy)
+    traces = [go.Scattergl(x = xe, y = ye, mode = 'lines', line = line, hoverinfo = 'none', name = 'edges')]
+
+    if lod:
+        xo, yo = overview_buffers(parent, node_xy)
+        traces.append(go.Scattergl(x = xo, y = yo, mode = 'lines', line = line, hoverinfo = 'none',
+                                   name = 'overview', visible = False))
+
+    traces.append(go.Scattergl(x = node_xy[:, 0], y = node_xy[:, 1], mode = 'markers',
+                               customdata = np.asarray(nodes.treenode_id),
+                               hovertemplate = 'Treenode_id: %{customdata}<extra></extra>',
+                               marker = dict(size = 3, color = 'rgba(0,0,0,0.3)'), name = 'nodes'))
+
+    soma_xy, _ = lookup_positions(index, xy, [soma])
+    traces.append(go.Scattergl(x = soma_xy[:, 0], y = soma_xy[:, 1], mode = 'markers', hoverinfo = 'text',
+                               marker = dict(size = 20, color = 'rgb(0,0,0)'),
+                               text = 'Soma, treenode_id:{}'.format(soma), name = 'soma'))
+
+    if lod and len(nodes) > LOD_MAX_POINTS:
+        traces[0].visible = False
+        traces[1].visible = True
+
+    return traces
+
+
+def level_of_detail_menu():
+    """ Buttons switching between the overview and detailed edges (the
+    first two traces of webgl_traces), for figures saved as html """
+
+    return [dict(type = 'buttons', direction = 'left', x = 0, y = 1.08, xanchor = 'left',
+                 buttons = [dict(label = 'Overview', method = 'restyle', args = [{'visible':[False, True]}, [0, 1]]),
+                            dict(label = 'Full detail', method = 'restyle', args = [{'visible':[True, False]}, [0, 1]])])]
+
+
+def attach_level_of_detail(fig, xy, max_points = LOD_MAX_POINTS):
+    """ Turns a figure into a FigureWidget that shows the overview edges when
+    zoomed out and every edge once fewer than max_points treenodes are in view.
+    Needs a running notebook kernel (ipywidgets).
+
+    Parameters
+    ----------
+    fig :           go.Figure
+                    Figure whose first two traces come from webgl_traces(lod = True)
+    xy :            numpy.ndarray
+                    (N, 2) node positions
+    max_points :    int
+
+    Returns
+    -------
+    go.FigureWidget
+    """
+
+    fw = go.FigureWidget(fig)
+
+    order = np.argsort(xy[:, 0], kind = 'stable')
+    xs = xy[order, 0]
+    ys = xy[order, 1]
+
+    def on_zoom(layout, xrange, yrange):
+        if xrange is None or yrange is None:
+            n_visible = len(xs)
+        else:
+            lo, hi = np.searchsorted(xs, sorted(xrange))
+            y_lo, y_hi = sorted(yrange)
+            n_visible = int(((ys[lo:hi] >= y_lo) & (ys[lo:hi] <= y_hi)).sum())
+
+        detail = n_visible <= max_points
+
+        with fw.batch_update():
+            fw.data[0].visible = detail
+            fw.data[1].visible = not detail
+
+    fw.layout.on_change(on_zoom, 'xaxis.range', 'yaxis.range')
+
+    return fw
@@ -3,67 +3,70 @@
 
 #Import required packages
 
+#matplotlib, networkx/graphviz & pymaid are only imported once they are needed, so importing
+#this module is cheap (e.g. in the workers of batch_render.py)
+
 import sys
-sys.path.append('/Users/')
-import pymaid
-import time
-import matplotlib.pyplot as plt
-import networkx as nx
+import hashlib
 import numpy as np
 import pandas as ps
 
-#A requirement of this code is access to CATMAID.
-#This is for API access to the CATMAID servers and to download skeleton information
-server = 
-http_user = 
-http_pw = 
-token = 
-
-
-pymaid.CatmaidInstance( server, http_user, http_pw, token)
-
-
-
-
-#This is an integer number that is unique to your neuron of interest
-Neuron_1_skeleton_id_number = 
-Neuron_1 = pymaid.get_neuron(Neuron_skeleton_id_number)
-
-Neuron_2_skeleton_id_number = 
-Neuron_2 = pymaid.get_neuron(Neuron_2_skeleton_id_number) 
-
-#This function downsamples the neuron - it removes large stretches of skeleton that do not have any branch points.
-#When the argument preserve_cn_treenodes = True, this preserves the treenodes where connectors (pre/postsynapses)
-#have been placed. Downsampling is used to reduce the computational time, as some 3D reconstructed neurons can become 
-#very large. 
-Neuron.downsample(1000000, preserve_cn_treenodes = True) 
-Neuron_2.downsample(1000000, preserve_cn_treenodes = True)
-
-
-#Get the connectors between the two neurons of interest
-#When True, the directional argument will return the connectors (pre and post synapses)
-#from neuron A to neuron B (A-->B; in this case Neuron_1 to Neuron_2). When False, it will return all
-#connectors between neuron A to neuron B (A<-->B; in this case, all connectors between Neuron_1 to Neuron_2)
+from Skeleton_Data.cache import cached_layout
+from Dendrogram_code.tree_layout import tree_layout, NATIVE_PROGS
+from Dendrogram_code.incremental_layout import update_layout, graphviz_layout
+from Dendrogram_code.parallel_layout import parallel_graphviz_layout
+from Skeleton_Data.skeleton import Skeleton, tree_arrays
+from Skeleton_Data.volumes import in_volumes
+from Skeleton_Data.instrument import instrumented, stage, count, progress
 
-Neuron_1_to_Neuron_2 = pymaid.get_connectors_between(Neuron_1,Neuron_2, directional = True)
+#Marker colours of the treenodes inside volumes, one per volume
+VOLUME_COLORS = ['C2', 'C1', 'C4', 'C9', 'C6', 'C8']
 
+#Colour map of the attenuation to the soma, for electrotonic dendrograms
+ATTENUATION_CMAP = 'viridis'
 
 
-def plot_nx(x, plot_connectors=True, highlight_connectors=None, prog='dot'):
+@instrumented('plot_nx')
+def plot_nx(x, plot_connectors=True, highlight_connectors=None, prog='dot', cache=None, incremental=False,
+            in_volume=None, electrotonic=None, n_cores=None):
     """ This lets you plot neurons as dendrograms using networkx and its bindings
     to graphviz.
     Parameters
     ----------
-    x :     				CatmaidNeuron
-            				Neuron to plot. Strongly recommend to downsample the neuron!
+    x :     				CatmaidNeuron | Skeleton
+            				Neuron to plot. Strongly recommend to downsample the neuron
+                            (unless using the 'tree' or 'radial' layouts)!
     plot_connectors :       bool, optional
                             If True, connectors will be plotted
     highlight_connectors :  list of int
                             These connectors (or more precisely, the treenodes they
                             connect to) will be highlighted in green
-    prog :                  {'dot','neato','fdp'}
+    prog :                  {'dot','neato','fdp','tree','radial'}
                             Graphviz layout to use. Be aware that neato and fdp are 
-                            extremely slow!
+                            extremely slow! 'tree' (like dot) and 'radial' (like neato,
+                            preserves cable lengths) are fast built-in layouts that
+                            do not need graphviz or downsampling, see tree_layout.py
+    cache :                 SkeletonCache, optional
+                            If given, node positions are stored on disk and reused
+                            as long as the skeleton does not change
+    incremental :           bool, optional
+                            With a cache and a graphviz layout: after the neuron has
+                            been edited, only lay out the changed parts and keep the
+                            rest of the previous layout (see incremental_layout.py)
+    in_volume :             str | VolumeMesh | list of these, optional
+                            Mark the treenodes inside these CATMAID volumes, one colour
+                            per volume (see Skeleton_Data/volumes.py)
+    electrotonic :          bool | pandas.DataFrame, optional
+                            If True, edge lengths are electrotonic lengths (L = l/λ,
+                            from Rm, Ri & the radius of each cable) instead of cable
+                            lengths, and edges & connectors are coloured by their
+                            steady-state attenuation to the soma. Pass a table from
+                            electrotonic_distances() to use other Rm/Ri values or radii
+                            (see Electrotonic_Properties/electrotonic_distance.py)
+    n_cores :               int, optional
+                            With a graphviz layout: split the neuron into subtrees that
+                            are laid out on this many worker processes and stitched
+                            together, for huge neurons (see parallel_layout.py)
     Returns
     -------
     Nothing
@@ -80,80 +83,213 @@ def plot_nx(x, plot_connectors=True, highlight_connectors=None, prog='dot'):
     >>> plt.show()
     """
 
-    if not isinstance(x, (pymaid.CatmaidNeuron, pymaid.CatmaidNeuronList)):
-        raise ValueError('Need to pass a CatmaidNeuron')
-    elif isinstance(x, pymaid.CatmaidNeuronList):
-        if len(x) > 1:
-            raise ValueError('Need to pass a SINGLE CatmaidNeuron')
-        else:
-            x = x[0]
-
-    valid_progs = ['fdp','dot','neato']
+    if not isinstance(x, Skeleton):
+        import pymaid
+        if not isinstance(x, (pymaid.CatmaidNeuron, pymaid.CatmaidNeuronList)):
+            raise ValueError('Need to pass a CatmaidNeuron or Skeleton')
+        elif isinstance(x, pymaid.CatmaidNeuronList):
+            if len(x) > 1:
+                raise ValueError('Need to pass a SINGLE CatmaidNeuron')
+            else:
+                x = x[0]
+
+    valid_progs = ['fdp','dot','neato'] + NATIVE_PROGS
     if prog not in valid_progs:
         raise ValueError('Unknown program parameter!')
 
-    # Save start time
-    start = time.time()
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    # Time, memory & counters of every stage are recorded (see Skeleton_Data/instrument.py)
 
     # Reroot neuron to soma if necessary
-    if x.root != x.soma:
-        x.reroot(x.soma)
+    with stage('reroot'):
+        if x.root != x.soma:
+            x.reroot(x.soma)
 
     # This is only relevant if we use the 'neato' layout as it preserves segment lengths
-    if 'parent_dist' not in x.nodes:
-        x = pymaid.calc_cable(x, return_skdata=True)
-
-    # Generate and populate networkX graph representation of the neuron
-    g=nx.DiGraph()
-    g.add_nodes_from( x.nodes.treenode_id.values )
-    for e in x.nodes[['treenode_id','parent_id','parent_dist']].values:
-        #Skip root node
-        if e[1]==None:
-            continue
-        g.add_edge(e[0],e[1],len=e[2])
+    with stage('calc_cable'):
+        # A Skeleton always has parent_dist; x.nodes would build its node table
+        if not isinstance(x, Skeleton) and 'parent_dist' not in x.nodes:
+            import pymaid
+            x = pymaid.calc_cable(x, return_skdata=True)
+
+    # A Skeleton is used as is, so its arrays never have to go through a node table
+    tree = x if isinstance(x, Skeleton) else x.nodes
+
+    count(nodes=len(tree.treenode_id), connectors=len(x.connectors))
+
+    # Electrotonic lengths & attenuation of every treenode, in the order of tree
+    lengths, att = None, None
+    if electrotonic is True:
+        from Electrotonic_Properties.electrotonic_distance import electrotonic_distances
+        with stage('electrotonic'):
+            electrotonic = electrotonic_distances(x, cache=cache)
+    if electrotonic is not None and electrotonic is not False:
+        et = electrotonic.reindex(np.asarray(tree.treenode_id).astype(np.int64))
+        if et.electrotonic_length.isnull().any():
+            raise ValueError('electrotonic does not cover all treenodes of the neuron')
+        lengths, att = et.electrotonic_length.values, et.attenuation.values
 
     # Calculate layout
-    print('Calculating node positions...')
-    pos = nx.nx_agraph.graphviz_layout(g, prog=prog)
+    progress('Calculating node positions...')
+    if prog in NATIVE_PROGS:
+        layout = lambda: tree_layout(tree, prog=prog, lengths=lengths)
+    else:
+        edges = x.nodes[['treenode_id','parent_id','parent_dist']]
+        if lengths is not None:
+            # Electrotonic lengths, scaled to the mean cable length (graphviz only sees their ratios)
+            edges = edges.assign(parent_dist=lengths * edges.parent_dist.mean() / max(lengths.mean(), 1e-12))
+
+        if n_cores is not None:
+            # Subtrees are laid out by graphviz in parallel, so no graph of the whole neuron is built
+            layout = lambda: parallel_graphviz_layout(edges, prog=prog, n_cores=n_cores)
+        else:
+            # Generate and populate networkX graph representation of the neuron (only graphviz needs it)
+            import networkx as nx
+            with stage('graph_build'):
+                g=nx.DiGraph()
+                g.add_nodes_from( x.nodes.treenode_id.values )
+                for e in edges.values:
+                    #Skip root node
+                    if e[1]==None:
+                        continue
+                    g.add_edge(e[0],e[1],len=e[2])
+
+            layout = lambda: nx.nx_agraph.graphviz_layout(g, prog=prog)
+
+    with stage('layout'):
+        if cache is None:
+            pos = layout()
+        else:
+            update = None
+            key = prog if n_cores is None or prog in NATIVE_PROGS else '{} parallel'.format(prog)
+            if lengths is not None:
+                # Electrotonic layouts depend on Rm, Ri & the radii, so they are cached by their lengths
+                key = '{} electrotonic {}'.format(key, hashlib.sha1(np.round(lengths, 9).tobytes()).hexdigest()[:16])
+            elif incremental and prog not in NATIVE_PROGS:
+                update = lambda old_nodes, old_pos: update_layout(old_nodes, old_pos, x.nodes,
+                                                                  lambda nodes: graphviz_layout(nodes, prog=prog))
+            pos = cached_layout(x.nodes, x.skeleton_id, cache, key, layout, update=update)
     
     
     # Plot tree with above layout
-    print('Plotting tree...')
-    nx.draw(g, pos, node_size=0, arrows=False, width = 0.1)
-
-    #Add soma
-    plt.scatter([pos[x.soma][0]], [pos[x.soma][1]], s=40, c=(0,0,0), zorder=1 )
-
-    print('Plotting connectors...')
-    if plot_connectors:
-        plt.scatter(  
-                    [ pos[tn][0] for tn in x.connectors[x.connectors.relation==0].treenode_id.values ],
-                    [ pos[tn][1] for tn in x.connectors[x.connectors.relation==0].treenode_id.values ],
-                    c=(.0,.6,.2),
-                    zorder=2,
-                    s=0.1)
-
-        plt.scatter(  
-                    [ pos[tn][0] for tn in x.connectors[x.connectors.relation==1].treenode_id.values ],
-                    [ pos[tn][1] for tn in x.connectors[x.connectors.relation==1].treenode_id.values ],
-                    c=(.0,.2,1.0),
-                    zorder=2,
-                    s=0.1)
-
-    if highlight_connectors != None:
-        hl_cn_coords = np.array([ pos[tn] for tn in x.connectors[ x.connectors.connector_id.isin( highlight_connectors ) ].treenode_id ])
-        plt.scatter( hl_cn_coords[:,0], hl_cn_coords[:,1], s = 1, c=(0.8,0.0,0.2), zorder = 3 )       
-
-
-    print('Done in %is' % int( time.time()-start ))
-    
-
-
-#For the diagrams used in Felsenberg et al., 2018, we used the neato algorithm. For more information 
-#on neato vs dot vs fdp, see https://www.graphviz.org/
-
-#For large neurons, note that the neato algorithm will rarely produce the same layout - a certain number
-#of configurations exist within the plotting space and each iteration of the algorithm restarts the configuration.
+    progress('Plotting tree...')
+    with stage('plot_tree'):
+        # All edges (child -> parent) as one LineCollection
+        parent = tree_arrays(tree)[0]
+        ix = ps.Index(list(pos.keys())).get_indexer(np.asarray(tree.treenode_id))
+        node_xy = np.array(list(pos.values()))[ix]
+        child = np.flatnonzero(parent >= 0)
+        ax = plt.gca()
+        segments = np.stack((node_xy[child], node_xy[parent[child]]), axis=1)
+        if att is None:
+            ax.add_collection(LineCollection(segments, linewidths=0.1, colors='k'))
+        else:
+            # Every edge in the colour of the attenuation from its child treenode to the soma
+            lines = LineCollection(segments, linewidths=0.3, cmap=ATTENUATION_CMAP, zorder=0)
+            lines.set_array(att[child])
+            lines.set_clim(0, 1)
+            ax.add_collection(lines)
+            plt.colorbar(lines, ax=ax, shrink=0.5, label='Attenuation to soma')
+        ax.autoscale_view()
+        ax.set_axis_off()
+
+        #Add soma
+        plt.scatter([pos[x.soma][0]], [pos[x.soma][1]], s=40, c=(0,0,0), zorder=1 )
+
+    progress('Plotting connectors...')
+    with stage('plot_connectors'):
+        if plot_connectors and att is not None:
+            # Connectors in the colour of the attenuation from their treenode: presynapses ^, postsynapses o
+            rows = ps.Index(np.asarray(tree.treenode_id)).get_indexer(x.connectors.treenode_id.values)
+            for relation, marker in ((0, '^'), (1, 'o')):
+                r = rows[x.connectors.relation.values == relation]
+                plt.scatter(node_xy[r,0], node_xy[r,1], c=att[r], cmap=ATTENUATION_CMAP, vmin=0, vmax=1,
+                            marker=marker, zorder=2, s=0.5)
+
+        elif plot_connectors:
+            plt.scatter(  
+                        [ pos[tn][0] for tn in x.connectors[x.connectors.relation==0].treenode_id.values ],
+                        [ pos[tn][1] for tn in x.connectors[x.connectors.relation==0].treenode_id.values ],
+                        c=(.0,.6,.2),
+                        zorder=2,
+                        s=0.1)
+
+            plt.scatter(  
+                        [ pos[tn][0] for tn in x.connectors[x.connectors.relation==1].treenode_id.values ],
+                        [ pos[tn][1] for tn in x.connectors[x.connectors.relation==1].treenode_id.values ],
+                        c=(.0,.2,1.0),
+                        zorder=2,
+                        s=0.1)
+
+        if highlight_connectors is not None:
+            hl_cn_coords = np.array([ pos[tn] for tn in x.connectors[ x.connectors.connector_id.isin( highlight_connectors ) ].treenode_id ]).reshape(-1, 2)
+            plt.scatter( hl_cn_coords[:,0], hl_cn_coords[:,1], s = 1, c=(0.8,0.0,0.2), zorder = 3 )       
+
+    if in_volume is not None:
+        progress('Plotting treenodes in volumes...')
+        with stage('volumes'):
+            inside = in_volumes(tree, in_volume, cache=cache)
+            for i, name in enumerate(inside.columns):
+                xy = node_xy[inside[name].values]
+                plt.scatter( xy[:,0], xy[:,1], s = 0.5, c=VOLUME_COLORS[i % len(VOLUME_COLORS)], zorder = 2, label = name )
+
+
+
+if __name__ == '__main__':
+
+    #A requirement of this code is access to CATMAID.
+    #This is for API access to the CATMAID servers and to download skeleton information.
+    #The server & credentials are read from the environment, so they never have to be written into this file:
+    #CATMAID_SERVER, CATMAID_HTTP_USER, CATMAID_HTTP_PW & CATMAID_TOKEN (see Skeleton_Data/fetch.py)
+    #
+    #    $ python -m Dendrogram_code.Plot_nx <Neuron_1 skeleton ID> <Neuron_2 skeleton ID> [output.svg]
+    #
+    #To render many neurons at once, see batch_render.py
+
+    import pymaid
+    import matplotlib.pyplot as plt
+
+    from Skeleton_Data.fetch import catmaid_instance
+    from Skeleton_Data.instrument import log_to_console
+
+    log_to_console()
+    catmaid_instance()
+
+    if len(sys.argv) < 3:
+        raise SystemExit('Usage: python -m Dendrogram_code.Plot_nx NEURON_1_SKID NEURON_2_SKID [OUTPUT]')
+
+    #This is an integer number that is unique to your neuron of interest
+    Neuron_1_skeleton_id_number = int(sys.argv[1])
+    Neuron_1 = pymaid.get_neuron(Neuron_1_skeleton_id_number)
+
+    Neuron_2_skeleton_id_number = int(sys.argv[2])
+    Neuron_2 = pymaid.get_neuron(Neuron_2_skeleton_id_number)
+
+    output = sys.argv[3] if len(sys.argv) > 3 else 'Neuron_2_with_Neuron_1_connectors.svg'
+
+    #This function downsamples the neuron - it removes large stretches of skeleton that do not have any branch points.
+    #When the argument preserve_cn_treenodes = True, this preserves the treenodes where connectors (pre/postsynapses)
+    #have been placed. Downsampling is used to reduce the computational time, as some 3D reconstructed neurons can become 
+    #very large. 
+    Neuron_1.downsample(1000000, preserve_cn_treenodes = True) 
+    Neuron_2.downsample(1000000, preserve_cn_treenodes = True)
+
+
+    #Get the connectors between the two neurons of interest
+    #When True, the directional argument will return the connectors (pre and post synapses)
+    #from neuron A to neuron B (A-->B; in this case Neuron_1 to Neuron_2). When False, it will return all
+    #connectors between neuron A to neuron B (A<-->B; in this case, all connectors between Neuron_1 to Neuron_2)
+
+    Neuron_1_to_Neuron_2 = pymaid.get_connectors_between(Neuron_1,Neuron_2, directional = True)
+
+
+    #For the diagrams used in Felsenberg et al., 2018, we used the neato algorithm. For more information 
+    #on neato vs dot vs fdp, see https://www.graphviz.org/
+
+    #For large neurons, note that the neato algorithm will rarely produce the same layout - a certain number
+    #of configurations exist within the plotting space and each iteration of the algorithm restarts the configuration.
 
-plot_nx(Neuron_2, plot_connectors = True, highlight_connectors = Neuron_1_to_Neuron_2, prog = 'neato')
-plt.savefig('Neuron_2_with_Neuron_1_connectors.svg') 
+    plot_nx(Neuron_2, plot_connectors = True, highlight_connectors = Neuron_1_to_Neuron_2.connector_id.values, prog = 'neato')
+    plt.savefig(output)
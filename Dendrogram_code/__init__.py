@@ -0,0 +1,8 @@
+#Dendrogram code - see README.md in this folder.
+#
+#Importing the package is cheap: matplotlib, plotly, networkx/graphviz & pymaid are only
+#imported once a dendrogram is drawn with the layout & output that need them.
+
+from .Plot_nx import plot_nx
+from .tree_layout import NATIVE_PROGS
+from .Interactive_Dendrograms import plotly_plot_nx
@@ -0,0 +1,340 @@
+#Rendering the dendrograms of many neurons without a screen, e.g. to regenerate the
+#figures of a paper overnight:
+#
+#    $ python -m Dendrogram_code.batch_render 16 57311 --prog neato --format svg --out figures --n-cores 8
+#    $ python -m Dendrogram_code.batch_render --skids skids.txt --volumes MB_CA_R MB_PED_R --format png
+#
+#Skeletons are downloaded concurrently in the main process (see Skeleton_Data/fetch.py) and
+#rendered in a pool of worker processes, with matplotlib's non-interactive Agg backend
+#(svg, png & pdf, via plot_nx) or as plotly html files (via plotly_plot_nx). Volume meshes
+#are fetched once and handed to every worker. Every finished neuron is appended to
+#manifest.csv in the output folder (file, status, time taken, error), so an interrupted run
+#can be resumed with --skip-existing.
+#
+#The CATMAID server & credentials are read from CATMAID_SERVER, CATMAID_HTTP_USER,
+#CATMAID_HTTP_PW and CATMAID_TOKEN.
+
+import os
+import csv
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.instrument import collect, emit, progress, logger, log_to_console
+
+FORMATS = ['svg', 'png', 'pdf', 'html']
+
+MANIFEST_COLUMNS = ['skeleton_id', 'neuron_name', 'file', 'format', 'prog', 'n_nodes', 'n_highlighted',
+                    'seconds', 'status', 'error']
+
+#Set in every worker by _init_worker
+_WORKER = {}
+
+
+def output_file(out, skeleton_id, prog, fmt):
+    """ Where the figure of a neuron is written """
+    return os.path.join(out, '{}_{}.{}'.format(int(skeleton_id), prog, fmt))
+
+
+def render_neuron(x, path, fmt = 'svg', prog = 'dot', highlight_connectors = None, in_volume = None, cache = None,
+                  render = 'svg', dpi = 300, figsize = (10, 10)):
+    """ Renders the dendrogram of one neuron to a file, without a screen.
+
+    Parameters
+    ----------
+    x :                     CatmaidNeuron | Skeleton
+    path :                  str
+                            Output file. It only appears once it is complete
+    fmt :                   {'svg','png','pdf','html'}
+                            'html' makes an interactive plotly figure (plotly_plot_nx),
+                            the others a matplotlib figure (plot_nx)
+    prog :                  str
+                            Layout, see plot_nx
+    highlight_connectors :  list of int, optional
+    in_volume :             str | VolumeMesh | list of these, optional
+    cache :                 SkeletonCache, optional
+    render :                {'svg','webgl'}
+                            Only for html, see plotly_plot_nx
+    dpi :                   int
+                            Only for png
+    figsize :               tuple
+                            Size of matplotlib figures (inches)
+    """
+
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format!')
+
+    folder, name = os.path.split(path)
+    tmp = os.path.join(folder, '.{}.{}.tmp.{}'.format(name, os.getpid(), fmt))
+
+    if fmt == 'html':
+        from Dendrogram_code.Interactive_Dendrograms.plot_nx_plotly import plotly_plot_nx
+
+        plotly_plot_nx(x, highlight_connectors = highlight_connectors, in_volume = in_volume, prog = prog,
+                       inscreen = False, filename = tmp, cache = cache, render = render,
+                       auto_open = False, include_plotlyjs = 'cdn')
+    else:
+        import matplotlib.pyplot as plt
+        from Dendrogram_code.Plot_nx import plot_nx
+
+        fig = plt.figure(figsize = figsize)
+        try:
+            plot_nx(x, plot_connectors = True, highlight_connectors = highlight_connectors, prog = prog,
+                    cache = cache, in_volume = in_volume)
+            fig.savefig(tmp, format = fmt, dpi = dpi, bbox_inches = 'tight')
+        finally:
+            plt.close(fig)
+
+    os.replace(tmp, path)
+
+
+def connectors_from(partners, x):
+    """ connector_ids of the synapses from any of the partner neurons onto x
+    (presynaptic on a partner, postsynaptic on x) """
+
+    pre = np.concatenate([p.connectors[p.connectors.relation == 0].connector_id.values for p in partners])
+    post = x.connectors[x.connectors.relation == 1].connector_id.values
+
+    return np.intersect1d(pre, post)
+
+
+def _init_worker(meshes, cache, fmt):
+    #Workers only load the plotting library of their format: plotly for html, matplotlib otherwise
+    if fmt != 'html':
+        import matplotlib
+        matplotlib.use('Agg')
+
+    _WORKER['meshes'] = meshes
+    _WORKER['cache'] = cache
+
+
+def _render_task(x, path, fmt, prog, highlight_connectors, downsample_factor, render, dpi):
+    """ Worker: renders one neuron and returns its manifest row, and the stage
+    timings of plot_nx (see Skeleton_Data/instrument.py) for the main process to emit """
+
+    start = time.time()
+    row = {'skeleton_id':int(x.skeleton_id), 'neuron_name':getattr(x, 'neuron_name', ''), 'file':path,
+           'format':fmt, 'prog':prog, 'n_nodes':len(x.nodes),
+           'n_highlighted':0 if highlight_connectors is None else len(highlight_connectors),
+           'status':'ok', 'error':''}
+
+    try:
+        if downsample_factor:
+            x.downsample(downsample_factor, preserve_cn_treenodes = True)
+
+        with collect() as runs:
+            render_neuron(x, path, fmt = fmt, prog = prog, highlight_connectors = highlight_connectors,
+                          in_volume = _WORKER['meshes'], cache = _WORKER['cache'], render = render, dpi = dpi)
+    except Exception as e:
+        runs = []
+        row['status'] = 'failed'
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    row['seconds'] = round(time.time() - start, 2)
+
+    return row, runs
+
+
+def batch_render(skeleton_ids, out, fmt = 'svg', prog = 'dot', highlight_connectors = None, highlight_from = None,
+                 volumes = None, n_cores = None, downsample_factor = None, cache = None, fetcher = None,
+                 skip_existing = False, errors = 'skip', render = 'svg', dpi = 300):
+    """ Renders the dendrograms of many neurons into a folder, in parallel and
+    without a screen, and records them in out/manifest.csv.
+
+    Parameters
+    ----------
+    skeleton_ids :          list of int | CatmaidNeuronList
+    out :                   str
+                            Output folder, created if necessary
+    fmt :                   {'svg','png','pdf','html'}
+    prog :                  str
+                            Layout, see plot_nx
+    highlight_connectors :  list of int, optional
+                            connector_ids highlighted in every neuron they are on
+    highlight_from :        list of int, optional
+                            Skeleton IDs of partner neurons: their synapses onto each
+                            rendered neuron are highlighted
+    volumes :               list of str, optional
+                            Mark the treenodes inside these CATMAID volumes
+    n_cores :               int, optional
+                            Number of worker processes. Defaults to all cores
+    downsample_factor :     int, optional
+                            Downsample every neuron first (keeping connector treenodes);
+                            recommended for graphviz layouts
+    cache :                 SkeletonCache, optional
+                            Reuse layouts & volume meshes across runs
+    fetcher :               CatmaidFetcher, optional
+                            Downloads skeletons concurrently. Defaults to one using pymaid's
+                            CATMAID connection
+    skip_existing :         bool
+                            Skip neurons whose output file already exists
+    errors :                {'skip','raise'}
+                            'skip' records failed neurons in the manifest and carries on
+    render, dpi :           See render_neuron
+
+    Returns
+    -------
+    pandas.DataFrame
+                            Manifest rows of this run
+
+    Examples
+    --------
+    >>> manifest = batch_render(skids, 'figures', fmt = 'png', prog = 'tree', n_cores = 8)
+    >>> manifest[manifest.status != 'ok']
+    """
+
+    import pymaid
+    from Skeleton_Data.fetch import CatmaidFetcher
+    from Skeleton_Data.volumes import get_volume
+
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format!')
+
+    if errors not in ['skip', 'raise']:
+        raise ValueError('errors must be "skip" or "raise"')
+
+    if n_cores is None:
+        n_cores = os.cpu_count()
+
+    if n_cores < 1:
+        raise ValueError('n_cores must be at least 1')
+
+    os.makedirs(out, exist_ok = True)
+
+    if isinstance(skeleton_ids, pymaid.CatmaidNeuronList):
+        neurons = {int(n.skeleton_id): n for n in skeleton_ids}
+        skids = list(neurons)
+    else:
+        neurons = None
+        skids = [int(s) for s in skeleton_ids]
+
+    if skip_existing:
+        done = [s for s in skids if os.path.exists(output_file(out, s, prog, fmt))]
+        skids = [s for s in skids if s not in set(done)]
+        progress('Skipping %i neurons that were already rendered', len(done))
+
+    if not skids:
+        return ps.DataFrame(columns = MANIFEST_COLUMNS)
+
+    if neurons is not None:
+        neurons = iter([neurons[s] for s in skids])
+    else:
+        if fetcher is None:
+            fetcher = CatmaidFetcher.from_pymaid(max_workers = 8)
+        neurons = fetcher.iter_neurons(skids, errors = errors)
+
+    meshes = None
+    if volumes:
+        progress('Fetching %i volumes...', len(volumes))
+        meshes = [get_volume(v, cache = cache) for v in volumes]
+
+    partners = []
+    if highlight_from:
+        partners = list(fetcher.iter_neurons(highlight_from)) if fetcher is not None else list(pymaid.get_neuron(highlight_from))
+
+    manifest = os.path.join(out, 'manifest.csv')
+    new_manifest = not os.path.exists(manifest)
+
+    progress('Rendering %i neurons on %i cores...', len(skids), n_cores)
+
+    rows = []
+
+    with open(manifest, 'a', newline = '') as f, \
+         ProcessPoolExecutor(max_workers = n_cores, initializer = _init_worker, initargs = (meshes, cache, fmt)) as pool:
+
+        writer = csv.DictWriter(f, fieldnames = MANIFEST_COLUMNS)
+        if new_manifest:
+            writer.writeheader()
+
+        running = set()
+        neuron = next(neurons, None)
+
+        while neuron is not None or running:
+
+            #At most two neurons per worker are held in memory at once
+            while neuron is not None and len(running) < 2 * n_cores:
+                hl = None
+                if highlight_connectors is not None or partners:
+                    hl = list(highlight_connectors or [])
+                    if partners:
+                        hl += connectors_from(partners, neuron).tolist()
+
+                running.add(pool.submit(_render_task, neuron, output_file(out, neuron.skeleton_id, prog, fmt), fmt,
+                                        prog, hl, downsample_factor, render, dpi))
+                neuron = next(neurons, None)
+
+            done, running = wait(running, return_when = FIRST_COMPLETED)
+
+            for future in done:
+                row, runs = future.result()
+                for run in runs:
+                    emit(run)
+                writer.writerow(row)
+                f.flush()
+                rows.append(row)
+
+                if row['status'] != 'ok':
+                    logger.warning('Failed to render %s: %s', row['skeleton_id'], row['error'])
+                    if errors == 'raise':
+                        for r in running:
+                            r.cancel()
+                        raise RuntimeError('Failed to render {}: {}'.format(row['skeleton_id'], row['error']))
+
+    rows = ps.DataFrame(rows, columns = MANIFEST_COLUMNS)
+
+    progress('Rendered %i of %i neurons into %s', int((rows.status == 'ok').sum()), len(rows), out)
+
+    return rows
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Render the dendrograms of many neurons without a screen')
+    parser.add_argument('skeleton_ids', type = int, nargs = '*')
+    parser.add_argument('--skids', help = 'File with one skeleton ID per line')
+    parser.add_argument('--out', default = 'dendrograms', help = 'Output folder')
+    parser.add_argument('--format', default = 'svg', choices = FORMATS)
+    parser.add_argument('--prog', default = 'dot', choices = ['dot', 'neato', 'fdp', 'tree', 'radial'])
+    parser.add_argument('--render', default = 'svg', choices = ['svg', 'webgl'], help = 'Plotly renderer for html')
+    parser.add_argument('--highlight-connectors', type = int, nargs = '+', help = 'connector_ids to highlight')
+    parser.add_argument('--highlight-from', type = int, nargs = '+',
+                        help = 'Skeleton IDs of partners whose synapses onto each neuron are highlighted')
+    parser.add_argument('--volumes', nargs = '+', help = 'Names of CATMAID volumes to mark')
+    parser.add_argument('--downsample', type = int, help = 'Downsampling factor, e.g. 1000000 for graphviz layouts')
+    parser.add_argument('--n-cores', type = int)
+    parser.add_argument('--fetch-workers', type = int, default = 8, help = 'Concurrent downloads')
+    parser.add_argument('--cache', help = 'Folder of a SkeletonCache for layouts & volumes')
+    parser.add_argument('--dpi', type = int, default = 300)
+    parser.add_argument('--skip-existing', action = 'store_true', help = 'Resume an interrupted run')
+    parser.add_argument('--errors', default = 'skip', choices = ['skip', 'raise'])
+    args = parser.parse_args(argv)
+
+    from Skeleton_Data.fetch import catmaid_instance, CatmaidFetcher
+    from Skeleton_Data.cache import SkeletonCache
+
+    skids = list(args.skeleton_ids)
+    if args.skids:
+        with open(args.skids) as f:
+            skids += [int(l) for l in f.read().split()]
+
+    if not skids:
+        parser.error('No skeleton IDs given')
+
+    log_to_console()
+    remote_instance = catmaid_instance()
+    cache = SkeletonCache(args.cache) if args.cache else None
+
+    with CatmaidFetcher.from_pymaid(remote_instance, max_workers = args.fetch_workers) as fetcher:
+        manifest = batch_render(skids, args.out, fmt = args.format, prog = args.prog,
+                                highlight_connectors = args.highlight_connectors, highlight_from = args.highlight_from,
+                                volumes = args.volumes, n_cores = args.n_cores, downsample_factor = args.downsample,
+                                cache = cache, fetcher = fetcher, skip_existing = args.skip_existing,
+                                errors = args.errors, render = args.render, dpi = args.dpi)
+
+    return 0 if (manifest.status == 'ok').all() else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
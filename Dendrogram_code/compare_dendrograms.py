@@ -0,0 +1,210 @@
+#Dendrograms of one target neuron highlighting the connectors of many input neurons.
+#
+#The layout of the target is calculated once and reused for every input neuron, and the
+#connectors between all input neurons and the target are fetched with a single query.
+#pymaid, matplotlib & networkx are imported by the functions that use them.
+
+import math
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import parent_index
+from Skeleton_Data.cache import cached_layout
+from Skeleton_Data.instrument import progress
+from Dendrogram_code.tree_layout import tree_layout, NATIVE_PROGS
+from Dendrogram_code.incremental_layout import graphviz_layout
+
+
+def partner_connectors(target, partners, directional = True):
+    """ Connectors between many input neurons and a target neuron, fetched
+    in a single query.
+
+    Parameters
+    ----------
+    target :        CatmaidNeuron
+    partners :      CatmaidNeuronList | list of skeleton IDs
+    directional :   bool
+                    If True, only connectors from the partners onto the target
+                    (partner --> target). If False, connectors in both directions
+
+    Returns
+    -------
+    pandas.DataFrame
+                    connector_id & skeleton_id of the partner
+    """
+
+    import pymaid
+
+    if isinstance(partners, (pymaid.CatmaidNeuron, pymaid.CatmaidNeuronList)):
+        skids = [int(s) for s in pymaid.CatmaidNeuronList(partners).skeleton_id]
+    else:
+        skids = [int(s) for s in partners]
+
+    target_skid = int(target.skeleton_id)
+
+    cn = pymaid.get_connectors_between(skids, target_skid, directional = directional)
+
+    if cn.empty:
+        return ps.DataFrame({'connector_id':[], 'skeleton_id':[]}, dtype = np.int64)
+
+    src = cn.source_neuron.astype(np.int64).values
+    tgt = cn.target_neuron.astype(np.int64).values
+
+    #For non-directional queries the partner can be on either side
+    partner = np.where(src == target_skid, tgt, src)
+
+    return ps.DataFrame({'connector_id':cn.connector_id.astype(np.int64).values,
+                         'skeleton_id':partner}).drop_duplicates()
+
+
+def target_layout(x, prog = 'tree', cache = None):
+    """ Layout of a neuron rerooted to its soma, as used by plot_nx.
+
+    Returns
+    -------
+    numpy.ndarray
+                    (N, 2) positions, in the same order as x.nodes
+    """
+
+    if x.root != x.soma:
+        x.reroot(x.soma)
+
+    if prog in NATIVE_PROGS:
+        layout = lambda: tree_layout(x.nodes, prog = prog)
+    else:
+        if 'parent_dist' not in x.nodes:
+            import pymaid
+            x = pymaid.calc_cable(x, return_skdata = True)
+
+        layout = lambda: graphviz_layout(x.nodes, prog = prog)
+
+    if cache is None:
+        pos = layout()
+    else:
+        pos = cached_layout(x.nodes, x.skeleton_id, cache, prog, layout)
+
+    return np.array([pos[tn] for tn in x.nodes.treenode_id.values], dtype = np.float64)
+
+
+def _draw_tree(ax, xy, parent, soma_xy):
+    from matplotlib.collections import LineCollection
+
+    child = np.flatnonzero(parent >= 0)
+    lines = np.stack((xy[child], xy[parent[child]]), axis = 1)
+
+    ax.add_collection(LineCollection(lines, linewidths = 0.1, colors = 'k'))
+    ax.scatter([soma_xy[0]], [soma_xy[1]], s = 40, c = [(0, 0, 0)], zorder = 1)
+    ax.autoscale_view()
+    ax.set_axis_off()
+
+
+def dendrogram_comparison(x, partners, connectors = None, prog = 'tree', overlay = False,
+                          ncols = 5, colors = None, plot_connectors = False, cache = None):
+    """ Plots the dendrogram of a target neuron once per input neuron (small
+    multiples), highlighting where each input neuron connects to it.
+
+    Parameters
+    ----------
+    x :                 CatmaidNeuron
+                        Target neuron
+    partners :          CatmaidNeuronList | list of skeleton IDs
+                        Input neurons
+    connectors :        pandas.DataFrame, optional
+                        connector_id & skeleton_id of the partner, see partner_connectors().
+                        Fetched with a single query if not given
+    prog :              {'tree','radial','dot','neato','fdp'}
+                        Layout, calculated once for the target
+    overlay :           bool
+                        If True, all input neurons are plotted onto a single dendrogram,
+                        each in a different colour
+    ncols :             int
+                        Number of columns of the small multiples grid
+    colors :            list, optional
+                        One matplotlib colour per input neuron
+    plot_connectors :   bool
+                        If True, all pre (green) and postsynapses (blue) of the target are
+                        plotted as well
+    cache :             SkeletonCache, optional
+                        Reuse the layout from disk
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+
+    Examples
+    --------
+    >>> x = pymaid.get_neuron(NOI)
+    >>> inputs = pymaid.get_partners(x).query('relation == "upstream"').skeleton_id.astype(int).values[:50]
+    >>> fig = dendrogram_comparison(x, inputs, prog = 'tree')
+    >>> fig.savefig('inputs_onto_NOI.svg')
+    """
+
+    import pymaid
+    import matplotlib.pyplot as plt
+
+    if isinstance(x, pymaid.CatmaidNeuronList):
+        if len(x) > 1:
+            raise ValueError('Need to pass a SINGLE CatmaidNeuron')
+        x = x[0]
+
+    if isinstance(partners, (pymaid.CatmaidNeuron, pymaid.CatmaidNeuronList)):
+        skids = [int(s) for s in pymaid.CatmaidNeuronList(partners).skeleton_id]
+    else:
+        skids = [int(s) for s in partners]
+
+    if connectors is None:
+        progress('Fetching connectors of %i input neurons...', len(skids))
+        connectors = partner_connectors(x, skids)
+
+    progress('Calculating node positions...')
+    xy = target_layout(x, prog = prog, cache = cache)
+
+    parent = parent_index(x.nodes)
+    row = ps.Index(x.nodes.treenode_id.values.astype(np.int64))
+    soma_xy = xy[row.get_loc(int(x.soma))]
+
+    #connector_id -> position of the target's treenode, for all connectors at once
+    cn = x.connectors[['connector_id','treenode_id','relation']].copy()
+    cn['row'] = row.get_indexer(cn.treenode_id.values.astype(np.int64))
+    cn = cn[cn.row >= 0]
+
+    hits = connectors.merge(cn[['connector_id','row']], on = 'connector_id')
+    by_partner = dict(list(hits.groupby('skeleton_id').row))
+
+    if colors is None:
+        cmap = plt.get_cmap('tab20')
+        colors = [cmap(i % 20) for i in range(len(skids))]
+
+    def _connectors(ax):
+        if plot_connectors:
+            for rel, c in ((0, (.0, .6, .2)), (1, (.0, .2, 1.0))):
+                r = cn.row.values[cn.relation.values == rel]
+                ax.scatter(xy[r, 0], xy[r, 1], c = [c], zorder = 2, s = 0.1)
+
+    progress('Plotting...')
+
+    if overlay:
+        fig, ax = plt.subplots(figsize = (10, 10))
+        _draw_tree(ax, xy, parent, soma_xy)
+        _connectors(ax)
+        for skid, c in zip(skids, colors):
+            r = by_partner.get(skid, ps.Series([], dtype = np.int64)).values
+            ax.scatter(xy[r, 0], xy[r, 1], s = 4, c = [c], zorder = 3, label = str(skid))
+        ax.legend(fontsize = 6, markerscale = 2, loc = 'upper right')
+        return fig
+
+    nrows = max(1, math.ceil(len(skids) / ncols))
+    fig, axes = plt.subplots(nrows, ncols, figsize = (3 * ncols, 3 * nrows), squeeze = False)
+
+    for ax in axes.ravel()[len(skids):]:
+        ax.set_axis_off()
+
+    for ax, skid, c in zip(axes.ravel(), skids, colors):
+        _draw_tree(ax, xy, parent, soma_xy)
+        _connectors(ax)
+        r = by_partner.get(skid, ps.Series([], dtype = np.int64)).values
+        ax.scatter(xy[r, 0], xy[r, 1], s = 2, c = [c], zorder = 3)
+        ax.set_title('{} ({} connectors)'.format(skid, len(r)), fontsize = 8)
+
+    return fig
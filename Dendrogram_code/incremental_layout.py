@@ -0,0 +1,118 @@
+#Updating a dendrogram layout after a neuron has been edited.
+#
+#graphviz layouts of large neurons take minutes. When a neuron has only been extended or
+#corrected in a few places, the treenodes whose connection to their parent did not change
+#keep their previous positions. The changed treenodes are grouped by the first unchanged
+#treenode above them (where they attach to the old tree); each group is laid out on its own
+#together with its attachment point, and moved so that the attachment point stays where it
+#was. The work is proportional to the size of the edits, not of the neuron.
+#
+#Patched-in parts may overlap the rest of the dendrogram; a layout from scratch (no cache,
+#or incremental = False) tidies this up. The native 'tree' & 'radial' layouts are fast
+#enough to always be recomputed.
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.diff import changed_edges
+from Skeleton_Data.skeleton import tree_arrays
+from Skeleton_Data.instrument import progress
+
+
+def graphviz_layout(nodes, prog = 'dot'):
+    """ graphviz layout of a node table, as in plot_nx
+
+    Returns
+    -------
+    dict
+                {treenode_id: (x, y)}
+    """
+
+    import networkx as nx
+
+    g = nx.DiGraph()
+    g.add_nodes_from(nodes.treenode_id.values)
+    for e in nodes[['treenode_id','parent_id','parent_dist']].values:
+        #Skip root node
+        if e[1] is None or e[1] != e[1]:
+            continue
+        g.add_edge(e[0], e[1], len = e[2])
+
+    return nx.nx_agraph.graphviz_layout(g, prog = prog)
+
+
+def attachment_points(parent, changed):
+    """ For every changed node, the row of the first unchanged node above it
+    (-1 if there is none, i.e. the root changed). Unchanged nodes point to
+    themselves. """
+
+    n = len(parent)
+    ptr = np.where(changed, parent, np.arange(n))
+    ptr[changed & (parent < 0)] = -1
+
+    #Pointer jumping until every pointer is an unchanged node (or -1)
+    while True:
+        ok = ptr >= 0
+        nxt = ptr.copy()
+        nxt[ok] = ptr[ptr[ok]]
+        if np.array_equal(nxt, ptr):
+            return ptr
+        ptr = nxt
+
+
+def update_layout(old_nodes, old_pos, new_nodes, layout):
+    """ Updates the layout of a previous version of a neuron.
+
+    Parameters
+    ----------
+    old_nodes :     pandas.DataFrame
+                    Node table the old layout was calculated for
+    old_pos :       dict
+                    {treenode_id: (x, y)}
+    new_nodes :     pandas.DataFrame
+                    Current node table, with parent_dist (see pymaid.calc_cable)
+    layout :        callable
+                    Lays out a node table, e.g. lambda nodes: graphviz_layout(nodes, 'dot')
+
+    Returns
+    -------
+    dict
+                    {treenode_id: (x, y)} for new_nodes
+    """
+
+    ids = new_nodes.treenode_id.values.astype(np.int64)
+    parent = tree_arrays(new_nodes)[0]
+
+    changed = changed_edges(old_nodes, new_nodes)
+
+    #Unchanged treenodes the old layout does not know about are laid out again as well
+    changed |= ~np.isin(ids, np.fromiter(old_pos.keys(), dtype = np.int64, count = len(old_pos)))
+
+    anchor = attachment_points(parent, changed)
+
+    if np.any(anchor[changed] < 0):
+        #The root itself changed
+        progress('Root changed, calculating the layout from scratch...')
+        return layout(new_nodes)
+
+    pos = {tn: old_pos[tn] for tn in ids[~changed].tolist()}
+
+    groups = ps.Series(np.flatnonzero(changed)).groupby(anchor[changed])
+
+    progress('Updating the layout of %i changed treenodes in %i places...', int(changed.sum()), len(groups))
+
+    for a, rows in groups:
+        sub = new_nodes.iloc[np.append(a, rows.values)].copy()
+        sub['parent_id'] = sub.parent_id.astype(object)
+        sub.iloc[0, sub.columns.get_loc('parent_id')] = None
+
+        sub_pos = layout(sub)
+
+        root = int(ids[a])
+        dx = old_pos[root][0] - sub_pos[root][0]
+        dy = old_pos[root][1] - sub_pos[root][1]
+
+        for tn in ids[rows.values].tolist():
+            pos[tn] = (sub_pos[tn][0] + dx, sub_pos[tn][1] + dy)
+
+    return pos
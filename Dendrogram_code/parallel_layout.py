@@ -0,0 +1,259 @@
+#graphviz layouts of huge skeletons on many cores.
+#
+#graphviz lays out a neuron in a single thread, and its time grows faster than the number
+#of treenodes. parallel_graphviz_layout splits the tree (rerooted to the soma) instead: the
+#'backbone' is every treenode with more than max_subtree treenodes in its subtree (the soma,
+#the primary neurite & the major branch points), and every subtree hanging off the backbone
+#is laid out with graphviz on its own, in a pool of worker processes (small subtrees are
+#batched into one task). The sub-layouts are then stitched together around the backbone,
+#which is placed without graphviz, like the native layouts of tree_layout.py:
+#
+#  'dot'          - subtrees side by side in depth-first order, each in a slot as wide as its
+#                   layout; backbone nodes are centred above the subtrees below them, one rank
+#                   apart (rank distance & direction are measured from the sub-layouts)
+#  'neato', 'fdp' - every subtree gets a wedge proportional to the size of its layout, backbone
+#                   nodes are placed at their edge length from their parent along the centre of
+#                   their wedge, and every subtree is turned to point outwards along its wedge
+#
+#Every subtree keeps its graphviz layout; only how the subtrees are arranged differs from a
+#layout of the whole neuron. As with neato itself, neighbouring subtrees can overlap.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Skeleton_Data.tree import parent_index, accumulate_to_root, depth, depth_first_order, subtree_sizes
+from Skeleton_Data.instrument import count, progress
+from Dendrogram_code.incremental_layout import graphviz_layout
+
+GRAPHVIZ_PROGS = ['dot', 'neato', 'fdp']
+
+#Smallest default max_subtree: below this, graphviz is fast enough on its own
+MIN_SUBTREE = 1000
+
+#graphviz positions are in points, edge lengths & separations in inches
+POINTS_PER_INCH = 72
+
+
+def _split(parent, max_subtree):
+    """ Subtree of every treenode (-1 for the backbone), the row of the root
+    (head) of every subtree, both numbered in depth-first order, and the
+    depth-first position & subtree size of every treenode """
+
+    n = len(parent)
+
+    order = depth_first_order(parent)
+    pre = np.empty(n, dtype = np.int64)
+    pre[order] = np.arange(n)
+
+    size = subtree_sizes(parent)
+    backbone = size > max_subtree
+
+    is_head = ~backbone & np.where(parent < 0, True, backbone[np.maximum(parent, 0)])
+
+    head = np.where(is_head | backbone, np.arange(n), parent)
+    while True:
+        nxt = head[head]
+        if np.array_equal(nxt, head):
+            break
+        head = nxt
+
+    heads = order[is_head[order]]
+
+    number = np.full(n, -1, dtype = np.int64)
+    number[heads] = np.arange(len(heads))
+
+    return number[head], heads, pre, size
+
+
+def _tasks(sizes, max_subtree):
+    """ Batches subtrees into tasks of up to max_subtree treenodes, largest
+    subtrees first """
+
+    tasks, total = [], max_subtree
+    for k in np.argsort(-sizes, kind = 'stable').tolist():
+        if total + sizes[k] > max_subtree:
+            tasks.append([])
+            total = 0
+        tasks[-1].append(k)
+        total += sizes[k]
+
+    return tasks
+
+
+def _layout_subtrees(tables, prog):
+    """ Worker: graphviz layout of every node table """
+    return [graphviz_layout(t, prog = prog) for t in tables]
+
+
+def _spans(pre, size, rows, heads):
+    """ First & last subtree below every one of rows """
+    starts = pre[heads]
+    first = np.searchsorted(starts, pre[rows])
+    last = np.searchsorted(starts, pre[rows] + size[rows]) - 1
+    return first, last
+
+
+def _stitch_dot(parent, piece, heads, pre, size, xy):
+    """ 'dot': subtrees side by side, the backbone one rank apart """
+
+    n_pieces = len(heads)
+    inner = np.flatnonzero((piece >= 0) & (parent >= 0) & (piece[np.maximum(parent, 0)] == piece))
+    rank = np.median(xy[inner, 1] - xy[parent[inner], 1]) if len(inner) else POINTS_PER_INCH
+    if rank == 0:
+        rank = POINTS_PER_INCH
+
+    rows = np.flatnonzero(piece >= 0)
+    lo = np.full(n_pieces, np.inf)
+    hi = np.full(n_pieces, -np.inf)
+    np.minimum.at(lo, piece[rows], xy[rows, 0])
+    np.maximum.at(hi, piece[rows], xy[rows, 0])
+
+    width = hi - lo + abs(rank)
+    start = np.cumsum(width) - width
+
+    out = np.empty_like(xy)
+
+    backbone = np.flatnonzero(piece < 0)
+    first, last = _spans(pre, size, backbone, heads)
+    out[backbone, 0] = (start[first] + start[last] + width[last]) / 2
+    out[backbone, 1] = depth(parent)[backbone] * rank
+
+    #The root of every subtree one rank beyond where it is attached
+    dx = start - lo
+    dy = out[parent[heads], 1] + rank - xy[heads, 1]
+    out[rows] = xy[rows] + np.column_stack((dx, dy))[piece[rows]]
+
+    return out
+
+
+def _stitch_radial(parent, lengths, piece, heads, pre, size, xy):
+    """ 'neato' & 'fdp': every subtree in a wedge, backbone edges at their length """
+
+    n_pieces = len(heads)
+    rows = np.flatnonzero(piece >= 0)
+
+    inner = rows[(parent[rows] >= 0) & (lengths[rows] > 0)]
+    inner = inner[piece[np.maximum(parent[inner], 0)] == piece[inner]]
+    unit = POINTS_PER_INCH
+    if len(inner):
+        unit = np.median(np.hypot(*(xy[inner] - xy[parent[inner]]).T) / lengths[inner])
+
+    #Every subtree relative to its root
+    rel = xy[rows] - xy[heads][piece[rows]]
+    extent = np.zeros(n_pieces)
+    np.maximum.at(extent, piece[rows], np.hypot(rel[:, 0], rel[:, 1]))
+    centroid = np.zeros((n_pieces, 2))
+    np.add.at(centroid, piece[rows], rel)
+
+    weight = extent + unit * np.median(lengths[lengths > 0]) if np.any(lengths > 0) else extent + 1
+    end = 2 * np.pi * np.cumsum(weight) / weight.sum()
+    begin = end - 2 * np.pi * weight / weight.sum()
+    theta = (begin + end) / 2
+
+    backbone = np.flatnonzero(piece < 0)
+    first, last = _spans(pre, size, backbone, heads)
+
+    step = np.zeros((len(parent), 2))
+    angle = (begin[first] + end[last]) / 2
+    step[backbone] = unit * lengths[backbone, None] * np.column_stack((np.cos(angle), np.sin(angle)))
+    step[parent < 0] = 0
+
+    out = accumulate_to_root(parent, step)
+
+    #Turn every subtree so that its centroid points along the centre of its wedge
+    turn = theta - np.arctan2(centroid[:, 1], centroid[:, 0])
+    turn[np.all(centroid == 0, axis = 1)] = 0
+    cos, sin = np.cos(turn)[piece[rows]], np.sin(turn)[piece[rows]]
+
+    anchor = out[parent[heads]] + unit * lengths[heads, None] * np.column_stack((np.cos(theta), np.sin(theta)))
+    out[rows] = anchor[piece[rows]] + np.column_stack((cos * rel[:, 0] - sin * rel[:, 1],
+                                                       sin * rel[:, 0] + cos * rel[:, 1]))
+
+    return out
+
+
+def parallel_graphviz_layout(nodes, prog = 'dot', n_cores = None, max_subtree = None):
+    """ graphviz layout of a node table, with its subtrees laid out in parallel
+    and stitched together (see top of this file).
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame
+                    Node table rerooted to the soma, with parent_dist (the edge
+                    lengths, as in plot_nx)
+    prog :          {'dot','neato','fdp'}
+    n_cores :       int, optional
+                    Number of worker processes. Defaults to all cores
+    max_subtree :   int, optional
+                    Largest subtree laid out by graphviz in one go. Defaults to the
+                    number of treenodes / (4 * n_cores), but at least MIN_SUBTREE
+
+    Returns
+    -------
+    dict
+                    {treenode_id: (x, y)}, like graphviz_layout
+
+    Examples
+    --------
+    >>> pos = parallel_graphviz_layout(x.nodes, prog = 'dot', n_cores = 16)
+    """
+
+    if prog not in GRAPHVIZ_PROGS:
+        raise ValueError('Unknown program parameter!')
+
+    if n_cores is None:
+        n_cores = os.cpu_count()
+
+    if n_cores < 1:
+        raise ValueError('n_cores must be at least 1')
+
+    if max_subtree is None:
+        max_subtree = max(len(nodes) // (4 * n_cores), MIN_SUBTREE)
+
+    if len(nodes) <= max_subtree:
+        return graphviz_layout(nodes, prog = prog)
+
+    ids = nodes.treenode_id.values.astype(np.int64)
+    parent = parent_index(nodes)
+    lengths = np.nan_to_num(nodes.parent_dist.values.astype(np.float64))
+
+    piece, heads, pre, size = _split(parent, max_subtree)
+
+    #One node table per subtree in depth-first order, starting at its root (without a parent)
+    rows = np.lexsort((pre, piece))
+    bounds = np.searchsorted(piece[rows], np.arange(len(heads) + 1))
+    edges = nodes[['treenode_id','parent_id','parent_dist']]
+    tables = []
+    for k in range(len(heads)):
+        sub = edges.iloc[rows[bounds[k]:bounds[k + 1]]].copy()
+        sub['parent_id'] = sub.parent_id.astype(object)
+        sub.iloc[0, sub.columns.get_loc('parent_id')] = None
+        tables.append(sub)
+
+    tasks = _tasks(np.diff(bounds), max_subtree)
+
+    count(subtrees = len(heads), backbone = int((piece < 0).sum()))
+    progress('Laying out %i subtrees (%i tasks) on %i cores...', len(heads), len(tasks), n_cores)
+
+    if n_cores == 1:
+        results = [_layout_subtrees([tables[k] for k in task], prog) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers = min(n_cores, len(tasks))) as pool:
+            results = list(pool.map(_layout_subtrees, [[tables[k] for k in task] for task in tasks], [prog] * len(tasks)))
+
+    #Positions of every subtree in its own coordinates
+    xy = np.zeros((len(ids), 2))
+    for task, layouts in zip(tasks, results):
+        for k, pos in zip(task, layouts):
+            sub = rows[bounds[k]:bounds[k + 1]]
+            xy[sub] = [pos[tn] for tn in ids[sub].tolist()]
+
+    progress('Stitching the subtrees together...')
+    if prog == 'dot':
+        xy = _stitch_dot(parent, piece, heads, pre, size, xy)
+    else:
+        xy = _stitch_radial(parent, lengths, piece, heads, pre, size, xy)
+
+    return dict(zip(ids.tolist(), map(tuple, xy.tolist())))
@@ -0,0 +1,120 @@
+#Native layouts for dendrograms, as an alternative to graphviz.
+#
+#A neuron rerooted to its soma is a tree, so it can be laid out directly without a
+#general graph layout engine. Both layouts below work on the parent index array of the
+#neuron (see Skeleton_Data/tree.py), are deterministic and scale linearly with the number
+#of treenodes, so full resolution skeletons do not need to be downsampled.
+#
+#  'tree'   - like graphviz dot: leaves are spaced evenly along x in depth-first order,
+#             every other node is centred above the leaves of its subtree, and y is the
+#             number of treenodes between a node and the soma
+#  'radial' - like graphviz neato: every subtree gets a wedge proportional to its number
+#             of leaves, and each node is placed at the true (geodesic) distance from its
+#             parent along the centre of its wedge, so all cable lengths are preserved
+#
+#Instead of the physical cable lengths, any length per edge can be given, e.g. electrotonic
+#lengths (see Electrotonic_Properties/electrotonic_distance.py): 'radial' then preserves
+#these, and the y axis of 'tree' becomes the summed length to the soma.
+
+import numpy as np
+
+from Skeleton_Data.tree import accumulate_to_root, distance_to_root, depth, child_counts, depth_first_order
+from Skeleton_Data.skeleton import tree_arrays
+
+NATIVE_PROGS = ['tree', 'radial']
+
+
+def _leaf_extent(parent):
+    """ Rank of the first and last leaf (in depth-first order) in the subtree
+    of every node, and the total number of leaves """
+
+    n = len(parent)
+    order = depth_first_order(parent)
+
+    pre = np.empty(n, dtype = np.int64)
+    pre[order] = np.arange(n)
+
+    is_leaf = child_counts(parent) == 0
+
+    #Number of leaves before each position of the depth-first order
+    leaves_before = np.cumsum(is_leaf[order]) - is_leaf[order]
+
+    #A subtree starts at its root, so its first leaf is the first leaf from there on
+    first = leaves_before[pre]
+
+    #... and ends at the leaf reached by always following the last visited child
+    has_parent = np.flatnonzero(parent >= 0)
+    last_child_pre = np.full(n, -1, dtype = np.int64)
+    np.maximum.at(last_child_pre, parent[has_parent], pre[has_parent])
+
+    last_leaf = np.where(is_leaf, np.arange(n), order[np.maximum(last_child_pre, 0)])
+    while True:
+        nxt = last_leaf[last_leaf]
+        if np.array_equal(nxt, last_leaf):
+            break
+        last_leaf = nxt
+
+    last = leaves_before[pre[last_leaf]]
+
+    return first, last, int(is_leaf.sum())
+
+
+def layout_positions(nodes, prog = 'tree', lengths = None):
+    """ Calculates a dendrogram layout for a neuron.
+
+    Parameters
+    ----------
+    nodes :     pandas.DataFrame | Skeleton
+                Node table of a CatmaidNeuron (or a Skeleton), rerooted to the soma
+    prog :      {'tree','radial'}
+                See top of this file
+    lengths :   numpy.ndarray, optional
+                Length of the edge between every node and its parent (0 for the root),
+                in the same order as nodes, used instead of the cable length in µm
+
+    Returns
+    -------
+    numpy.ndarray
+                (N, 2) array of x/y positions, in the same order as nodes.
+                'tree' is in units of leaves/treenodes, 'radial' in µm. With
+                lengths, y of 'tree' and both axes of 'radial' are in their units
+    """
+
+    if prog not in NATIVE_PROGS:
+        raise ValueError('Unknown program parameter!')
+
+    parent, parent_dist = tree_arrays(nodes)
+
+    first, last, n_leaves = _leaf_extent(parent)
+
+    if lengths is not None and len(lengths) != len(parent):
+        raise ValueError('Need one length per node')
+
+    if prog == 'tree':
+        y = depth(parent) if lengths is None else distance_to_root(parent, np.asarray(lengths, dtype = np.float64))
+        return np.column_stack(((first + last) / 2, y)).astype(np.float64)
+
+    if lengths is None:
+        lengths = parent_dist / 1000
+
+    #radial: angle of each node is the centre of its wedge of leaves
+    theta = np.pi * (first + last + 1) / max(n_leaves, 1)
+
+    step = np.asarray(lengths, dtype = np.float64)[:, None] * np.column_stack((np.cos(theta), np.sin(theta)))
+
+    return accumulate_to_root(parent, step)
+
+
+def tree_layout(nodes, prog = 'tree', lengths = None):
+    """ Same as layout_positions() but returns the positions the way
+    networkx/graphviz do.
+
+    Returns
+    -------
+    dict
+                {treenode_id: (x, y)}
+    """
+
+    pos = layout_positions(nodes, prog = prog, lengths = lengths)
+
+    return dict(zip(np.asarray(nodes.treenode_id).tolist(), map(tuple, pos.tolist())))
@@ -0,0 +1 @@
+#Electrotonic properties of CATMAID neurons - see README.md in this folder.
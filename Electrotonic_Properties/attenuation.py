@@ -0,0 +1,202 @@
+#Steady-state attenuation between synapses and the soma.
+#
+#Injecting current at every synapse in turn would need one solve per synapse. Two
+#properties of a passive tree avoid that:
+#
+#  - transfer resistances are symmetric (reciprocity), so the voltage at every node for a
+#    current injected at the soma is the transfer resistance from every node to the soma:
+#    one solve gives the whole synapse -> soma vector
+#  - the input resistance of every node (the diagonal of the inverse of the conductance
+#    matrix) follows from the Hines elimination of PassiveCable in one sweep from the
+#    root to the leaves: Z_ii = 1/d_i + (g_i/d_i)^2 Z_pp, where d_i is the eliminated
+#    diagonal of node i, g_i its axial conductance and p its parent. Like
+#    Skeleton_Data.tree.accumulate_to_root, this is done for all nodes at once by
+#    pointer jumping
+#
+#The attenuation from a synapse to the soma is then transfer / input resistance. Transfer
+#matrices between chosen synapses take one solve per synapse (column).
+#
+#Resistances are in MΩ (mV per nA).
+
+import numpy as np
+import pandas as ps
+
+from Electrotonic_Properties.passive_cable import PassiveCable
+
+
+def input_resistances(cable):
+    """ Input resistance of every compartment, from a single sweep.
+
+    Parameters
+    ----------
+    cable :     PassiveCable
+
+    Returns
+    -------
+    pandas.Series
+                Input resistance (MΩ) indexed by treenode_id
+    """
+
+    lu = cable._factor()
+
+    #Eliminated diagonal of every compartment (LU in Hines ordering without pivoting)
+    d = np.empty(len(cable))
+    d[cable.order] = lu.U.diagonal()
+
+    is_root = cable.parent < 0
+
+    A = 1 / d
+    B = np.where(is_root, 0, (cable.g_axial / d)**2)
+    ptr = np.where(is_root, np.arange(len(cable)), cable.parent)
+
+    #Z_i = A_i + B_i * Z_ptr(i), composed until every node refers to the root
+    while np.any(B > 0):
+        A, B, ptr = A + B * A[ptr], B * B[ptr], ptr[ptr]
+
+    return ps.Series(A, index = cable.treenode_id, name = 'input_resistance (MΩ)')
+
+
+def transfer_resistances(cable, target):
+    """ Transfer resistance between a target treenode and every compartment
+    (i.e. the voltage at the target for 1 nA injected at each compartment),
+    from a single solve.
+
+    Parameters
+    ----------
+    cable :     PassiveCable
+    target :    int
+                treenode_id, e.g. the soma
+
+    Returns
+    -------
+    pandas.Series
+                Transfer resistance (MΩ) indexed by treenode_id
+    """
+
+    v = cable.steady_state(target, amplitude = 1.0)
+    v.name = 'transfer_resistance (MΩ)'
+
+    return v
+
+
+def node_attenuation(cable, target):
+    """ Steady-state attenuation from every compartment to a target treenode,
+    from one solve and one sweep.
+
+    Parameters
+    ----------
+    cable :     PassiveCable
+    target :    int
+                treenode_id, e.g. the soma
+
+    Returns
+    -------
+    pandas.Series
+                Voltage at the target divided by the voltage at the compartment, for
+                current injected at the compartment, indexed by treenode_id
+    """
+
+    return ps.Series(transfer_resistances(cable, target).values / input_resistances(cable).values,
+                     index = cable.treenode_id, name = 'attenuation')
+
+
+def _target(x, target):
+    if target is not None:
+        return int(target)
+    if x.soma is not None:
+        soma = x.soma
+        return int(soma[0] if isinstance(soma, (list, np.ndarray)) else soma)
+    return int(x.root)
+
+
+def synapse_attenuation(x, cable = None, target = None, Rm = 20.8, Cm = 0.8, Ri = 266.1, cache = None):
+    """ Steady-state input resistance, transfer resistance and voltage
+    attenuation from every connector of a neuron to its soma.
+
+    Parameters
+    ----------
+    x :         CatmaidNeuron | Skeleton
+    cable :     PassiveCable, optional
+                Model of x containing the treenodes of all connectors. Defaults
+                to PassiveCable.from_neuron(x, Rm, Cm, Ri, cache) (full resolution)
+    target :    int, optional
+                treenode_id to attenuate to. Defaults to the soma (or the root
+                if x has no soma)
+    Rm :        Membrane Resistance, as kΩcm^2
+    Cm :        Membrane Capacitance, as µFcm^-2
+    Ri :        Intracellular Resistivity, as Ωcm
+    cache :     SkeletonCache, optional
+                Reuse guessed radii from the cache
+
+    Returns
+    -------
+    pandas.DataFrame
+                Indexed by connector_id: treenode_id, relation, input_resistance (MΩ),
+                transfer_resistance (MΩ) and attenuation (voltage at the target
+                divided by the voltage at the synapse, for current injected at the synapse)
+
+    Examples
+    --------
+    >>> att = synapse_attenuation(x)
+    >>> att[att.relation == 1].attenuation.describe()
+    """
+
+    if cable is None:
+        cable = PassiveCable.from_neuron(x, Rm = Rm, Cm = Cm, Ri = Ri, cache = cache)
+
+    target = _target(x, target)
+    connectors = x.connectors
+
+    tn = connectors.treenode_id.values.astype(np.int64)
+    rows = cable.rows(tn)
+
+    r_in = input_resistances(cable).values[rows]
+    r_transfer = transfer_resistances(cable, target).values[rows]
+
+    return ps.DataFrame({'treenode_id':tn,
+                         'relation':connectors.relation.values,
+                         'input_resistance (MΩ)':r_in,
+                         'transfer_resistance (MΩ)':r_transfer,
+                         'attenuation':r_transfer / r_in},
+                        index = ps.Index(connectors.connector_id.values.astype(np.int64), name = 'connector_id'))
+
+
+def synapse_transfer_matrix(x, connector_ids, cable = None, Rm = 20.8, Cm = 0.8, Ri = 266.1, cache = None):
+    """ Steady-state transfer resistances between pairs of connectors.
+    Costs one solve per connector, so pick a subset for large neurons.
+
+    Parameters
+    ----------
+    x :             CatmaidNeuron | Skeleton
+    connector_ids : list of int
+    cable, Rm, Cm, Ri, cache :
+                    See synapse_attenuation()
+
+    Returns
+    -------
+    pandas.DataFrame
+                    connector_id x connector_id transfer resistances (MΩ). The
+                    diagonal holds the input resistances. Divide a column by its
+                    diagonal element to get the attenuation from that connector
+    """
+
+    if cable is None:
+        cable = PassiveCable.from_neuron(x, Rm = Rm, Cm = Cm, Ri = Ri, cache = cache)
+
+    connectors = x.connectors.drop_duplicates('connector_id').set_index('connector_id')
+
+    ids = np.asarray(connector_ids, dtype = np.int64)
+    missing = ~np.isin(ids, connectors.index.values.astype(np.int64))
+    if missing.any():
+        raise ValueError('Connectors not on this neuron: {}'.format(ids[missing].tolist()))
+
+    rows = cable.rows(connectors.loc[ids].treenode_id.values)
+
+    #1 nA into every chosen connector at once, one column each
+    current = np.zeros((len(cable), len(rows)))
+    current[rows, np.arange(len(rows))] = 1
+
+    v = cable._solve(cable._factor(), current)
+
+    return ps.DataFrame(v[rows], index = ps.Index(ids, name = 'connector_id'),
+                        columns = ps.Index(ids, name = 'connector_id'))
@@ -0,0 +1,186 @@
+#pymaid is only imported when skeletons have to be downloaded, so that the worker
+#processes (which only need electrotonic_properties_dataframe) start quickly and
+#stored skeletons can be processed without it
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as ps
+
+from Electrotonic_Properties.electrotonic_properties_dataframe import electrotonic_properties_dataframe
+from Skeleton_Data.instrument import collect, emit, progress
+
+#Rough peak memory used by a worker per treenode (guess_radius copies the neuron,
+#plus the node table, parent arrays & segment table)
+BYTES_PER_NODE = 2000
+
+
+def _neuron_properties(x, Rm, Cm, Ri, cache, store = None):
+    """ Worker: segment table of a single neuron (or of a skeleton_id in the
+    store), and its stage timings (see Skeleton_Data/instrument.py) for the
+    main process to emit """
+
+    if store is not None:
+        x = store.get(x)
+
+    with collect() as runs:
+        segment_matrix = electrotonic_properties_dataframe(x, Rm = Rm, Cm = Cm, Ri = Ri, cache = cache)
+
+    segment_matrix.insert(0, 'skeleton_id', int(x.skeleton_id))
+
+    return segment_matrix, runs
+
+
+def _neuron_list(x):
+    """ A single CatmaidNeuron as a CatmaidNeuronList, anything else unchanged """
+
+    #A CatmaidNeuron can only exist if pymaid has been imported already
+    pymaid = sys.modules.get('pymaid')
+    if pymaid is not None and isinstance(x, pymaid.CatmaidNeuron):
+        return pymaid.CatmaidNeuronList(x)
+
+    return x
+
+
+def _is_neuron_list(x):
+    """ Whether x holds neurons rather than skeleton IDs """
+
+    pymaid = sys.modules.get('pymaid')
+    return pymaid is not None and isinstance(x, pymaid.CatmaidNeuronList)
+
+
+def iter_electrotonic_properties(x, Rm = 20.8, Cm = 0.8, Ri = 266.1, n_cores = None, max_memory = None, cache = None,
+                                 fetcher = None, store = None):
+    """ Like batch_electrotonic_properties, but yields the table of every neuron
+    as soon as it is done (i.e. not necessarily in the order given) instead of
+    collecting them, so results for any number of neurons can be streamed to disk
+    (see electrotonic_dataset.py). At most n_cores tables are held at once.
+
+    Yields
+    ------
+    skeleton_id, pandas.DataFrame
+    """
+
+    x = _neuron_list(x)
+    is_neurons = _is_neuron_list(x)
+
+    if is_neurons:
+        n_neurons = len(x)
+        neurons = iter(x)
+    else:
+        skids = [int(s) for s in x]
+        n_neurons = len(skids)
+        if store is not None:
+            #Only skeleton IDs go to the workers, which open the neurons from the store
+            neurons = iter(skids)
+        else:
+            #Neurons are handed to the workers as soon as they have been downloaded,
+            #so only those being processed are held in memory
+            if fetcher is None:
+                from Skeleton_Data.fetch import CatmaidFetcher
+                fetcher = CatmaidFetcher.from_pymaid(max_workers = 8)
+            neurons = fetcher.iter_neurons(skids)
+
+    if n_cores is None:
+        n_cores = os.cpu_count()
+
+    if n_cores < 1:
+        raise ValueError('n_cores must be at least 1')
+
+    if not n_neurons:
+        raise ValueError('Need to pass at least one neuron')
+
+    from_store = store is not None and not is_neurons
+
+    progress('Calculating electrotonic properties of %i neurons on %i cores...', n_neurons, n_cores)
+
+    with ProcessPoolExecutor(max_workers = n_cores) as pool:
+
+        running = {}
+        in_use = 0
+        neuron = next(neurons, None)
+
+        while neuron is not None or running:
+
+            #Submit as much as the worker count & memory cap allow
+            while neuron is not None and len(running) < n_cores:
+                skid = int(neuron) if from_store else int(neuron.skeleton_id)
+                estimate = (store.n_nodes(skid) if from_store else len(neuron.nodes)) * BYTES_PER_NODE
+                fits = max_memory is None or in_use + estimate <= max_memory
+                if running and not fits:
+                    break
+
+                future = pool.submit(_neuron_properties, neuron, Rm, Cm, Ri, cache, store if from_store else None)
+                running[future] = (skid, estimate)
+                in_use += estimate
+                neuron = next(neurons, None)
+
+            done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+            for future in done:
+                skid, estimate = running.pop(future)
+                in_use -= estimate
+                segment_matrix, runs = future.result()
+                for run in runs:
+                    emit(run)
+                yield skid, segment_matrix
+
+    progress('Done')
+
+
+def batch_electrotonic_properties(x, Rm = 20.8, Cm = 0.8, Ri = 266.1, n_cores = None, max_memory = None, cache = None,
+                                  fetcher = None, store = None):
+    """ Runs electrotonic_properties_dataframe over many neurons in parallel and
+    returns a single long-format dataframe.
+
+    Neurons are sent to a pool of worker processes. If max_memory is given, neurons
+    are only submitted while the estimated memory of all neurons being processed
+    stays below it (a single neuron is always allowed, however large).
+
+    Parameters
+    ----------
+    x :             CatmaidNeuronList | list of skeleton IDs
+                    Neurons to process. Skeleton IDs are downloaded with fetcher
+    Rm :            Membrane Resistance, as kΩcm^2
+    Cm :            Membrane Capacitance, as µFcm^-2
+    Ri :            Intracellular Resistivity, as Ωcm
+    n_cores :       int, optional
+                    Number of worker processes. Defaults to all cores
+    max_memory :    int, optional
+                    Approximate memory cap (bytes) for the neurons being processed at once
+    cache :         SkeletonCache, optional
+                    If given, guessed radii are stored on disk and reused
+    fetcher :       CatmaidFetcher, optional
+                    Downloads skeleton IDs concurrently (see Skeleton_Data/fetch.py);
+                    each neuron is processed as soon as it has arrived. Defaults to
+                    one using pymaid's CATMAID connection
+    store :         SkeletonStore, optional
+                    Skeleton IDs are opened from this store by the workers instead
+                    (see Skeleton_Data/store.py), so no neurons are fetched or sent
+                    to the workers
+
+    Returns
+    -------
+    pandas.DataFrame
+                    The columns of electrotonic_properties_dataframe, plus skeleton_id,
+                    in the order the neurons were given
+
+    Examples
+    --------
+    >>> nl = pymaid.get_neuron('annotation:lineage of interest')
+    >>> segment_matrix = batch_electrotonic_properties(nl, n_cores = 8, max_memory = 16e9)
+    >>> segment_matrix.groupby('skeleton_id').ri.sum()
+    """
+
+    x = _neuron_list(x)
+
+    if _is_neuron_list(x):
+        order = [int(s) for s in x.skeleton_id]
+    else:
+        order = [int(s) for s in x]
+
+    results = dict(iter_electrotonic_properties(x, Rm = Rm, Cm = Cm, Ri = Ri, n_cores = n_cores, max_memory = max_memory,
+                                                cache = cache, fetcher = fetcher, store = store))
+
+    return ps.concat([results[s] for s in order if s in results], ignore_index = True)
@@ -0,0 +1,130 @@
+#Writing electrotonic properties of many neurons to disk as they are calculated.
+#
+#The segment tables of a whole brain region do not fit into memory as one dataframe.
+#write_electrotonic_dataset streams the table of every neuron (see
+#iter_electrotonic_properties) into a Parquet dataset partitioned by skeleton_id, i.e.
+#one folder per neuron:
+#
+#   path/skeleton_id=16/part-0.parquet
+#
+#with compact dtypes (int64 IDs, float32 values), so only the neurons being processed are
+#ever held in memory. Readers can load single neurons (or columns) without reading the rest,
+#with read_electrotonic_dataset or any Parquet reader that understands hive partitioning.
+#Writing a neuron again replaces its previous table. Requires pyarrow.
+
+import os
+
+import numpy as np
+import pandas as ps
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from Skeleton_Data.instrument import progress
+
+ID_COLUMNS = ['start_node', 'end_node']
+
+
+def compact_dtypes(segment_matrix):
+    """ int64 IDs & float32 values, without the skeleton_id column (it is stored
+    in the folder name) """
+
+    table = segment_matrix.drop(columns = 'skeleton_id', errors = 'ignore')
+
+    return table.astype({c:(np.int64 if c in ID_COLUMNS else np.float32) for c in table.columns})
+
+
+def write_neuron_table(path, skeleton_id, segment_matrix):
+    """ Writes (or replaces) the table of a single neuron in the dataset at path """
+
+    folder = os.path.join(path, 'skeleton_id={}'.format(int(skeleton_id)))
+    os.makedirs(folder, exist_ok = True)
+
+    file = os.path.join(folder, 'part-0.parquet')
+
+    #Write to a temporary file first so that readers never see half a table
+    #(files starting with '.' are not part of the dataset)
+    tmp = os.path.join(folder, '.part-0.parquet.{}.tmp'.format(os.getpid()))
+    pq.write_table(pa.Table.from_pandas(compact_dtypes(segment_matrix), preserve_index = False), tmp)
+    os.replace(tmp, file)
+
+
+def write_electrotonic_dataset(x, path, Rm = 20.8, Cm = 0.8, Ri = 266.1, n_cores = None, max_memory = None,
+                               cache = None, fetcher = None, store = None):
+    """ Calculates the electrotonic properties of many neurons and writes them to
+    a Parquet dataset partitioned by skeleton_id, one neuron at a time.
+
+    Parameters
+    ----------
+    x :             CatmaidNeuronList | list of skeleton IDs
+    path :          str
+                    Folder of the dataset, created if necessary
+    Rm, Cm, Ri, n_cores, max_memory, cache, fetcher, store :
+                    See batch_electrotonic_properties
+
+    Returns
+    -------
+    list
+                    skeleton_ids written
+
+    Examples
+    --------
+    >>> write_electrotonic_dataset(skids, 'mb_electrotonic', n_cores = 8, fetcher = fetcher)
+    >>> segment_matrix = read_electrotonic_dataset('mb_electrotonic', skeleton_ids = [16])
+    """
+
+    #Reading a dataset does not need pymaid
+    from Electrotonic_Properties.batch_electrotonic_properties import iter_electrotonic_properties
+
+    os.makedirs(path, exist_ok = True)
+
+    written = []
+
+    for skid, segment_matrix in iter_electrotonic_properties(x, Rm = Rm, Cm = Cm, Ri = Ri, n_cores = n_cores,
+                                                             max_memory = max_memory, cache = cache,
+                                                             fetcher = fetcher, store = store):
+        write_neuron_table(path, skid, segment_matrix)
+        written.append(skid)
+
+    progress('Wrote %i neurons to %s', len(written), path)
+
+    return written
+
+
+def open_electrotonic_dataset(path):
+    """ The dataset at path as a pyarrow Dataset, e.g. for filtering or
+    scanning it in batches without loading it all """
+
+    partitioning = ds.partitioning(pa.schema([('skeleton_id', pa.int64())]), flavor = 'hive')
+
+    return ds.dataset(path, format = 'parquet', partitioning = partitioning)
+
+
+def read_electrotonic_dataset(path, skeleton_ids = None, columns = None):
+    """ Reads (part of) a dataset written by write_electrotonic_dataset.
+
+    Parameters
+    ----------
+    path :          str
+    skeleton_ids :  list of int, optional
+                    Only read these neurons. Files of other neurons are not read
+    columns :       list of str, optional
+                    Only read these columns
+
+    Returns
+    -------
+    pandas.DataFrame
+                    skeleton_id plus the columns of electrotonic_properties_dataframe
+    """
+
+    dataset = open_electrotonic_dataset(path)
+
+    if columns is not None:
+        columns = ['skeleton_id'] + [c for c in columns if c != 'skeleton_id']
+
+    flt = None if skeleton_ids is None else ds.field('skeleton_id').isin([int(s) for s in skeleton_ids])
+
+    table = dataset.to_table(columns = columns, filter = flt).to_pandas()
+
+    #skeleton_id first, like batch_electrotonic_properties
+    return table[['skeleton_id'] + [c for c in table.columns if c != 'skeleton_id']]
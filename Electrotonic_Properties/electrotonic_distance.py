@@ -0,0 +1,112 @@
+#Electrotonic lengths, distances & attenuation of every treenode, for dendrograms drawn
+#in electrotonic space (plot_nx(x, electrotonic = True)).
+#
+#The cable between a treenode and its parent is a cylinder with the radius of the treenode
+#(as in PassiveCable.from_nodes). Its electrotonic length is L = l / λ, with the length
+#constant λ = sqrt(Rm * r / (2 * Ri)). The electrotonic distance of a treenode to the root
+#is the sum of L along the path (Skeleton_Data.tree.distance_to_root), and the steady-state
+#attenuation from every treenode to the root comes from one solve and one sweep of the
+#full resolution PassiveCable (see attenuation.py). Everything is a numpy pass over the
+#parent index array, so this costs about as much as a physical-length layout.
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import distance_to_root
+from Skeleton_Data.skeleton import Skeleton, tree_arrays
+from Electrotonic_Properties.segment_geometry import NM_TO_CM, guess_radii
+from Electrotonic_Properties.passive_cable import PassiveCable
+from Electrotonic_Properties.attenuation import node_attenuation
+
+
+def electrotonic_lengths(nodes, Rm = 20.8, Ri = 266.1, radii = None):
+    """ Electrotonic length of the cable between every treenode and its parent.
+
+    Parameters
+    ----------
+    nodes :     pandas.DataFrame | Skeleton
+                Node table of a CatmaidNeuron (treenode_id, parent_id, x, y, z, radius)
+    Rm :        Membrane Resistance, as kΩcm^2
+    Ri :        Intracellular Resistivity, as Ωcm
+    radii :     pandas.Series, optional
+                Radii (nm) indexed by treenode_id. If None, the radius column
+                of the node table is used
+
+    Returns
+    -------
+    numpy.ndarray
+                L (in units of λ) in the order of nodes, 0 for the root. Cables
+                without membrane (zero radius) have length 0, as in PassiveCable
+    """
+
+    ids = np.asarray(nodes.treenode_id).astype(np.int64)
+
+    parent, parent_dist = tree_arrays(nodes)
+
+    if radii is None:
+        r = np.asarray(nodes.radius)
+    else:
+        r = radii.reindex(ids).values
+
+    r = np.abs(r.astype(np.float64)) * NM_TO_CM
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        length_constant = np.sqrt(Rm * 1e3 * r / (2 * Ri))
+        L = parent_dist * NM_TO_CM / length_constant
+
+    L[~np.isfinite(L) | (parent < 0)] = 0
+
+    return L
+
+
+def electrotonic_distances(x, Rm = 20.8, Ri = 266.1, radii = None, cache = None, radius_method = 'pymaid'):
+    """ Electrotonic length, electrotonic distance to the root and steady-state
+    attenuation to the root of every treenode. Reroot x to its soma first
+    (as plot_nx does) to get values relative to the soma.
+
+    Parameters
+    ----------
+    x :             CatmaidNeuron | Skeleton
+    Rm :            Membrane Resistance, as kΩcm^2
+    Ri :            Intracellular Resistivity, as Ωcm
+    radii :         pandas.Series, optional
+                    Radii (nm) indexed by treenode_id. Defaults to the radii of a
+                    Skeleton (estimated where it has none), or those guessed for
+                    a CatmaidNeuron
+    cache :         SkeletonCache, optional
+                    Reuse guessed radii from the cache
+    radius_method : {'pymaid','kdtree'}
+                    See segment_geometry.guess_radii
+
+    Returns
+    -------
+    pandas.DataFrame
+                    Indexed by treenode_id (in the order of x.nodes):
+                    electrotonic_length (L of the cable to the parent),
+                    electrotonic_distance (summed L to the root) and attenuation
+                    (voltage at the root divided by the voltage at the treenode,
+                    for current injected at the treenode)
+
+    Examples
+    --------
+    >>> x.reroot(x.soma)
+    >>> et = electrotonic_distances(x, radius_method = 'kdtree')
+    >>> plot_nx(x, prog = 'radial', electrotonic = et)
+    """
+
+    nodes = x if isinstance(x, Skeleton) else x.nodes
+
+    if radii is None:
+        radii = guess_radii(x, cache = cache, radius_method = radius_method)
+
+    parent = tree_arrays(nodes)[0]
+    L = electrotonic_lengths(nodes, Rm = Rm, Ri = Ri, radii = radii)
+
+    #Cm does not matter in the steady state
+    cable = PassiveCable.from_nodes(nodes, Rm = Rm, Ri = Ri, radii = radii)
+    root = int(cable.treenode_id[parent < 0][0])
+
+    return ps.DataFrame({'electrotonic_length':L,
+                         'electrotonic_distance':distance_to_root(parent, L),
+                         'attenuation':node_attenuation(cable, root).values},
+                        index = ps.Index(cable.treenode_id, name = 'treenode_id'))
@@ -1,182 +1,134 @@
-        
-    def electrotonic_properties_dataframe(x, Rm = 20.8, Cm = 0.8, Ri = 266.1):
-    
+from Electrotonic_Properties.segment_geometry import SegmentGeometry, electrical_properties, guess_radii
+from Skeleton_Data.skeleton import Skeleton
+from Skeleton_Data.instrument import instrumented, stage, count, progress
+
+
+@instrumented('electrotonic_properties')
+def electrotonic_properties_dataframe(x, Rm = 20.8, Cm = 0.8, Ri = 266.1, cache = None, radius_method = 'pymaid'):
+
     """
-    This function first divides a neuron into segments; 
-    these segments are contained in a list of lists of treenode_ids.
-    
-    It then uses the guess_radius function in pymaid to return 
-    a copy of the neuron where the radii of the treenodes are approximated 
-    to be the distance from a treenode to its nearest connector. 
-    
-    For each segment, the start and end nodes are placed into a 
-    dataframe and the geodesic length between these two points is calculated. 
-    The radius of each segment is only approximated from the start node. From length & radii, 
+    This function first divides a neuron into segments;
+    each segment runs from a leaf or branch point to the next branch point (or root).
+
+    It then uses the guess_radius function in pymaid to return
+    a copy of the neuron where the radii of the treenodes are approximated
+    to be the distance from a treenode to its nearest connector.
+
+    For each segment, the start and end nodes are placed into a
+    dataframe and the geodesic length between these two points is calculated.
+    The radius of each segment is only approximated from the start node. From length & radii,
     the surface area and cross sectional area (of the start node) is calculated.
-    
-    Rm (Membrane resistance), Cm (membrane capacitance) and Ri (intracellular resistivity) 
+
+    All segments are processed at once: geodesic lengths are taken from each node's
+    cumulative distance to the root (see Skeleton_Data/tree.py) and the start node radii
+    are looked up with a single join, so run time scales linearly with the size of the neuron.
+
+    Rm (Membrane resistance), Cm (membrane capacitance) and Ri (intracellular resistivity)
     are the free variables of the neuron model. They are given as kΩcm^2, µFcm^-2 and Ωcm respectively.
-    
-    Current flow across the membrane is modelled as a resistor (rm) and a capacitor (cm) working in parralel. 
+
+    Current flow across the membrane is modelled as a resistor (rm) and a capacitor (cm) working in parralel.
     Intracellular current flow is modelled as a resistor (ri).
-    
-    Steady state values of rm, cm and ri are calulated using equations from 
+
+    Steady state values of rm, cm and ri are calulated using equations from
     Signal Propagation in Drosophila Central Neurons, Gouwens & Wilson (2009), J. of Neuro.
     It is highlight recommended reading this paper before using this function.
-      
+
       l = segment length
       a = surface area
       A = cross-sectional area
-      
+
         rm = Rm / a
-        
+
         cm = Cm * a
-        
+
         ri = Ri * l / A
-        
-        
+
+
     A pandas dataframe is then returned with all of these values
     ------------------------------------------------------------
     Parameters:
     ------------------------------------------------------------
-    
-    x : CatmaidNeuron
-    
+
+    x : CatmaidNeuron | Skeleton | SegmentGeometry
+        A Skeleton (see Skeleton_Data/skeleton.py) is used as is: its radius array
+        is used instead of guessing radii with pymaid, and only treenodes without
+        a radius get an estimated one (see Skeleton_Data/radii.py).
+        Pass a SegmentGeometry (see segment_geometry.py) to reuse the radii & geometry
+        of a neuron when only Rm, Cm & Ri change. For many parameter sets at once,
+        use SegmentGeometry.sweep instead.
+
     Rm = Membrane Resistance, as kΩcm^2
-    
+
     Cm = Membrane Capacitance, as µFcm^-2
-    
+
     Ri = Intracellular Resistivity, as Ωcm
-    
+
+    cache = SkeletonCache (see Skeleton_Data/cache.py), optional. If given, the guessed radii
+            are stored on disk and reused as long as the skeleton does not change
+
+    radius_method = {'pymaid','kdtree'}, optional. How the radii of a CatmaidNeuron are guessed:
+                    'pymaid' uses pymaid.guess_radius, 'kdtree' the faster built-in estimator in
+                    Skeleton_Data/radii.py, which also gives treenodes without a nearby connector
+                    a radius interpolated along the neuron (instead of -0.01)
+
     --------
     Returns
     --------
     pandas.DataFrame
-    
+
     """
-    
-    
-    print('This neuron has {} segments'.format(len(x.segments)))
-    
-    print('Approximating the radii of segments...')
-    
-    x_with_radii = pymaid.guess_radius(x, method = 'linear', smooth = True)
-    
-    print('Getting start & end nodes of segments... \n')
-    
-    start_nodes = []
-    end_nodes = []
-    
-    for i in range(0, len(x.segments)):
-        start_nodes.append(x.segments[i][0])
-        end_nodes.append(x.segments[i][-1])
-        
-    
-    import math
-    pi = math.pi
-        
-    geo_dist = []
-    radii = []
-    surface_area = []
-    cross_sectional_area = []
-    
-    print('Calculating length, radii, surface area & \n cross sectional area of the segments... \n')
-    
-    for i in range(0, len(start_nodes)):
-        alpha = start_nodes[i]
-        beta = end_nodes[i]
-        
-        g = pymaid.dist_between(x, a = alpha, b = beta)
-        geo_dist.append(g/10000000)
-        
-        radii.append((x_with_radii.nodes.radius[x_with_radii.nodes.treenode_id == start_nodes[i]].values[0])/10000000)
-        
-        r = radii[i]
-        
-        circum = 2 * pi * r
-        
-        length = geo_dist[i]
-        
-        sa = circum * length
-        
-        surface_area.append(sa/10000000)
-        
-        CSA = pi * (r*r)
-        
-        cross_sectional_area.append(CSA)
-        
-    #The guess_radius function in pymaid will return -0.001
-    #This for loop will ensure that these values are non-negative
-    
-    for i in radii:
-        if i <0:
-            i = i*-1
-    
-    print('Calculating raw properties... \n')
-    
+
+    #Time, memory & counters of every stage are recorded (see Skeleton_Data/instrument.py)
+
+    if isinstance(x, SegmentGeometry):
+        geometry = x
+
+    elif isinstance(x, Skeleton):
+        count(nodes = len(x), connectors = len(x.connectors))
+
+        #Treenodes without a radius (e.g. in a SkeletonStore) get an estimated one
+        with stage('radius'):
+            radii = guess_radii(x)
+
+        with stage('geometry'):
+            geometry = SegmentGeometry.from_nodes(x, radii = radii)
+
+    else:
+        count(nodes = len(x.nodes), connectors = len(x.connectors))
+
+        progress('Approximating the radii of segments...')
+
+        #The guess_radius function in pymaid will return -0.01 for nodes without connectors,
+        #SegmentGeometry makes these values non-negative
+
+        with stage('radius'):
+            radii = guess_radii(x, cache = cache, radius_method = radius_method)
+
+        progress('Calculating length, radii, surface area & cross sectional area of the segments...')
+
+        with stage('geometry'):
+            geometry = SegmentGeometry.from_nodes(x.nodes, radii = radii)
+
+    count(segments = len(geometry))
+
+    progress('This neuron has %i segments', len(geometry))
+
+    progress('Calculating raw properties...')
+
     #Rm = membrane resistance (kΩcm^2)
     #Cm = membrance capacitance (µFcm^-2)
     #Ri = intracellular resistivity (Ω cm)
-    
+
     if Rm == 20.8 and Cm == 0.8 and Ri == 266.1:
-        print('Using values from Gouwens & Wilson (2009) Table 1 \n for Rm, Cm & Ri values')
-    
-    
-    print('\n')
-    
-    
-    
+        progress('Using values from Gouwens & Wilson (2009) Table 1 for Rm, Cm & Ri values')
+
+
     #Intracellular current flow = resistor (ri)
-    
-    #Current flow across the membrane = resistor (rm) 
+
+    #Current flow across the membrane = resistor (rm)
                                         #capacitor (cm)   These work in parallel
-        
-    
-    ri = []
-    rm = []
-    cm = []
-    
-    for i in range(0, len(start_nodes)):
-        
-        l = geo_dist[i]
-        A = cross_sectional_area[i]
-        
-        ri_a = Ri * (l / A)
-        
-        
-        ###############
-        
-        a = surface_area[i]
-        
-        rm_a = Rm / a
-        
-        ###############
-        
-        cm_a = Cm * a
-        
-        ###############
-        
-        ri.append(ri_a)
-        rm.append(rm_a)
-        cm.append(cm_a)
-        
-    
-    print('Creating Dataframe of values')
-    
-    segment_matrix = ps.DataFrame({'start_node':start_nodes,
-                                   'end_node':end_nodes, 
-                                   'length (cm)':geo_dist, 
-                                   'radii (cm)':radii, 
-                                   'surface_area (cm^2)':surface_area,
-                                   'cross_sectional_area (cm^2)':cross_sectional_area,
-                                   'ri':ri,
-                                   'rm':rm,
-                                   'cm':cm})
-    
-    segment_matrix = segment_matrix[['start_node','end_node',
-                                    'length (cm)','radii (cm)','surface_area (cm^2)',
-                                    'cross_sectional_area (cm^2)','ri','rm','cm']]
-    
+
+    with stage('electrical'):
+        segment_matrix = electrical_properties(geometry, Rm = Rm, Cm = Cm, Ri = Ri)
+
     return(segment_matrix)
-    
-    
@@ -0,0 +1,661 @@
+#Export of neurons to SWC files and NEURON models, for many neurons at once:
+#
+#    $ python -m Electrotonic_Properties.neuron_export --skids skids.txt --out models --n-cores 8
+#
+#Every neuron is rerooted to its soma and written as
+#
+#  - <skeleton_id>.swc: one line per treenode (µm), parents before children, soma = type 1
+#  - <skeleton_id>.hoc: a NEURON template (skeleton_<skeleton_id>) with a soma and one section
+#    per unbranched segment (as in electrotonic_properties_dataframe). Each section has the 3D
+#    points & diameters of its treenodes (radii guessed as in electrotonic_properties_dataframe;
+#    like PassiveCable.from_nodes, the cable to the parent has the radius of the treenode), a
+#    passive membrane with the given Rm, Cm & Ri, and nseg from the d_lambda rule
+#
+#        oc> load_file("16.hoc")
+#        oc> objref cell
+#        oc> cell = new skeleton_16()
+#
+#Files are not built line by line: sections come from the parent index array (see
+#Skeleton_Data/tree.py), and all rows of a file are formatted with a single printf-style %
+#operation over the flattened node arrays. export_neurons runs on a pool of worker
+#processes, like batch_electrotonic_properties, and records every neuron in manifest.csv.
+#check_swc & check_hoc parse the files again, so exports can be checked without NEURON.
+
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import child_counts, depth_first_order
+from Skeleton_Data.skeleton import Skeleton, tree_arrays
+from Skeleton_Data.instrument import instrumented, stage, count, collect, emit, progress, logger, log_to_console
+from Electrotonic_Properties.segment_geometry import guess_radii
+
+FORMATS = ['swc', 'hoc']
+
+SWC_COLUMNS = ['n', 'type', 'x', 'y', 'z', 'radius', 'parent']
+
+#SWC structure types
+SWC_SOMA = 1
+SWC_NEURITE = 3
+
+MANIFEST_COLUMNS = ['skeleton_id', 'neuron_name', 'n_nodes', 'n_sections', 'files', 'seconds', 'status', 'error']
+
+
+def _format(line, *columns):
+    """ Formats one line per row of the columns with a single % operation
+    for all rows (instead of one per row) """
+
+    n = len(columns[0])
+    if n == 0:
+        return ''
+
+    values = np.empty((n, len(columns)), dtype = object)
+    for i, c in enumerate(columns):
+        values[:, i] = c
+
+    return (line * n) % tuple(values.ravel().tolist())
+
+
+def _soma(x):
+    soma = getattr(x, 'soma', None)
+    if soma is None:
+        return None
+    if isinstance(soma, (list, np.ndarray)):
+        return int(soma[0]) if len(soma) else None
+    return int(soma)
+
+
+def model_arrays(x, radii = None, cache = None, radius_method = 'pymaid'):
+    """ Arrays of a neuron rerooted to its soma, in µm.
+
+    Parameters
+    ----------
+    x :             CatmaidNeuron | Skeleton
+                    Rerooted to its soma (if it has one)
+    radii :         pandas.Series, optional
+                    Radii (nm) indexed by treenode_id. Defaults to the radii of a
+                    Skeleton (estimated where it has none), or those guessed for
+                    a CatmaidNeuron
+    cache :         SkeletonCache, optional
+                    Reuse guessed radii from the cache
+    radius_method : {'pymaid','kdtree'}
+                    See segment_geometry.guess_radii
+
+    Returns
+    -------
+    dict
+                    treenode_id, parent (index array), parent_dist (µm), xyz (µm) and
+                    radius (µm, absolute values as in PassiveCable) of every treenode
+    """
+
+    soma = _soma(x)
+    if soma is not None and x.root != soma:
+        x.reroot(soma)
+
+    nodes = x if isinstance(x, Skeleton) else x.nodes
+
+    if radii is None:
+        with stage('radius'):
+            radii = guess_radii(x, cache = cache, radius_method = radius_method)
+
+    ids = np.asarray(nodes.treenode_id).astype(np.int64)
+    parent, parent_dist = tree_arrays(nodes)
+
+    r = radii.reindex(ids).values
+    xyz = x.xyz if isinstance(x, Skeleton) else nodes[['x','y','z']].values
+
+    return {'treenode_id':ids,
+            'parent':parent,
+            'parent_dist':parent_dist / 1000,
+            'xyz':np.asarray(xyz, dtype = np.float64) / 1000,
+            'radius':np.nan_to_num(np.abs(r.astype(np.float64))) / 1000}
+
+
+def swc_text(arrays, header = ''):
+    """ SWC file of model_arrays(): treenodes numbered 1..N in depth-first order
+    (parents before children), the root (soma) as type 1 """
+
+    parent = arrays['parent']
+    order = depth_first_order(parent)
+
+    number = np.empty(len(parent), dtype = np.int64)
+    number[order] = np.arange(1, len(parent) + 1)
+
+    p = parent[order]
+    xyz = arrays['xyz'][order]
+
+    body = _format('%d %d %.3f %.3f %.3f %.4f %d\n',
+                   number[order],
+                   np.where(p < 0, SWC_SOMA, SWC_NEURITE),
+                   xyz[:, 0], xyz[:, 1], xyz[:, 2],
+                   arrays['radius'][order],
+                   np.where(p < 0, -1, number[np.maximum(p, 0)]))
+
+    return header + body
+
+
+def sections(parent):
+    """ Splits a tree rooted at the soma into NEURON sections: unbranched runs of
+    treenodes from the child of a branch point (or of the root) to the next
+    branch point or leaf.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array, see Skeleton_Data/tree.py
+
+    Returns
+    -------
+    rows :      numpy.ndarray
+                Rows of all treenodes but the root, section by section from
+                proximal to distal (sections in depth-first order)
+    section :   numpy.ndarray
+                Section of each entry of rows
+    heads :     numpy.ndarray
+                Row of the first (most proximal) treenode of each section
+    parent_section :
+                numpy.ndarray
+                Section each section is attached to (at its distal end), -1 for the soma
+    """
+
+    parent = np.asarray(parent, dtype = np.int64)
+    n = len(parent)
+
+    is_root = parent < 0
+    is_stop = (child_counts(parent) > 1) | is_root
+    is_head = ~is_root & is_stop[np.maximum(parent, 0)]
+
+    #Every treenode points at the head of its section
+    head = np.where(is_head | is_root, np.arange(n), parent)
+    while True:
+        nxt = head[head]
+        if np.array_equal(nxt, head):
+            break
+        head = nxt
+
+    #In depth-first order, each section is a contiguous run starting at its head
+    order = depth_first_order(parent)
+    rows = order[~is_root[order]]
+    heads = rows[is_head[rows]]
+
+    number = np.full(n, -1, dtype = np.int64)
+    number[heads] = np.arange(len(heads))
+
+    attached = parent[heads]
+
+    return (rows, number[head[rows]], heads,
+            np.where(is_root[attached], -1, number[head[attached]]))
+
+
+def hoc_text(arrays, name, Rm = 20.8, Cm = 0.8, Ri = 266.1, e_pas = -65, d_lambda = 0.1, header = ''):
+    """ NEURON template of model_arrays(), see the top of this file """
+
+    parent, xyz, radius = arrays['parent'], arrays['xyz'], arrays['radius']
+
+    rows, section, heads, parent_section = sections(parent)
+    n_sec = len(heads)
+
+    #3D points of every section: where it is attached, then its treenodes
+    starts = np.searchsorted(section, np.arange(n_sec))
+    points = np.insert(rows, starts, parent[heads])
+    diam = 2 * radius[points]
+    #... the cable to the parent has the radius of the treenode, so no taper from the attachment point
+    first = starts + np.arange(n_sec)
+    diam[first] = 2 * radius[heads]
+    n_points = np.diff(np.append(first, len(points)))
+
+    #nseg from the d_lambda rule (length constant at 100 Hz), with the length-weighted diameter
+    length = np.bincount(section, weights = arrays['parent_dist'][rows], minlength = n_sec)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mean_diam = np.bincount(section, weights = arrays['parent_dist'][rows] * 2 * radius[rows], minlength = n_sec) / length
+        lambda_f = 1e5 * np.sqrt(mean_diam / (4 * np.pi * 100 * Ri * Cm))
+        nseg = (length / (d_lambda * lambda_f) + 0.9) // 2 * 2 + 1
+    nseg = np.where(np.isfinite(nseg), nseg, 1).astype(np.int64)
+
+    #The soma: a cylinder as long as it is wide, at the root
+    root = int(np.flatnonzero(parent < 0)[0])
+    soma_diam = 2 * radius[root]
+    if soma_diam <= 0:
+        soma_diam = diam[first][parent_section < 0].max() if n_sec else 1.0
+    sx, sy, sz = xyz[root]
+
+    pt3d = '\t\tpt3dadd(%.3f, %.3f, %.3f, %.4f)\n'
+
+    #One block per section, formatted for all points at once (a soma-only neuron has none)
+    shape = ''
+    if n_sec:
+        blocks = np.char.add(np.char.add(np.char.add('\tdend[', np.arange(n_sec).astype('U')), '] {\n\t\tpt3dclear()\n'),
+                             np.char.multiply(pt3d, n_points))
+        template = ''.join(np.char.add(blocks, '\t}\n').tolist())
+        shape = template % tuple(np.column_stack((xyz[points], diam)).ravel().tolist())
+
+    on_soma = parent_section < 0
+    topology = (_format('\tconnect dend[%d](0), soma(0.5)\n', np.flatnonzero(on_soma))
+                + _format('\tconnect dend[%d](0), dend[%d](1)\n', np.flatnonzero(~on_soma), parent_section[~on_soma]))
+
+    create = 'create soma, dend[{}]'.format(n_sec) if n_sec else 'create soma'
+    public = 'public soma, dend, all' if n_sec else 'public soma, all'
+    append = '\tfor i = 0, {} dend[i] all.append()\n'.format(n_sec - 1) if n_sec else ''
+
+    return (header +
+            'begintemplate {}\n'.format(name) +
+            '{}\n{}\nobjref all\n\n'.format(public, create) +
+            'proc init() {\n\tshape()\n\ttopology()\n\tsubsets()\n\tbiophys()\n}\n\n' +
+            'proc shape() {\n'
+            '\tsoma {\n\t\tpt3dclear()\n' +
+            pt3d % (sx - soma_diam / 2, sy, sz, soma_diam) + pt3d % (sx + soma_diam / 2, sy, sz, soma_diam) +
+            '\t}\n' + shape + '}\n\n' +
+            'proc topology() {\n' + topology + '}\n\n' +
+            'proc subsets() { local i\n\tall = new SectionList()\n\tsoma all.append()\n' + append + '}\n\n' +
+            'proc biophys() {\n\tforsec all {\n\t\tinsert pas\n' +
+            '\t\tg_pas = {:.6g}\n\t\te_pas = {:g}\n\t\tcm = {:g}\n\t\tRa = {:g}\n\t}}\n'.format(1 / (Rm * 1e3), e_pas, Cm, Ri) +
+            _format('\tdend[%d].nseg = %d\n', np.flatnonzero(nseg > 1), nseg[nseg > 1]) +
+            '}\n\n' +
+            'endtemplate {}\n'.format(name))
+
+
+def _write(path, text):
+    #Files only appear once they are complete
+    folder, name = os.path.split(path)
+    tmp = os.path.join(folder, '.{}.{}.tmp'.format(name, os.getpid()))
+    with open(tmp, 'w', encoding = 'utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _header(x, comment, Rm = None, Cm = None, Ri = None):
+    lines = ['CATMAID skeleton {}: {}'.format(x.skeleton_id, getattr(x, 'neuron_name', '')),
+             'Rerooted to the soma; coordinates, radii & diameters in µm']
+    if Rm is not None:
+        lines.append('Rm = {:g} kΩcm^2, Cm = {:g} µF/cm^2, Ri = {:g} Ωcm'.format(Rm, Cm, Ri))
+    return ''.join('{} {}\n'.format(comment, l) for l in lines)
+
+
+def write_swc(x, path, radii = None, cache = None, radius_method = 'pymaid'):
+    """ Writes a neuron as an SWC file (see the top of this file).
+
+    Parameters
+    ----------
+    x :             CatmaidNeuron | Skeleton
+    path :          str
+    radii, cache, radius_method :
+                    See model_arrays()
+    """
+
+    arrays = model_arrays(x, radii = radii, cache = cache, radius_method = radius_method)
+    _write(path, swc_text(arrays, _header(x, '#')))
+
+
+def write_hoc(x, path, Rm = 20.8, Cm = 0.8, Ri = 266.1, radii = None, cache = None, radius_method = 'pymaid',
+              e_pas = -65, d_lambda = 0.1):
+    """ Writes a neuron as a NEURON template named skeleton_<skeleton_id>
+    (see the top of this file).
+
+    Parameters
+    ----------
+    x :             CatmaidNeuron | Skeleton
+    path :          str
+    Rm :            Membrane Resistance, as kΩcm^2
+    Cm :            Membrane Capacitance, as µFcm^-2
+    Ri :            Intracellular Resistivity, as Ωcm
+    radii, cache, radius_method :
+                    See model_arrays()
+    e_pas :         float
+                    Reversal potential of the passive membrane (mV)
+    d_lambda :      float
+                    Maximum length of a compartment, as a fraction of the length
+                    constant at 100 Hz
+    """
+
+    arrays = model_arrays(x, radii = radii, cache = cache, radius_method = radius_method)
+    _write(path, hoc_text(arrays, 'skeleton_{}'.format(int(x.skeleton_id)), Rm = Rm, Cm = Cm, Ri = Ri,
+                          e_pas = e_pas, d_lambda = d_lambda, header = _header(x, '//', Rm, Cm, Ri)))
+
+
+def output_file(out, skeleton_id, fmt):
+    """ Where a neuron is written """
+    return os.path.join(out, '{}.{}'.format(int(skeleton_id), fmt))
+
+
+@instrumented('neuron_export')
+def export_neuron(x, out, formats = FORMATS, Rm = 20.8, Cm = 0.8, Ri = 266.1, radii = None, cache = None,
+                  radius_method = 'pymaid'):
+    """ Writes a neuron as <skeleton_id>.swc and/or <skeleton_id>.hoc into a
+    folder, guessing its radii only once.
+
+    Returns
+    -------
+    dict
+                    n_nodes, n_sections & the files written
+    """
+
+    if any(f not in FORMATS for f in formats):
+        raise ValueError('Unknown format!')
+
+    arrays = model_arrays(x, radii = radii, cache = cache, radius_method = radius_method)
+    n_sections = len(sections(arrays['parent'])[2])
+
+    count(nodes = len(arrays['parent']), sections = n_sections)
+
+    files = []
+
+    if 'swc' in formats:
+        with stage('swc'):
+            files.append(output_file(out, x.skeleton_id, 'swc'))
+            _write(files[-1], swc_text(arrays, _header(x, '#')))
+
+    if 'hoc' in formats:
+        with stage('hoc'):
+            files.append(output_file(out, x.skeleton_id, 'hoc'))
+            _write(files[-1], hoc_text(arrays, 'skeleton_{}'.format(int(x.skeleton_id)), Rm = Rm, Cm = Cm, Ri = Ri,
+                                       header = _header(x, '//', Rm, Cm, Ri)))
+
+    return {'n_nodes':len(arrays['parent']), 'n_sections':n_sections, 'files':files}
+
+
+def _export_task(x, out, formats, Rm, Cm, Ri, cache, radius_method):
+    """ Worker: exports one neuron and returns its manifest row, and its stage
+    timings (see Skeleton_Data/instrument.py) for the main process to emit """
+
+    start = time.time()
+    row = {'skeleton_id':int(x.skeleton_id), 'neuron_name':getattr(x, 'neuron_name', ''),
+           'n_nodes':len(x) if isinstance(x, Skeleton) else len(x.nodes),
+           'n_sections':0, 'files':'', 'status':'ok', 'error':''}
+
+    try:
+        with collect() as runs:
+            result = export_neuron(x, out, formats = formats, Rm = Rm, Cm = Cm, Ri = Ri, cache = cache,
+                                   radius_method = radius_method)
+        row['n_sections'] = result['n_sections']
+        row['files'] = ' '.join(os.path.basename(f) for f in result['files'])
+    except Exception as e:
+        runs = []
+        row['status'] = 'failed'
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    row['seconds'] = round(time.time() - start, 2)
+
+    return row, runs
+
+
+def export_neurons(skeleton_ids, out, formats = FORMATS, Rm = 20.8, Cm = 0.8, Ri = 266.1, n_cores = None, cache = None,
+                   fetcher = None, radius_method = 'pymaid', skip_existing = False, errors = 'skip'):
+    """ Exports many neurons as SWC files and NEURON templates into a folder,
+    in parallel, and records them in out/manifest.csv.
+
+    Parameters
+    ----------
+    skeleton_ids :  list of int | CatmaidNeuronList | list of Skeleton
+    out :           str
+                    Output folder, created if necessary
+    formats :       list of {'swc','hoc'}
+    Rm :            Membrane Resistance, as kΩcm^2
+    Cm :            Membrane Capacitance, as µFcm^-2
+    Ri :            Intracellular Resistivity, as Ωcm
+    n_cores :       int, optional
+                    Number of worker processes. Defaults to all cores
+    cache :         SkeletonCache, optional
+                    Reuse guessed radii across runs
+    fetcher :       CatmaidFetcher, optional
+                    Downloads skeletons concurrently. Defaults to one using pymaid's
+                    CATMAID connection
+    radius_method : {'pymaid','kdtree'}
+                    See segment_geometry.guess_radii. 'kdtree' is much faster
+    skip_existing : bool
+                    Skip neurons whose files already exist
+    errors :        {'skip','raise'}
+                    'skip' records failed neurons in the manifest and carries on
+
+    Returns
+    -------
+    pandas.DataFrame
+                    Manifest rows of this run
+
+    Examples
+    --------
+    >>> manifest = export_neurons(skids, 'models', n_cores = 8, radius_method = 'kdtree')
+    >>> manifest[manifest.status != 'ok']
+    """
+
+    formats = list(formats)
+    if not formats or any(f not in FORMATS for f in formats):
+        raise ValueError('Unknown format!')
+
+    if errors not in ['skip', 'raise']:
+        raise ValueError('errors must be "skip" or "raise"')
+
+    if n_cores is None:
+        n_cores = os.cpu_count()
+
+    if n_cores < 1:
+        raise ValueError('n_cores must be at least 1')
+
+    os.makedirs(out, exist_ok = True)
+
+    #A CatmaidNeuronList can only exist if pymaid has been imported already
+    pymaid = sys.modules.get('pymaid')
+    is_neurons = pymaid is not None and isinstance(skeleton_ids, pymaid.CatmaidNeuronList)
+
+    skeleton_ids = list(skeleton_ids)
+    if is_neurons or (skeleton_ids and all(isinstance(s, Skeleton) for s in skeleton_ids)):
+        neurons = {int(n.skeleton_id): n for n in skeleton_ids}
+        skids = list(neurons)
+    else:
+        neurons = None
+        skids = [int(s) for s in skeleton_ids]
+
+    if skip_existing:
+        done = set(s for s in skids if all(os.path.exists(output_file(out, s, f)) for f in formats))
+        skids = [s for s in skids if s not in done]
+        progress('Skipping %i neurons that were already exported', len(done))
+
+    if not skids:
+        return ps.DataFrame(columns = MANIFEST_COLUMNS)
+
+    if neurons is not None:
+        neurons = iter([neurons[s] for s in skids])
+    else:
+        if fetcher is None:
+            from Skeleton_Data.fetch import CatmaidFetcher
+            fetcher = CatmaidFetcher.from_pymaid(max_workers = 8)
+        neurons = fetcher.iter_neurons(skids, errors = errors)
+
+    manifest = os.path.join(out, 'manifest.csv')
+    new_manifest = not os.path.exists(manifest)
+
+    progress('Exporting %i neurons on %i cores...', len(skids), n_cores)
+
+    rows = []
+
+    with open(manifest, 'a', newline = '') as f, ProcessPoolExecutor(max_workers = n_cores) as pool:
+
+        writer = csv.DictWriter(f, fieldnames = MANIFEST_COLUMNS)
+        if new_manifest:
+            writer.writeheader()
+
+        running = set()
+        neuron = next(neurons, None)
+
+        while neuron is not None or running:
+
+            #At most two neurons per worker are held in memory at once
+            while neuron is not None and len(running) < 2 * n_cores:
+                running.add(pool.submit(_export_task, neuron, out, formats, Rm, Cm, Ri, cache, radius_method))
+                neuron = next(neurons, None)
+
+            done, running = wait(running, return_when = FIRST_COMPLETED)
+
+            for future in done:
+                row, runs = future.result()
+                for run in runs:
+                    emit(run)
+                writer.writerow(row)
+                f.flush()
+                rows.append(row)
+
+                if row['status'] != 'ok':
+                    logger.warning('Failed to export %s: %s', row['skeleton_id'], row['error'])
+                    if errors == 'raise':
+                        for r in running:
+                            r.cancel()
+                        raise RuntimeError('Failed to export {}: {}'.format(row['skeleton_id'], row['error']))
+
+    rows = ps.DataFrame(rows, columns = MANIFEST_COLUMNS)
+
+    progress('Exported %i of %i neurons into %s', int((rows.status == 'ok').sum()), len(rows), out)
+
+    return rows
+
+
+def check_swc(path):
+    """ Reads an SWC file and checks its structure: treenodes numbered 1..N,
+    a single root, parents listed before their children, known types and
+    non-negative radii.
+
+    Returns
+    -------
+    pandas.DataFrame
+                    The columns of SWC_COLUMNS
+
+    Raises
+    ------
+    ValueError
+                    If the file is not a valid SWC file
+    """
+
+    swc = ps.read_csv(path, sep = r'\s+', comment = '#', header = None, names = SWC_COLUMNS)
+
+    if swc.empty:
+        raise ValueError('{}: no treenodes'.format(path))
+
+    n = swc.n.values
+    parent = swc.parent.values
+
+    if not np.array_equal(n, np.arange(1, len(swc) + 1)):
+        raise ValueError('{}: treenodes are not numbered 1..{}'.format(path, len(swc)))
+    if (parent == -1).sum() != 1:
+        raise ValueError('{}: {} roots'.format(path, int((parent == -1).sum())))
+    if np.any((parent != -1) & ((parent < 1) | (parent >= n))):
+        raise ValueError('{}: parents must be listed before their children'.format(path))
+    if not np.isin(swc.type.values, np.arange(8)).all():
+        raise ValueError('{}: unknown structure types'.format(path))
+    if np.any(~np.isfinite(swc[['x','y','z','radius']].values)) or np.any(swc.radius.values < 0):
+        raise ValueError('{}: coordinates & radii must be finite, radii non-negative'.format(path))
+
+    return swc
+
+
+def check_hoc(path):
+    """ Reads a NEURON template written by write_hoc and checks its structure:
+    one template, balanced braces, a shape block with at least two 3D points
+    for every section created, every section connected once to the soma or to
+    another section (without cycles), and the passive membrane parameters.
+
+    Returns
+    -------
+    dict
+                    template (name), n_sections, n_points & parameters (g_pas,
+                    e_pas, cm & Ra)
+
+    Raises
+    ------
+    ValueError
+                    If the file is not a valid export
+    """
+
+    with open(path, encoding = 'utf-8') as f:
+        text = re.sub(r'//.*', '', f.read())
+
+    names = re.findall(r'^begintemplate (\w+)$', text, re.M)
+    if len(names) != 1 or re.findall(r'^endtemplate (\w+)$', text, re.M) != names:
+        raise ValueError('{}: expected a single template'.format(path))
+    if text.count('{') != text.count('}'):
+        raise ValueError('{}: unbalanced braces'.format(path))
+
+    create = re.search(r'^create soma(?:, dend\[(\d+)\])?$', text, re.M)
+    if create is None:
+        raise ValueError('{}: no sections created'.format(path))
+    n_sections = int(create.group(1) or 0)
+
+    blocks = re.findall(r'^\t(soma|dend\[(\d+)\]) \{\n\t\tpt3dclear\(\)\n((?:\t\tpt3dadd\([^)]*\)\n)*)\t\}$', text, re.M)
+    points = {b[0]: b[2].count('pt3dadd') for b in blocks}
+    expected = ['soma'] + ['dend[{}]'.format(i) for i in range(n_sections)]
+    if sorted(points) != sorted(expected) or len(blocks) != len(expected):
+        raise ValueError('{}: expected one shape block per section'.format(path))
+    if min(points.values()) < 2:
+        raise ValueError('{}: sections need at least two 3D points'.format(path))
+
+    attached = np.full(n_sections, -2)
+    for child, parent in re.findall(r'^\tconnect dend\[(\d+)\]\(0\), (soma|dend\[\d+\])\(\d(?:\.\d+)?\)$', text, re.M):
+        child = int(child)
+        if child >= n_sections or attached[child] != -2:
+            raise ValueError('{}: dend[{}] connected twice or not created'.format(path, child))
+        attached[child] = -1 if parent == 'soma' else int(parent[5:-1])
+    if np.any(attached == -2) or np.any(attached >= n_sections):
+        raise ValueError('{}: sections not connected'.format(path))
+
+    #Every section must lead to the soma
+    ptr = attached.copy()
+    for _ in range(int(np.ceil(np.log2(n_sections + 1))) + 1):
+        ptr = np.where(ptr < 0, ptr, ptr[np.maximum(ptr, 0)])
+    if np.any(ptr >= 0):
+        raise ValueError('{}: sections are connected in a cycle'.format(path))
+
+    parameters = dict((k, float(v)) for k, v in re.findall(r'^\t\t(g_pas|e_pas|cm|Ra) = (\S+)$', text, re.M))
+    if 'insert pas' not in text or len(parameters) != 4:
+        raise ValueError('{}: passive membrane parameters missing'.format(path))
+
+    return {'template':names[0], 'n_sections':n_sections, 'n_points':sum(points.values()),
+            'parameters':parameters}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Export many neurons as SWC files and NEURON templates')
+    parser.add_argument('skeleton_ids', type = int, nargs = '*')
+    parser.add_argument('--skids', help = 'File with one skeleton ID per line')
+    parser.add_argument('--out', default = 'models', help = 'Output folder')
+    parser.add_argument('--formats', nargs = '+', default = FORMATS, choices = FORMATS)
+    parser.add_argument('--Rm', type = float, default = 20.8, help = 'Membrane resistance, kΩcm^2')
+    parser.add_argument('--Cm', type = float, default = 0.8, help = 'Membrane capacitance, µF/cm^2')
+    parser.add_argument('--Ri', type = float, default = 266.1, help = 'Intracellular resistivity, Ωcm')
+    parser.add_argument('--radius-method', default = 'pymaid', choices = ['pymaid', 'kdtree'])
+    parser.add_argument('--n-cores', type = int)
+    parser.add_argument('--fetch-workers', type = int, default = 8, help = 'Concurrent downloads')
+    parser.add_argument('--cache', help = 'Folder of a SkeletonCache for guessed radii')
+    parser.add_argument('--skip-existing', action = 'store_true', help = 'Resume an interrupted run')
+    parser.add_argument('--errors', default = 'skip', choices = ['skip', 'raise'])
+    args = parser.parse_args(argv)
+
+    from Skeleton_Data.fetch import catmaid_instance, CatmaidFetcher
+    from Skeleton_Data.cache import SkeletonCache
+
+    skids = list(args.skeleton_ids)
+    if args.skids:
+        with open(args.skids) as f:
+            skids += [int(l) for l in f.read().split()]
+
+    if not skids:
+        parser.error('No skeleton IDs given')
+
+    log_to_console()
+    remote_instance = catmaid_instance()
+    cache = SkeletonCache(args.cache) if args.cache else None
+
+    with CatmaidFetcher.from_pymaid(remote_instance, max_workers = args.fetch_workers) as fetcher:
+        manifest = export_neurons(skids, args.out, formats = args.formats, Rm = args.Rm, Cm = args.Cm, Ri = args.Ri,
+                                  n_cores = args.n_cores, cache = cache, fetcher = fetcher,
+                                  radius_method = args.radius_method, skip_existing = args.skip_existing,
+                                  errors = args.errors)
+
+    return 0 if (manifest.status == 'ok').all() else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,289 @@
+#Vectorised segment geometry & electrical properties.
+#
+#All segments of a neuron are handled at once: segment lengths come from the cumulative
+#distance to the root (end minus start), the radius of each segment is looked up from
+#its start node with a single indexed join, and ri/rm/cm are numpy column operations.
+#
+#The geometry only depends on the skeleton, so it can be computed once (SegmentGeometry)
+#and reused for any number of Rm/Cm/Ri values (see SegmentGeometry.sweep).
+
+import itertools
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import distance_to_root, segments
+from Skeleton_Data.skeleton import Skeleton, tree_arrays
+from Skeleton_Data.cache import cached_radii
+from Skeleton_Data.radii import estimate_radii, skeleton_radii
+from Skeleton_Data.instrument import progress
+
+#CATMAID coordinates & radii are in nm
+NM_TO_CM = 1e-7
+
+
+RADIUS_METHODS = ['pymaid', 'kdtree']
+
+
+def guess_radii(x, cache = None, radius_method = 'pymaid'):
+    """ Radii of a CatmaidNeuron guessed from the distance of its treenodes to their connectors.
+
+    Parameters
+    ----------
+    x :             CatmaidNeuron | Skeleton
+                    A Skeleton keeps its radii; only those of treenodes without a
+                    radius (< 0) are estimated (see Skeleton_Data.radii.skeleton_radii)
+    cache :         SkeletonCache, optional
+                    If given, radii guessed by pymaid are stored on disk and reused
+                    as long as the skeleton does not change
+    radius_method : {'pymaid','kdtree'}
+                    'pymaid' uses pymaid.guess_radius. 'kdtree' uses the much faster
+                    Skeleton_Data.radii.estimate_radii, which also gives treenodes
+                    far from any connector a radius (instead of -0.01)
+
+    Returns
+    -------
+    pandas.Series
+                Radii (nm) indexed by treenode_id
+    """
+
+    if radius_method not in RADIUS_METHODS:
+        raise ValueError('Unknown radius_method!')
+
+    if isinstance(x, Skeleton):
+        return skeleton_radii(x)
+
+    if radius_method == 'kdtree':
+        return estimate_radii(x.nodes, x.connectors)
+
+    if cache is not None:
+        return cached_radii(x, cache)
+
+    import pymaid
+
+    x_with_radii = pymaid.guess_radius(x, method = 'linear', smooth = True)
+
+    return ps.Series(x_with_radii.nodes.radius.values,
+                     index = x_with_radii.nodes.treenode_id.values.astype(np.int64))
+
+
+class SegmentGeometry:
+    """ Length, radius, surface area and cross sectional area of every
+    segment of a neuron, stored as numpy arrays.
+
+    Use SegmentGeometry.from_nodes() or SegmentGeometry.from_neuron() to create one.
+
+    Attributes
+    ----------
+    start_node, end_node :      numpy.ndarray of treenode_ids
+    length :                    numpy.ndarray, cm
+    radius :                    numpy.ndarray, cm
+    surface_area :              numpy.ndarray, cm^2
+    cross_sectional_area :      numpy.ndarray, cm^2
+    """
+
+    def __init__(self, start_node, end_node, length, radius):
+        self.start_node = start_node
+        self.end_node = end_node
+        self.length = length
+        self.radius = radius
+
+        self.surface_area = 2 * np.pi * radius * length
+        self.cross_sectional_area = np.pi * radius**2
+
+        #ri, rm & cm are Ri, Rm & Cm times these
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            self._ri_factor = length / self.cross_sectional_area
+            self._rm_factor = 1 / self.surface_area
+
+    def __len__(self):
+        return len(self.start_node)
+
+    def __repr__(self):
+        return '<SegmentGeometry of {} segments>'.format(len(self))
+
+    @classmethod
+    def from_nodes(cls, nodes, radii = None):
+        """ Calculates the geometry of every segment from a node table or Skeleton.
+
+        Parameters
+        ----------
+        nodes :     pandas.DataFrame | Skeleton
+                    Node table of a CatmaidNeuron (treenode_id, parent_id, x, y, z)
+        radii :     pandas.Series, optional
+                    Radii (nm) indexed by treenode_id, e.g. from pymaid.guess_radius.
+                    If None, the radius column of the node table is used
+
+        Returns
+        -------
+        SegmentGeometry
+        """
+
+        ids = np.asarray(nodes.treenode_id).astype(np.int64)
+
+        parent, parent_dist = tree_arrays(nodes)
+
+        start, end = segments(parent, parent_dist)
+
+        to_root = distance_to_root(parent, parent_dist)
+
+        length = np.abs(to_root[start] - to_root[end]) * NM_TO_CM
+
+        #One indexed join for all start node radii
+        if radii is None:
+            r = np.asarray(nodes.radius)[start]
+        else:
+            r = radii.reindex(ids[start]).values
+
+        #pymaid.guess_radius leaves nodes without connectors at -0.01
+        r = np.abs(r.astype(np.float64)) * NM_TO_CM
+
+        return cls(ids[start], ids[end], length, r)
+
+    @classmethod
+    def from_neuron(cls, x, cache = None, radius_method = 'pymaid'):
+        """ Guesses the radii of a CatmaidNeuron (see guess_radii) and
+        calculates the geometry of every segment.
+
+        Parameters
+        ----------
+        x :             CatmaidNeuron
+        cache :         SkeletonCache, optional
+                        If given, guessed radii are stored on disk and reused
+                        as long as the skeleton does not change
+        radius_method : {'pymaid','kdtree'}
+                        See guess_radii
+
+        Returns
+        -------
+        SegmentGeometry
+        """
+
+        return cls.from_nodes(x.nodes, radii = guess_radii(x, cache = cache, radius_method = radius_method))
+
+    def to_frame(self):
+        """ Returns the geometry as a dataframe with the columns used by
+        electrotonic_properties_dataframe """
+
+        return ps.DataFrame({'start_node':self.start_node,
+                             'end_node':self.end_node,
+                             'length (cm)':self.length,
+                             'radii (cm)':self.radius,
+                             'surface_area (cm^2)':self.surface_area,
+                             'cross_sectional_area (cm^2)':self.cross_sectional_area})
+
+    def sweep(self, Rm = 20.8, Cm = 0.8, Ri = 266.1, grid = False):
+        """ Calculates ri, rm and cm of every segment for many parameter sets at once.
+
+        Rm, Cm & Ri are broadcast against each other (so any of them can be a scalar)
+        to give P parameter sets, which are broadcast against the S segments. The
+        geometry itself is not copied.
+
+        Parameters
+        ----------
+        Rm :        float | array-like
+                    Membrane Resistance, as kΩcm^2
+        Cm :        float | array-like
+                    Membrane Capacitance, as µFcm^-2
+        Ri :        float | array-like
+                    Intracellular Resistivity, as Ωcm
+        grid :      bool, optional
+                    If True, use every combination of the given Rm, Cm & Ri values
+                    instead of broadcasting them
+
+        Returns
+        -------
+        dict
+                    'Rm', 'Cm', 'Ri': the P parameter sets, arrays of shape (P,)
+                    'ri', 'rm', 'cm': arrays of shape (P, S)
+
+        Examples
+        --------
+        >>> geo = SegmentGeometry.from_neuron(x)
+        >>> res = geo.sweep(Rm = np.linspace(5, 50, 100), Cm = 0.8, Ri = [100, 200, 300], grid = True)
+        >>> res['ri'].shape
+        (300, 1234)
+        """
+
+        if grid:
+            combos = np.array(list(itertools.product(np.atleast_1d(Rm),
+                                                     np.atleast_1d(Cm),
+                                                     np.atleast_1d(Ri))), dtype = np.float64)
+            Rm, Cm, Ri = combos[:, 0], combos[:, 1], combos[:, 2]
+        else:
+            Rm, Cm, Ri = np.broadcast_arrays(np.atleast_1d(np.asarray(Rm, dtype = np.float64)),
+                                             np.atleast_1d(np.asarray(Cm, dtype = np.float64)),
+                                             np.atleast_1d(np.asarray(Ri, dtype = np.float64)))
+
+        if Rm.ndim != 1:
+            raise ValueError('Rm, Cm & Ri must be scalars or 1D arrays')
+
+        return {'Rm':Rm, 'Cm':Cm, 'Ri':Ri,
+                'ri':np.multiply.outer(Ri, self._ri_factor),
+                'rm':np.multiply.outer(Rm, self._rm_factor),
+                'cm':np.multiply.outer(Cm, self.surface_area)}
+
+
+def segment_geometry(nodes, radii = None):
+    """ Calculates the length, radius, surface area and cross sectional area of
+    every segment of a neuron in a single pass over its node table.
+
+    Parameters
+    ----------
+    nodes :     pandas.DataFrame
+                Node table of a CatmaidNeuron (treenode_id, parent_id, x, y, z)
+    radii :     pandas.Series, optional
+                Radii (nm) indexed by treenode_id, e.g. from pymaid.guess_radius.
+                If None, the radius column of the node table is used
+
+    Returns
+    -------
+    pandas.DataFrame
+                One row per segment: start_node, end_node, length (cm), radii (cm),
+                surface_area (cm^2) & cross_sectional_area (cm^2)
+    """
+
+    return SegmentGeometry.from_nodes(nodes, radii = radii).to_frame()
+
+
+def electrical_properties(geometry, Rm = 20.8, Cm = 0.8, Ri = 266.1):
+    """ Adds ri, rm and cm columns to a segment geometry table.
+
+        ri = Ri * l / A
+        rm = Rm / a
+        cm = Cm * a
+
+    Parameters
+    ----------
+    geometry :  pandas.DataFrame | SegmentGeometry
+                As returned by segment_geometry()
+    Rm :        Membrane Resistance, as kΩcm^2
+    Cm :        Membrane Capacitance, as µFcm^-2
+    Ri :        Intracellular Resistivity, as Ωcm
+
+    Returns
+    -------
+    pandas.DataFrame
+                Copy of geometry with ri, rm & cm columns
+    """
+
+    if isinstance(geometry, SegmentGeometry):
+        geometry = geometry.to_frame()
+
+    l = geometry['length (cm)'].values
+    a = geometry['surface_area (cm^2)'].values
+    A = geometry['cross_sectional_area (cm^2)'].values
+
+    #Zero-length/zero-radius segments give inf, not a ZeroDivisionError
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        ri = Ri * (l / A)
+        rm = Rm / a
+
+    cm = Cm * a
+
+    segment_matrix = geometry.copy()
+    segment_matrix['ri'] = ri
+    segment_matrix['rm'] = rm
+    segment_matrix['cm'] = cm
+
+    return segment_matrix
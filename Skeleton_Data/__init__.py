@@ -0,0 +1,6 @@
+#Shared, dependency-light helpers for working with CATMAID skeletons as arrays.
+#See README.md in this folder.
+
+from .tree import (parent_index, parent_distances, accumulate_to_root, distance_to_root, depth,
+                   child_counts, children, roots, depth_first_order, subtree_sizes, segments)
+from .skeleton import Skeleton, tree_arrays
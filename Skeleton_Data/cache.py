@@ -0,0 +1,546 @@
+#Persistent on-disk cache for skeleton tables, guessed radii and dendrogram layouts.
+#
+#Every entry is a table stored as a Feather file. Entries are addressed by a hash of what
+#they were made from:
+#
+#  - downloaded node/connector tables by (skeleton_id, edition, downsample factor)
+#  - derived tables (radii, layouts) by the content of the node table they were
+#    computed from plus the parameters of the computation
+#
+#so a changed skeleton never hits a stale entry. When a new edition (or node table) of a
+#skeleton is stored, the older entries of the same kind & parameters for that skeleton are
+#removed.
+#An sqlite index keeps track of entry sizes and access times, and the least recently
+#used entries are evicted once the cache grows beyond max_bytes.
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import parent_index
+from Skeleton_Data.skeleton import neuron_from_tables
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'AdultEM')
+
+#2 GB
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def node_table_digest(nodes, connectors = None):
+    """ Hash of the topology & coordinates of a node table. Two node tables
+    have the same digest only if they describe the same skeleton.
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame
+                    Node table of a CatmaidNeuron
+    connectors :    pandas.DataFrame, optional
+                    Connector table, for results that depend on the connectors
+                    as well (e.g. guessed radii)
+
+    Returns
+    -------
+    str
+    """
+
+    h = hashlib.sha1()
+    h.update(nodes.treenode_id.values.astype(np.int64).tobytes())
+    h.update(parent_index(nodes).tobytes())
+    h.update(nodes[['x','y','z']].values.astype(np.float64).tobytes())
+
+    if connectors is not None:
+        h.update(b'connectors')
+        h.update(connectors.treenode_id.values.astype(np.int64).tobytes())
+        h.update(connectors.connector_id.values.astype(np.int64).tobytes())
+        h.update(connectors.relation.values.astype(np.int64).tobytes())
+        if 'x' in connectors:
+            h.update(connectors[['x','y','z']].values.astype(np.float64).tobytes())
+
+    return h.hexdigest()
+
+
+class SkeletonCache:
+    """ Size-bounded, least recently used cache of tables on disk.
+
+    Parameters
+    ----------
+    path :          str, optional
+                    Cache folder, created if necessary
+    max_bytes :     int, optional
+                    Entries are evicted (least recently used first) once the
+                    cache holds more than this
+
+    Examples
+    --------
+    >>> cache = SkeletonCache()
+    >>> nodes = cache.get_or_compute('radii', 16, edition, params, compute_radii)
+    """
+
+    def __init__(self, path = DEFAULT_CACHE_DIR, max_bytes = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        os.makedirs(path, exist_ok = True)
+
+        with self._index() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries '
+                       '(key TEXT PRIMARY KEY, skeleton_id INTEGER, kind TEXT, edition TEXT, '
+                       'size INTEGER, last_access REAL)')
+
+    def __repr__(self):
+        return '<SkeletonCache of {} entries ({:.1f} MB) at {}>'.format(len(self), self.size / 1e6, self.path)
+
+    def __len__(self):
+        with self._index() as db:
+            return db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    @property
+    def size(self):
+        """ Total size of all entries in bytes """
+        with self._index() as db:
+            return db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def _index(self):
+        return sqlite3.connect(os.path.join(self.path, 'index.sqlite'), timeout = 60)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.feather')
+
+    @staticmethod
+    def _group(kind, params = None):
+        """ Entries of a skeleton in the same group replace each other when a
+        new edition is stored, e.g. layouts of the same program """
+        return '{} {}'.format(kind, json.dumps(params or {}, sort_keys = True, default = str))
+
+    @staticmethod
+    def key(kind, skeleton_id, edition, params = None):
+        """ Content address of an entry """
+        desc = json.dumps([kind, int(skeleton_id), str(edition), params or {}], sort_keys = True, default = str)
+        return hashlib.sha1(desc.encode()).hexdigest()
+
+    def get(self, kind, skeleton_id, edition, params = None):
+        """ Returns the cached table, or None if there is no such entry """
+
+        key = self.key(kind, skeleton_id, edition, params)
+
+        try:
+            table = ps.read_feather(self._file(key))
+        except (FileNotFoundError, OSError):
+            return None
+
+        with self._index() as db:
+            db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+
+        return table
+
+    def put(self, kind, skeleton_id, edition, table, params = None):
+        """ Stores a table. Entries of the same kind & params for older
+        editions of this skeleton are removed. """
+
+        key = self.key(kind, skeleton_id, edition, params)
+        file = self._file(key)
+
+        #Write to a temporary file first so that readers never see half a table
+        tmp = '{}.{}.tmp'.format(file, os.getpid())
+        table.reset_index(drop = True).to_feather(tmp)
+        os.replace(tmp, file)
+
+        with self._index() as db:
+            stale = db.execute('SELECT key FROM entries WHERE skeleton_id = ? AND kind = ? AND edition != ?',
+                               (int(skeleton_id), self._group(kind, params), str(edition))).fetchall()
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                       (key, int(skeleton_id), self._group(kind, params), str(edition), os.path.getsize(file), time.time()))
+
+        self._remove([k for k, in stale])
+        self.evict()
+
+    def get_or_compute(self, kind, skeleton_id, edition, params, compute):
+        """ Returns the cached table, or calls compute() and caches its result """
+
+        table = self.get(kind, skeleton_id, edition, params)
+
+        if table is None:
+            table = compute()
+            self.put(kind, skeleton_id, edition, table, params)
+
+        return table
+
+    def latest(self, kind, skeleton_id, params = None):
+        """ The most recently used entry of this kind & params for a skeleton,
+        whatever its edition.
+
+        Returns
+        -------
+        edition, table
+                    or None if there is no such entry
+        """
+
+        with self._index() as db:
+            entries = db.execute('SELECT key, edition FROM entries WHERE skeleton_id = ? AND kind = ? '
+                                 'ORDER BY last_access DESC', (int(skeleton_id), self._group(kind, params))).fetchall()
+
+        for key, edition in entries:
+            if key == self.key(kind, skeleton_id, edition, params):
+                table = self.get(kind, skeleton_id, edition, params)
+                if table is not None:
+                    return edition, table
+
+        return None
+
+    def invalidate(self, skeleton_id):
+        """ Removes all entries of a skeleton """
+
+        with self._index() as db:
+            keys = db.execute('SELECT key FROM entries WHERE skeleton_id = ?', (int(skeleton_id),)).fetchall()
+
+        self._remove([k for k, in keys])
+
+    def evict(self):
+        """ Removes least recently used entries until the cache fits into max_bytes """
+
+        with self._index() as db:
+            entries = db.execute('SELECT key, size FROM entries ORDER BY last_access DESC').fetchall()
+
+        sizes = np.array([s for _, s in entries], dtype = np.int64)
+        over = np.cumsum(sizes) > self.max_bytes
+
+        self._remove([k for (k, _), o in zip(entries, over) if o])
+
+    def clear(self):
+        """ Removes all entries """
+
+        with self._index() as db:
+            keys = db.execute('SELECT key FROM entries').fetchall()
+
+        self._remove([k for k, in keys])
+
+    def _remove(self, keys):
+        if not keys:
+            return
+
+        with self._index() as db:
+            db.executemany('DELETE FROM entries WHERE key = ?', [(k,) for k in keys])
+
+        for k in keys:
+            try:
+                os.remove(self._file(k))
+            except FileNotFoundError:
+                pass
+
+
+def last_edition(skeleton_id, remote_instance = None):
+    """ Edition of a skeleton from summaries that CATMAID computes on the
+    server, without downloading its treenodes: the cable length & number of
+    treenodes of the skeleton (which change whenever a treenode is added,
+    moved, reconnected or deleted) and a hash of its connector links, with
+    the connector positions & link edition times (so connector edits count
+    too). These are a few small requests; the links grow with the number of
+    connectors, not of treenodes.
+
+    Returns
+    -------
+    str
+    """
+
+    import pymaid
+
+    cable = pymaid.get_cable_lengths([int(skeleton_id)], remote_instance = remote_instance)
+    review = pymaid.get_review([int(skeleton_id)], remote_instance = remote_instance)
+    links = pymaid.get_connector_links([int(skeleton_id)], remote_instance = remote_instance)
+
+    links = links.sort_values(['connector_id', 'node_id', 'relation'])
+    h = hashlib.sha1()
+    h.update(links[['connector_id', 'node_id']].values.astype(np.int64).tobytes())
+    h.update(links[['x','y','z']].values.astype(np.float64).tobytes())
+    h.update(' '.join(links.relation.astype(str).tolist() + links.edition_time.astype(str).tolist()).encode())
+
+    return '{:.3f} {} {}'.format(float(list(cable.values())[0]), int(review.total_node_count.values[0]), h.hexdigest())
+
+
+class PymaidSource:
+    """ Fetches skeletons from CATMAID via pymaid for cached_tables().
+
+    Parameters
+    ----------
+    edition :           callable, optional
+                        Takes a skeleton ID and returns a string that changes whenever
+                        the skeleton is edited. By default, its cable length, number of
+                        treenodes & connector links are asked from CATMAID (see last_edition)
+    remote_instance :   CatmaidInstance, optional
+    """
+
+    def __init__(self, edition = None, remote_instance = None):
+        self._edition = edition
+        self.remote_instance = remote_instance
+
+    def get_edition(self, skeleton_id):
+        if self._edition is not None:
+            return str(self._edition(skeleton_id))
+        return last_edition(skeleton_id, remote_instance = self.remote_instance)
+
+    def get_tables(self, skeleton_id, downsample_factor = None):
+        import pymaid
+
+        x = pymaid.get_neuron(skeleton_id, remote_instance = self.remote_instance)
+
+        if downsample_factor:
+            x.downsample(downsample_factor, preserve_cn_treenodes = True)
+
+        if 'parent_dist' not in x.nodes:
+            x = pymaid.calc_cable(x, return_skdata = True)
+
+        return x.nodes, x.connectors, x.neuron_name
+
+
+class FakeCatmaid:
+    """ Local stand-in for CATMAID serving fixed node & connector tables,
+    for trying out (and testing) the cache without a server.
+
+    Downsampling is not simulated. Use edit() to simulate a skeleton being changed;
+    the number of downloads is counted in .n_downloads.
+
+    Parameters
+    ----------
+    neurons :   dict
+                {skeleton_id: (nodes, connectors, neuron_name)}
+    """
+
+    def __init__(self, neurons):
+        self.neurons = dict(neurons)
+        self.editions = {skid: 0 for skid in self.neurons}
+        self.n_downloads = 0
+
+    def edit(self, skeleton_id, nodes, connectors = None):
+        _, old_connectors, name = self.neurons[skeleton_id]
+        connectors = old_connectors if connectors is None else connectors
+        self.neurons[skeleton_id] = (nodes, connectors, name)
+        self.editions[skeleton_id] += 1
+
+    def get_edition(self, skeleton_id):
+        return str(self.editions[skeleton_id])
+
+    def get_tables(self, skeleton_id, downsample_factor = None):
+        self.n_downloads += 1
+        nodes, connectors, name = self.neurons[skeleton_id]
+        return nodes.copy(), connectors.copy(), name
+
+
+def cached_tables(skeleton_id, cache, source = None, downsample_factor = None):
+    """ Node & connector tables of a skeleton, downloaded only if the cache
+    does not hold the current edition.
+
+    Parameters
+    ----------
+    skeleton_id :       int
+    cache :             SkeletonCache
+    source :            PymaidSource | FakeCatmaid, optional
+                        Where to get skeletons & their editions from. Defaults to PymaidSource()
+    downsample_factor : int, optional
+                        Passed to CatmaidNeuron.downsample (with preserve_cn_treenodes = True)
+
+    Returns
+    -------
+    nodes, connectors : pandas.DataFrame
+    """
+
+    if source is None:
+        source = PymaidSource()
+
+    edition = source.get_edition(skeleton_id)
+    params = {'downsample_factor':downsample_factor}
+
+    nodes = cache.get('nodes', skeleton_id, edition, params)
+    connectors = cache.get('connectors', skeleton_id, edition, params)
+
+    if nodes is None or connectors is None:
+        nodes, connectors, name = source.get_tables(skeleton_id, downsample_factor)
+        cache.put('nodes', skeleton_id, edition, nodes, params)
+        cache.put('connectors', skeleton_id, edition, connectors, params)
+
+    return nodes, connectors
+
+
+def cached_neuron(skeleton_id, cache, source = None, downsample_factor = None):
+    """ Like pymaid.get_neuron followed by downsample and calc_cable, but
+    served from the cache where possible.
+
+    Parameters
+    ----------
+    skeleton_id :       int
+    cache :             SkeletonCache
+    source :            PymaidSource, optional
+    downsample_factor : int, optional
+
+    Returns
+    -------
+    CatmaidNeuron
+    """
+
+    nodes, connectors = cached_tables(skeleton_id, cache, source = source, downsample_factor = downsample_factor)
+
+    #Feather turns the None parent of the root into NaN
+    nodes['parent_id'] = nodes.parent_id.astype(object).where(nodes.parent_id.notnull(), None)
+
+    return neuron_from_tables(skeleton_id, nodes, connectors)
+
+
+def cached_radii(x, cache, method = 'linear', smooth = True):
+    """ pymaid.guess_radius, cached by the content of the neuron's node table.
+
+    Parameters
+    ----------
+    x :         CatmaidNeuron
+    cache :     SkeletonCache
+    method, smooth :
+                Passed to pymaid.guess_radius
+
+    Returns
+    -------
+    pandas.Series
+                Radii (nm) indexed by treenode_id
+    """
+
+    def compute():
+        import pymaid
+        x_with_radii = pymaid.guess_radius(x, method = method, smooth = smooth)
+        return ps.DataFrame({'treenode_id':x_with_radii.nodes.treenode_id.values.astype(np.int64),
+                             'radius':x_with_radii.nodes.radius.values.astype(np.float64)})
+
+    #Radii depend on the connectors too
+    table = cache.get_or_compute('radii', x.skeleton_id, node_table_digest(x.nodes, x.connectors),
+                                 {'method':method, 'smooth':smooth}, compute)
+
+    return ps.Series(table.radius.values, index = table.treenode_id.values)
+
+
+def cached_volume(name, cache, edition = '0', remote_instance = None):
+    """ Triangles of a CATMAID volume mesh (pymaid.get_volume), downloaded
+    only once. Volumes are stored under skeleton_id 0; pass a new edition to
+    replace the stored mesh after the volume was changed in CATMAID.
+
+    Parameters
+    ----------
+    name :              str
+                        Name of the volume
+    cache :             SkeletonCache
+    edition :           str, optional
+    remote_instance :   CatmaidInstance, optional
+
+    Returns
+    -------
+    numpy.ndarray
+                        (M, 3, 3) corners of the triangles (nm)
+    """
+
+    def compute():
+        import pymaid
+        volume = pymaid.get_volume(name, remote_instance = remote_instance)
+        if isinstance(volume, dict):
+            vertices, faces = volume['vertices'], volume['faces']
+        else:
+            vertices, faces = volume.vertices, volume.faces
+        triangles = np.asarray(vertices, dtype = np.float64)[np.asarray(faces, dtype = np.int64)]
+        return ps.DataFrame(triangles.reshape(-1, 9), columns = [c + d for c in 'abc' for d in 'xyz'])
+
+    #One kind per volume, so that storing one volume does not remove the others
+    table = cache.get_or_compute('volume {}'.format(name), 0, edition, None, compute)
+
+    return table.values.astype(np.float64).reshape(-1, 3, 3)
+
+
+def cached_layout(nodes, skeleton_id, cache, prog, compute, update = None):
+    """ Node positions of a dendrogram layout, cached by the content of the
+    node table and the layout program.
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame
+                    Node table the layout is computed from
+    skeleton_id :   int
+    cache :         SkeletonCache
+    prog :          str
+                    Layout program, e.g. 'dot' or 'neato'
+    compute :       callable
+                    Returns the layout as {treenode_id: (x, y)}
+    update :        callable, optional
+                    update(old_nodes, old_pos) returns the layout for nodes given the
+                    layout of a previous version of the skeleton (see
+                    Dendrogram_code/incremental_layout.py). If given, an edited skeleton
+                    has its previous layout updated instead of computed from scratch
+
+    Returns
+    -------
+    dict
+                    {treenode_id: (x, y)}
+    """
+
+    def to_table(pos):
+        ids = np.fromiter(pos.keys(), dtype = np.int64, count = len(pos))
+        xy = np.array(list(pos.values()), dtype = np.float64).reshape(-1, 2)
+        return ps.DataFrame({'treenode_id':ids, 'x':xy[:, 0], 'y':xy[:, 1]})
+
+    def to_pos(t):
+        return dict(zip(t.treenode_id.values.tolist(), zip(t.x.values.tolist(), t.y.values.tolist())))
+
+    if update is None:
+        t = cache.get_or_compute('layout', skeleton_id, node_table_digest(nodes), {'prog':prog},
+                                 lambda: to_table(compute()))
+    else:
+        t = cached_update(nodes, skeleton_id, cache, 'layout', {'prog':prog},
+                          lambda: to_table(compute()),
+                          lambda old_nodes, old_table: to_table(update(old_nodes, to_pos(old_table))))
+
+    return to_pos(t)
+
+
+def cached_update(nodes, skeleton_id, cache, kind, params, compute, update):
+    """ Like SkeletonCache.get_or_compute keyed by the content of a node table,
+    but when the node table has changed, the previous result and node table
+    of the skeleton are passed to update() so that only the edited parts
+    need to be recomputed.
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame
+                    Current node table
+    skeleton_id :   int
+    cache :         SkeletonCache
+    kind :          str
+    params :        dict
+    compute :       callable
+                    compute() returns the table from scratch
+    update :        callable
+                    update(old_nodes, old_table) returns the table for nodes
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+
+    digest = node_table_digest(nodes)
+
+    table = cache.get(kind, skeleton_id, digest, params)
+    if table is not None:
+        return table
+
+    previous = cache.latest(kind, skeleton_id, params)
+    old_nodes = None if previous is None else cache.get(kind + '-nodes', skeleton_id, previous[0])
+
+    if old_nodes is None:
+        table = compute()
+    else:
+        table = update(old_nodes, previous[1])
+
+    cache.put(kind, skeleton_id, digest, table, params)
+    #The node table the result belongs to, for the next update
+    cache.put(kind + '-nodes', skeleton_id, digest,
+              ps.DataFrame({'treenode_id':nodes.treenode_id.values.astype(np.int64),
+                            'parent_id':ps.to_numeric(nodes.parent_id, errors = 'coerce').values,
+                            'x':nodes.x.values, 'y':nodes.y.values, 'z':nodes.z.values}))
+
+    return table
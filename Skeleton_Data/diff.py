@@ -0,0 +1,82 @@
+#Differences between two versions of the node table of a skeleton.
+#
+#Used to update cached dendrogram layouts after a neuron has been edited in CATMAID,
+#instead of recomputing them from scratch. Treenodes are matched by treenode_id;
+#everything is computed with a single join between the two tables.
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import parent_index
+from Skeleton_Data.skeleton import Skeleton
+
+
+def _arrays(x):
+    """ treenode_id, parent index, parent_id (-1 for the root) & xyz of a
+    node table or Skeleton """
+
+    if isinstance(x, Skeleton):
+        parent = x.parent
+        xyz = x.xyz
+    else:
+        parent = parent_index(x)
+        xyz = x[['x','y','z']].values
+
+    ids = np.asarray(x.treenode_id).astype(np.int64)
+    parent_id = np.where(parent >= 0, ids[parent], -1)
+
+    return ids, parent, parent_id, np.asarray(xyz, dtype = np.float64)
+
+
+def changed_nodes(old, new):
+    """ Which treenodes of the new node table are new, were moved or got a
+    different parent.
+
+    Parameters
+    ----------
+    old, new :  pandas.DataFrame | Skeleton
+                Node tables (treenode_id, parent_id, x, y, z)
+
+    Returns
+    -------
+    numpy.ndarray
+                Boolean mask over the rows of new
+    """
+
+    new_ids, _, new_parent, new_xyz = _arrays(new)
+    old_ids, _, old_parent, old_xyz = _arrays(old)
+
+    ix = ps.Index(old_ids).get_indexer(new_ids)
+    found = ix >= 0
+
+    changed = ~found
+    changed[found] = ((new_parent[found] != old_parent[ix[found]])
+                      | np.any(new_xyz[found] != old_xyz[ix[found]], axis = 1))
+
+    return changed
+
+
+def changed_edges(old, new):
+    """ Which treenodes of the new node table have a different connection to
+    their parent than before (the treenode or its parent is new, moved or
+    was reconnected). The cable between these treenodes and their parents has
+    to be measured again.
+
+    Parameters
+    ----------
+    old, new :  pandas.DataFrame | Skeleton
+
+    Returns
+    -------
+    numpy.ndarray
+                Boolean mask over the rows of new
+    """
+
+    changed = changed_nodes(old, new)
+
+    parent = _arrays(new)[1]
+    has_parent = parent >= 0
+
+    changed[has_parent] |= changed[parent[has_parent]]
+
+    return changed
@@ -0,0 +1,130 @@
+#A local HTTP stand-in for CATMAID, serving canned compact-detail JSON.
+#
+#Lets CatmaidFetcher (fetch.py) be tried out and tested without a CATMAID server. It can
+#also simulate a flaky server (failing the first requests of every skeleton) and slow
+#responses, to check retries and concurrency.
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def compact_detail(nodes, connectors):
+    """ CATMAID compact-detail JSON for a node & connector table (as used by pymaid) """
+
+    node_rows = [[int(r.treenode_id), None if r.parent_id is None or r.parent_id != r.parent_id else int(r.parent_id),
+                  int(getattr(r, 'creator_id', 0)), float(r.x), float(r.y), float(r.z),
+                  float(getattr(r, 'radius', -1)), int(getattr(r, 'confidence', 5))]
+                 for r in nodes.itertuples(index = False)]
+
+    connector_rows = [[int(r.treenode_id), int(r.connector_id), int(r.relation),
+                       float(getattr(r, 'x', 0)), float(getattr(r, 'y', 0)), float(getattr(r, 'z', 0))]
+                      for r in connectors.itertuples(index = False)]
+
+    return [node_rows, connector_rows, {}, [], []]
+
+
+class FakeCatmaidServer:
+    """ Serves canned skeletons at
+    http://127.0.0.1:<port>/<project_id>/skeletons/<skeleton_id>/compact-detail
+
+    Parameters
+    ----------
+    skeletons :     dict
+                    {skeleton_id: compact-detail JSON (see compact_detail()) or
+                    (nodes, connectors) tables}
+    fail_first :    int
+                    Answer the first `fail_first` requests for every skeleton with 503
+    delay :         float
+                    Seconds to wait before every response
+
+    Examples
+    --------
+    >>> with FakeCatmaidServer({16: (nodes, connectors)}) as server:
+    ...     fetcher = CatmaidFetcher(server.url, project_id = 1)
+    ...     fetcher.get_skeleton(16)
+    """
+
+    def __init__(self, skeletons, fail_first = 0, delay = 0):
+        self.skeletons = {int(k): (v if isinstance(v, list) else compact_detail(*v)) for k, v in skeletons.items()}
+        self.fail_first = fail_first
+        self.delay = delay
+
+        self.n_requests = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._httpd.server_address[1])
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.n_requests += 1
+                    server._concurrent += 1
+                    server.max_concurrent = max(server.max_concurrent, server._concurrent)
+
+                try:
+                    time.sleep(server.delay)
+                    self._respond()
+                finally:
+                    with server._lock:
+                        server._concurrent -= 1
+
+            def _respond(self):
+                parts = self.path.split('?')[0].strip('/').split('/')
+
+                if len(parts) != 4 or parts[1] != 'skeletons' or parts[3] != 'compact-detail':
+                    return self._send(404, {'error':'Unknown url {}'.format(self.path)})
+
+                skid = int(parts[2])
+
+                with server._lock:
+                    attempt = server._attempts.get(skid, 0)
+                    server._attempts[skid] = attempt + 1
+
+                if attempt < server.fail_first:
+                    return self._send(503, {'error':'Service unavailable'})
+
+                if skid not in server.skeletons:
+                    return self._send(200, {'error':'Skeleton {} does not exist'.format(skid)})
+
+                self._send(200, server.skeletons[skid])
+
+            def _send(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target = self._httpd.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,284 @@
+#Bulk, concurrent download of skeletons from CATMAID.
+#
+#pymaid.get_neuron fetches skeletons one request after another. CatmaidFetcher instead
+#keeps a bounded number of requests in flight over one pooled HTTP session, retries
+#failed requests with exponential backoff, limits the overall request rate (to be nice
+#to the server) and yields every skeleton as soon as it has arrived, so downstream work
+#(electrotonic properties, dendrograms) can start before the last skeleton is in.
+
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as ps
+import requests
+from requests.adapters import HTTPAdapter
+
+from Skeleton_Data.skeleton import neuron_from_tables
+from Skeleton_Data.instrument import logger
+
+NODE_COLUMNS = ['treenode_id','parent_id','creator_id','x','y','z','radius','confidence']
+CONNECTOR_COLUMNS = ['treenode_id','connector_id','relation','x','y','z']
+
+#HTTP status codes worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """ Token bucket shared by all threads: at most `rate` requests per
+    second on average, with bursts of up to `burst` requests.
+
+    Parameters
+    ----------
+    rate :      float
+                Requests per second. None for no limit
+    burst :     int
+    """
+
+    def __init__(self, rate = None, burst = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+
+
+def _parse_compact_detail(data):
+    """ Node & connector tables from a CATMAID compact-detail response """
+
+    #Responses with history have extra columns at the end
+    nodes = ps.DataFrame([n[:8] for n in data[0]], columns = NODE_COLUMNS)
+    nodes['treenode_id'] = nodes.treenode_id.astype(np.int64)
+    #Keep integer parent IDs & None for the root, like pymaid
+    nodes['parent_id'] = ps.Series([n[1] for n in data[0]], dtype = object)
+
+    connectors = ps.DataFrame([c[:6] for c in data[1]], columns = CONNECTOR_COLUMNS)
+    connectors = connectors.astype({'treenode_id':np.int64, 'connector_id':np.int64, 'relation':np.int64})
+
+    return nodes, connectors
+
+
+def catmaid_instance(server = None, http_user = None, http_pw = None, token = None):
+    """ Connects pymaid to CATMAID. Anything not given is read from the
+    environment variables CATMAID_SERVER, CATMAID_HTTP_USER, CATMAID_HTTP_PW
+    and CATMAID_TOKEN, so scripts do not need credentials written into them.
+
+    Returns
+    -------
+    CatmaidInstance
+                    Also made pymaid's default instance
+    """
+
+    import pymaid
+
+    server = server or os.environ.get('CATMAID_SERVER')
+    if not server:
+        raise ValueError('No CATMAID server given, set CATMAID_SERVER')
+
+    return pymaid.CatmaidInstance(server,
+                                  http_user or os.environ.get('CATMAID_HTTP_USER'),
+                                  http_pw or os.environ.get('CATMAID_HTTP_PW'),
+                                  token or os.environ.get('CATMAID_TOKEN'))
+
+
+class CatmaidFetcher:
+    """ Concurrent skeleton downloads from a CATMAID server.
+
+    Parameters
+    ----------
+    server :        str
+                    e.g. 'https://catmaid.server.org'
+    project_id :    int
+    token :         str, optional
+                    CATMAID API token
+    http_user, http_pw : str, optional
+                    HTTP basic authentication
+    max_workers :   int
+                    Number of requests in flight at the same time
+    rate :          float, optional
+                    Maximum requests per second
+    max_retries :   int
+                    How often a failed request is retried
+    backoff :       float
+                    Base delay (s) of the exponential backoff between retries
+    timeout :       float
+                    Timeout (s) of a single request
+
+    Examples
+    --------
+    >>> fetcher = CatmaidFetcher(server, project_id = 1, token = token, max_workers = 16, rate = 50)
+    >>> for skid, nodes, connectors in fetcher.iter_skeletons(skids):
+    ...     geo = SegmentGeometry.from_nodes(nodes)
+    """
+
+    def __init__(self, server, project_id = 1, token = None, http_user = None, http_pw = None,
+                 max_workers = 8, rate = None, max_retries = 5, backoff = 0.5, timeout = 60):
+
+        self.server = server.rstrip('/')
+        self.project_id = project_id
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate, burst = max_workers)
+
+        #One connection pool, big enough for all workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        if token:
+            self.session.headers['X-Authorization'] = 'Token {}'.format(token)
+        if http_user:
+            self.session.auth = (http_user, http_pw)
+
+    @classmethod
+    def from_pymaid(cls, remote_instance = None, **kwargs):
+        """ Uses the server & credentials of a pymaid CatmaidInstance """
+
+        import pymaid
+
+        if remote_instance is None:
+            remote_instance = pymaid.utils._eval_remote_instance(None)
+
+        return cls(remote_instance.server, project_id = remote_instance.project_id,
+                   token = getattr(remote_instance, 'api_token', None),
+                   http_user = getattr(remote_instance, 'http_user', None),
+                   http_pw = getattr(remote_instance, 'http_password', None), **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get(self, url, params = None):
+        """ GET with rate limiting and retries (exponential backoff with jitter) """
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+
+            try:
+                r = self.session.get(url, params = params, timeout = self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    r.raise_for_status()
+                    return r.json()
+
+            time.sleep(self.backoff * 2**attempt * (1 + random.random()))
+
+    def get_skeleton(self, skeleton_id):
+        """ Node & connector tables of a single skeleton.
+
+        Returns
+        -------
+        nodes, connectors : pandas.DataFrame
+        """
+
+        url = '{}/{}/skeletons/{}/compact-detail'.format(self.server, self.project_id, int(skeleton_id))
+        data = self._get(url, params = {'with_connectors':'true', 'with_tags':'false'})
+
+        if isinstance(data, dict) and 'error' in data:
+            raise ValueError('CATMAID error for skeleton {}: {}'.format(skeleton_id, data['error']))
+
+        return _parse_compact_detail(data)
+
+    def iter_skeletons(self, skeleton_ids, errors = 'raise'):
+        """ Fetches many skeletons concurrently and yields each one as soon as it
+        has arrived (i.e. not necessarily in the order given).
+
+        At most max_workers skeletons are downloaded or waiting to be consumed at
+        any time, so memory use does not grow with the number of skeletons.
+
+        Parameters
+        ----------
+        skeleton_ids :  iterable of int
+        errors :        {'raise','skip'}
+                        What to do with skeletons that could not be fetched
+
+        Yields
+        ------
+        skeleton_id, nodes, connectors
+        """
+
+        if errors not in ['raise', 'skip']:
+            raise ValueError('errors must be "raise" or "skip"')
+
+        skids = iter(skeleton_ids)
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+
+            running = {}
+
+            def submit():
+                for skid in skids:
+                    running[pool.submit(self.get_skeleton, skid)] = int(skid)
+                    if len(running) >= self.max_workers:
+                        break
+
+            submit()
+
+            while running:
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    skid = running.pop(future)
+
+                    try:
+                        nodes, connectors = future.result()
+                    except Exception as e:
+                        if errors == 'raise':
+                            for f in running:
+                                f.cancel()
+                            raise
+                        logger.warning('Skipping skeleton %s: %s', skid, e)
+                        continue
+
+                    yield skid, nodes, connectors
+
+                submit()
+
+    def iter_neurons(self, skeleton_ids, errors = 'raise'):
+        """ Like iter_skeletons, but yields pymaid CatmaidNeurons """
+
+        for skid, nodes, connectors in self.iter_skeletons(skeleton_ids, errors = errors):
+            yield neuron_from_tables(skid, nodes, connectors)
+
+    def get_skeletons(self, skeleton_ids, errors = 'raise'):
+        """ Fetches many skeletons concurrently.
+
+        Returns
+        -------
+        dict
+                    {skeleton_id: (nodes, connectors)}
+        """
+
+        return {skid: (nodes, connectors) for skid, nodes, connectors in self.iter_skeletons(skeleton_ids, errors = errors)}
@@ -0,0 +1,296 @@
+#Timing, memory & counters of the stages of the dendrogram and electrotonic code.
+#
+#plot_nx, plotly_plot_nx and electrotonic_properties_dataframe record every call as a Run:
+#how long each named stage took (reroot, calc_cable, graph_build, layout, ...), optionally
+#the peak memory each stage allocated, and counters (nodes, segments, connectors). A
+#finished Run is
+#
+#  - logged to the 'AdultEM' logger (a one-line summary at INFO, every stage at DEBUG)
+#  - passed to every registered callback, e.g. a Recorder, which collects the runs of many
+#    neurons into one table. The batch functions send the runs of their worker processes
+#    back to the main process, so a Recorder there sees all of them
+#
+#Progress messages go to the same logger at INFO, so the functions are silent unless
+#logging is configured; log_to_console() shows them (and the summaries) again.
+#
+#    >>> with Recorder() as rec:
+#    ...     batch_electrotonic_properties(skids, n_cores = 8)
+#    >>> rec.summary()
+
+import sys
+import time
+import logging
+import functools
+import threading
+import contextlib
+import tracemalloc
+
+import numpy as np
+import pandas as ps
+
+logger = logging.getLogger('AdultEM')
+
+_local = threading.local()
+_callbacks = []
+_track_memory = False
+
+
+class Run:
+    """ Stage timings & counters of one call for one neuron.
+
+    Attributes
+    ----------
+    name :          str
+                    e.g. 'plot_nx'
+    skeleton_id :   int | None
+    stages :        list of (stage, seconds, peak_mb)
+                    peak_mb is NaN unless memory tracking is on
+    counters :      dict
+                    e.g. {'nodes': 12000, 'connectors': 800}
+    seconds :       float
+                    Total time of the call
+    """
+
+    def __init__(self, name, skeleton_id = None):
+        self.name = name
+        self.skeleton_id = None if skeleton_id is None else int(skeleton_id)
+        self.stages = []
+        self.counters = {}
+        self.seconds = np.nan
+
+    def __repr__(self):
+        return '<Run {} of {}: {:.3f}s, {}>'.format(self.name, self.skeleton_id, self.seconds,
+                                                    ', '.join('{} {:.3f}s'.format(s, t) for s, t, _ in self.stages))
+
+    def rows(self):
+        """ One dict per stage, with the counters """
+        return [dict({'run':self.name, 'skeleton_id':self.skeleton_id, 'stage':s, 'seconds':t, 'peak_mb':m},
+                     **self.counters) for s, t, m in self.stages]
+
+
+def track_memory(on = True):
+    """ Also record the peak memory allocated by every stage (with tracemalloc,
+    which makes the code itself somewhat slower) """
+
+    global _track_memory
+    _track_memory = bool(on)
+
+
+def add_callback(callback):
+    """ callback(run) is called with every finished Run """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+def current_run():
+    """ The Run being recorded in this thread, or None """
+    return getattr(_local, 'run', None)
+
+
+def emit(run):
+    """ Logs a finished Run and passes it to the callbacks. Used for runs
+    recorded in worker processes. """
+
+    logger.info('%s of %s done in %.2fs (%s)', run.name, run.skeleton_id, run.seconds,
+                ', '.join('{} {:.2f}s'.format(s, t) for s, t, _ in run.stages))
+
+    for s, t, m in run.stages:
+        logger.debug('%s %s: %s %.4fs, peak %.1f MB', run.name, run.skeleton_id, s, t, m)
+
+    for callback in list(_callbacks):
+        callback(run)
+
+
+@contextlib.contextmanager
+def recording(name, skeleton_id = None):
+    """ Records a Run for the code in the with block. Inside another run,
+    the stages are added to the outer run instead. """
+
+    outer = current_run()
+    if outer is not None:
+        yield outer
+        return
+
+    run = _local.run = Run(name, skeleton_id)
+    start = time.perf_counter()
+
+    try:
+        yield run
+    finally:
+        run.seconds = time.perf_counter() - start
+        _local.run = None
+
+    collected = getattr(_local, 'collected', None)
+    if collected is not None:
+        collected.append(run)
+    else:
+        emit(run)
+
+
+def instrumented(name):
+    """ Decorator: records every call as a Run. The skeleton_id is taken from
+    the first argument (a neuron), if it has one. """
+
+    def decorate(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with recording(name, getattr(args[0], 'skeleton_id', None) if args else None):
+                return f(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+@contextlib.contextmanager
+def stage(name):
+    """ Times the with block as a stage of the current run """
+
+    run = current_run()
+    peak = np.nan
+
+    memory = _track_memory and run is not None
+    if memory:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+
+        #Peaks of the stages this one is nested in: resetting the peak for this
+        #stage would lose theirs, so they are kept here and combined on exit
+        peaks = getattr(_local, 'peaks', None)
+        if peaks is None:
+            peaks = _local.peaks = []
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        peaks.append(0)
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+
+        if memory:
+            highest = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+            peak = (highest - before) / 1e6
+            if peaks:
+                peaks[-1] = max(peaks[-1], highest)
+            if started:
+                tracemalloc.stop()
+
+        if run is not None:
+            run.stages.append((name, seconds, peak))
+
+
+@contextlib.contextmanager
+def collect():
+    """ Collects the runs finished in the with block into a list instead of
+    emitting them, e.g. in a worker process that returns them to the main
+    process, which then emits them.
+
+    Examples
+    --------
+    >>> with collect() as runs:
+    ...     table = electrotonic_properties_dataframe(x)
+    """
+
+    runs = _local.collected = []
+    try:
+        yield runs
+    finally:
+        _local.collected = None
+
+
+def count(**counters):
+    """ Sets counters (e.g. nodes = len(x.nodes)) of the current run """
+
+    run = current_run()
+    if run is not None:
+        run.counters.update({k:int(v) for k, v in counters.items()})
+
+
+def progress(message, *args):
+    """ Progress message (what used to be printed) """
+    logger.info(message, *args)
+
+
+def log_to_console(level = logging.INFO):
+    """ Shows progress messages & run summaries on stderr, like the prints
+    of earlier versions """
+
+    if not any(getattr(h, '_adultem', False) for h in logger.handlers):
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler._adultem = True
+        logger.addHandler(handler)
+
+    logger.setLevel(level)
+
+
+class Recorder:
+    """ Collects Runs, e.g. of a batch of neurons, into one table.
+
+    Examples
+    --------
+    >>> with Recorder() as rec:
+    ...     for skid in skids:
+    ...         plot_nx(pymaid.get_neuron(skid), prog = 'tree')
+    >>> rec.summary()
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __call__(self, run):
+        self.runs.append(run)
+
+    def __enter__(self):
+        add_callback(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_callback(self)
+
+    def __len__(self):
+        return len(self.runs)
+
+    def to_frame(self):
+        """ One row per stage of every run
+
+        Returns
+        -------
+        pandas.DataFrame
+                    run, skeleton_id, stage, seconds, peak_mb & the counters
+        """
+
+        rows = [r for run in self.runs for r in run.rows()]
+
+        return ps.DataFrame(rows, columns = None if rows else ['run', 'skeleton_id', 'stage', 'seconds', 'peak_mb'])
+
+    def summary(self):
+        """ Time & memory per stage over all runs
+
+        Returns
+        -------
+        pandas.DataFrame
+                    Indexed by run & stage: n (calls), total, mean & max seconds,
+                    max peak_mb and the share of the total time
+        """
+
+        table = self.to_frame()
+
+        summary = table.groupby(['run', 'stage'], sort = False).agg(n = ('seconds', 'size'),
+                                                                    total_s = ('seconds', 'sum'),
+                                                                    mean_s = ('seconds', 'mean'),
+                                                                    max_s = ('seconds', 'max'),
+                                                                    max_peak_mb = ('peak_mb', 'max'))
+        summary['share'] = summary.total_s / summary.total_s.groupby(level = 'run').transform('sum')
+
+        return summary
@@ -0,0 +1,176 @@
+#Estimating treenode radii from connector positions.
+#
+#Connectors sit on the membrane, so the distance from a treenode to the nearest connector
+#is an estimate of the radius of the neurite there. This is what pymaid.guess_radius does,
+#but it copies the neuron and works through it segment by segment. estimate_radii instead:
+#
+#  1. finds the nearest connector of the treenodes in one batched KD-tree query
+#     (scipy.spatial.cKDTree)
+#  2. interpolates linearly (by cable length) between measured treenodes of the same
+#     unbranched run; treenodes above/below the last measured one take its radius
+#  3. gives runs without any measurement the radius of the nearest measured treenode
+#     towards the root (or the median radius, if there is none), so no radius is left
+#     at pymaid's placeholder of -0.01
+#  4. optionally smooths with a moving average along each run
+#
+#Runs are contiguous in depth-first order (see Skeleton_Data/tree.py), so all of the
+#above are a few vectorised passes over that order.
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import depth_first_order, child_counts, distance_to_root
+from Skeleton_Data.skeleton import Skeleton, tree_arrays
+
+
+def _fill_from_ancestors(parent, radius):
+    """ NaN radii become the radius of the nearest ancestor that has one """
+
+    known = ~np.isnan(radius)
+    ptr = np.where(known | (parent < 0), np.arange(len(parent)), parent)
+
+    while True:
+        nxt = ptr[ptr]
+        if np.array_equal(nxt, ptr):
+            break
+        ptr = np.where(known[ptr], ptr, nxt)
+
+    return radius[ptr]
+
+
+def estimate_radii(nodes, connectors, max_distance = None, smooth = True, window = 5):
+    """ Estimates the radius of every treenode from the distance to the
+    nearest connector, without copying the neuron.
+
+    Parameters
+    ----------
+    nodes :         pandas.DataFrame | Skeleton
+                    Node table (treenode_id, parent_id, x, y, z)
+    connectors :    pandas.DataFrame
+                    Connector table (treenode_id, x, y, z)
+    max_distance :  float, optional
+                    By default only treenodes with connectors are measured (like
+                    pymaid.guess_radius). If given, every treenode closer than this (nm)
+                    to a connector is measured
+    smooth :        bool
+                    Moving average of the radii along every run
+    window :        int
+                    Size of the moving average (treenodes)
+
+    Returns
+    -------
+    pandas.Series
+                    Radii (nm) indexed by treenode_id
+
+    Examples
+    --------
+    >>> radii = estimate_radii(x.nodes, x.connectors)
+    >>> geo = SegmentGeometry.from_nodes(x.nodes, radii = radii)
+    """
+
+    ids = np.asarray(nodes.treenode_id).astype(np.int64)
+    xyz = (nodes.xyz if isinstance(nodes, Skeleton) else nodes[['x','y','z']].values).astype(np.float64)
+    parent, parent_dist = tree_arrays(nodes)
+    n = len(ids)
+
+    if len(connectors) == 0:
+        raise ValueError('Need connectors to estimate radii from')
+
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(connectors[['x','y','z']].values.astype(np.float64))
+
+    #1. One batched query for all measured treenodes
+    if max_distance is None:
+        rows = np.unique(ps.Index(ids).get_indexer(connectors.treenode_id.values.astype(np.int64)))
+        rows = rows[rows >= 0]
+        dist, _ = tree.query(xyz[rows])
+    else:
+        rows = np.arange(n)
+        dist, _ = tree.query(xyz, distance_upper_bound = max_distance)
+
+    radius = np.full(n, np.nan)
+    radius[rows] = dist
+    radius[~np.isfinite(radius)] = np.nan
+
+    if np.all(np.isnan(radius)):
+        raise ValueError('No treenodes within max_distance of a connector')
+
+    #2. Interpolation along runs, in depth-first order
+    order = depth_first_order(parent)
+    up = parent[order]
+    is_first = np.ones(n, dtype = bool)
+    has_parent = up >= 0
+    is_first[has_parent] = (child_counts(parent)[up[has_parent]] > 1) | (parent[up[has_parent]] < 0)
+    run = np.cumsum(is_first) - 1
+
+    r = radius[order]
+    pos = distance_to_root(parent, parent_dist)[order]
+    i = np.arange(n)
+    known = ~np.isnan(r)
+
+    #Previous & next measured position within the same run
+    prev = np.maximum.accumulate(np.where(known, i, -1))
+    nxt = np.minimum.accumulate(np.where(known, i, n)[::-1])[::-1]
+    has_prev = (prev >= 0) & (run[np.maximum(prev, 0)] == run)
+    has_next = (nxt < n) & (run[np.minimum(nxt, n - 1)] == run)
+
+    both = ~known & has_prev & has_next
+    p, q = prev[both], nxt[both]
+    span = pos[q] - pos[p]
+    frac = np.divide(pos[both] - pos[p], span, out = np.full(len(span), 0.5), where = span > 0)
+    r[both] = r[p] + frac * (r[q] - r[p])
+
+    only_prev = ~known & has_prev & ~has_next
+    r[only_prev] = r[prev[only_prev]]
+    only_next = ~known & ~has_prev & has_next
+    r[only_next] = r[nxt[only_next]]
+
+    radius[order] = r
+
+    #3. Runs without measurements
+    radius = _fill_from_ancestors(parent, radius)
+    radius[np.isnan(radius)] = np.nanmedian(radius)
+
+    #4. Moving average within runs
+    if smooth and window > 1:
+        r = radius[order]
+        first = np.flatnonzero(is_first)
+        run_start = first[run]
+        run_end = np.append(first[1:], n)[run] - 1
+
+        half = window // 2
+        lo = np.maximum(i - half, run_start)
+        hi = np.minimum(i + half, run_end)
+
+        cs = np.concatenate(([0], np.cumsum(r)))
+        radius[order] = (cs[hi + 1] - cs[lo]) / (hi - lo + 1)
+
+    return ps.Series(radius, index = ids, name = 'radius')
+
+
+def skeleton_radii(x, **kwargs):
+    """ Radii of a Skeleton, with those of treenodes without a radius (< 0,
+    CATMAID's default) estimated by estimate_radii. Skeletons without
+    connectors keep their radii.
+
+    Parameters
+    ----------
+    x :         Skeleton
+    **kwargs
+                Passed to estimate_radii
+
+    Returns
+    -------
+    pandas.Series
+                Radii (nm) indexed by treenode_id
+    """
+
+    radius = np.asarray(x.radius, dtype = np.float64)
+    unset = radius < 0
+
+    if unset.any() and len(x.connector_id):
+        estimated = estimate_radii(x, x.connectors, **kwargs).values
+        radius = np.where(unset, estimated, radius)
+
+    return ps.Series(radius, index = x.treenode_id, name = 'radius')
@@ -0,0 +1,256 @@
+#Compact, array-backed skeleton.
+#
+#A CatmaidNeuron keeps its treenodes in a pandas DataFrame with Python objects (e.g. None
+#parents), and plotting it used to mean building a networkx graph with one Python object
+#and attribute dict per node. Skeleton keeps the same information in a handful of
+#contiguous numpy arrays, which is what the layout, plotting and electrotonic code
+#actually uses.
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.tree import parent_index, parent_distances, children
+from Skeleton_Data.instrument import logger
+
+
+def neuron_from_tables(skeleton_id, nodes, connectors, neuron_name = None, tags = None):
+    """ Builds a pymaid CatmaidNeuron from node & connector tables
+
+    Returns
+    -------
+    CatmaidNeuron
+    """
+
+    import pymaid
+
+    return pymaid.CatmaidNeuron(ps.Series({'skeleton_id':str(skeleton_id),
+                                           'neuron_name':str(skeleton_id) if neuron_name is None else neuron_name,
+                                           'nodes':nodes,
+                                           'connectors':connectors,
+                                           'tags':tags or {}}))
+
+
+class Skeleton:
+    """ A neuron's skeleton stored as contiguous arrays.
+
+    Use Skeleton.from_neuron() or Skeleton.from_tables() to create one.
+    Skeleton offers the attributes of a CatmaidNeuron used by plot_nx,
+    plotly_plot_nx & electrotonic_properties_dataframe (nodes, connectors,
+    soma, root, reroot, ...), so it can be passed to them directly.
+
+    Attributes
+    ----------
+    treenode_id :       int64 (N,)
+    parent :            int64 (N,), row of the parent of each node, -1 for the root
+    parent_dist :       float32 (N,), distance to the parent in nm
+    radius :            float32 (N,), nm
+    xyz :               float32 (N, 3), nm
+    connector_id :      int64 (M,)
+    connector_node :    int64 (M,), row of the treenode of each connector
+    relation :          int8 (M,), 0 = presynapse, 1 = postsynapse
+    connector_xyz :     float32 (M, 3), nm
+    """
+
+    def __init__(self, skeleton_id, treenode_id, parent, xyz, radius = None,
+                 connector_id = None, connector_node = None, relation = None, connector_xyz = None,
+                 soma = None, neuron_name = None, parent_dist = None):
+
+        self.skeleton_id = skeleton_id
+        self.neuron_name = str(skeleton_id) if neuron_name is None else neuron_name
+
+        self.treenode_id = np.ascontiguousarray(treenode_id, dtype = np.int64)
+        self.parent = np.ascontiguousarray(parent, dtype = np.int64)
+        self.xyz = np.ascontiguousarray(xyz, dtype = np.float32).reshape(-1, 3)
+
+        n = len(self.treenode_id)
+        self.radius = np.full(n, -1, dtype = np.float32) if radius is None else np.ascontiguousarray(radius, dtype = np.float32)
+
+        if parent_dist is None:
+            has_parent = self.parent >= 0
+            parent_dist = np.zeros(n, dtype = np.float32)
+            d = self.xyz[has_parent].astype(np.float64) - self.xyz[self.parent[has_parent]]
+            parent_dist[has_parent] = np.sqrt((d**2).sum(axis = 1))
+        self.parent_dist = np.ascontiguousarray(parent_dist, dtype = np.float32)
+
+        m = 0 if connector_id is None else len(connector_id)
+        self.connector_id = np.ascontiguousarray(np.zeros(0) if connector_id is None else connector_id, dtype = np.int64)
+        self.connector_node = np.ascontiguousarray(np.zeros(0) if connector_node is None else connector_node, dtype = np.int64)
+        self.relation = np.ascontiguousarray(np.zeros(0) if relation is None else relation, dtype = np.int8)
+        self.connector_xyz = (np.zeros((m, 3), dtype = np.float32) if connector_xyz is None
+                              else np.ascontiguousarray(connector_xyz, dtype = np.float32).reshape(-1, 3))
+
+        if np.any((self.connector_node < 0) | (self.connector_node >= n)):
+            raise ValueError('connector_node must be rows of treenodes of this skeleton')
+
+        self._soma = None if soma is None else int(np.flatnonzero(self.treenode_id == int(soma))[0])
+
+        self._reset()
+
+    def _reset(self):
+        self._children = None
+        self._nodes = None
+
+    def __len__(self):
+        return len(self.treenode_id)
+
+    def __repr__(self):
+        return '<Skeleton {} ({}): {} nodes, {} connectors>'.format(self.skeleton_id, self.neuron_name,
+                                                                     len(self), len(self.connector_id))
+
+    @property
+    def nbytes(self):
+        """ Memory used by the arrays """
+        return sum(a.nbytes for a in (self.treenode_id, self.parent, self.parent_dist, self.radius, self.xyz,
+                                      self.connector_id, self.connector_node, self.relation, self.connector_xyz))
+
+    @classmethod
+    def from_tables(cls, skeleton_id, nodes, connectors = None, soma = None, neuron_name = None):
+        """ Builds a Skeleton from CatmaidNeuron-style node & connector tables.
+
+        Parameters
+        ----------
+        skeleton_id :   int
+        nodes :         pandas.DataFrame
+                        treenode_id, parent_id, x, y, z (& radius)
+        connectors :    pandas.DataFrame, optional
+                        treenode_id, connector_id, relation (& x, y, z). Connectors
+                        on treenodes that are not in nodes are dropped
+        soma :          int, optional
+                        treenode_id of the soma
+        neuron_name :   str, optional
+
+        Returns
+        -------
+        Skeleton
+        """
+
+        parent = parent_index(nodes)
+        radius = nodes.radius.values if 'radius' in nodes else None
+
+        kwargs = {}
+        if connectors is not None and len(connectors):
+            row = ps.Index(nodes.treenode_id.values.astype(np.int64))
+            connector_node = row.get_indexer(connectors.treenode_id.values.astype(np.int64))
+
+            #e.g. on treenodes removed by downsampling without preserve_cn_treenodes
+            found = connector_node >= 0
+            if not found.all():
+                logger.warning('Skeleton %s: dropping %i connectors on treenodes that are not in the node table',
+                               skeleton_id, (~found).sum())
+
+            kwargs = dict(connector_id = connectors.connector_id.values[found],
+                          connector_node = connector_node[found],
+                          relation = connectors.relation.values[found],
+                          connector_xyz = connectors[['x','y','z']].values[found] if 'x' in connectors else None)
+
+        return cls(skeleton_id, nodes.treenode_id.values, parent, nodes[['x','y','z']].values,
+                   radius = radius, soma = soma, neuron_name = neuron_name,
+                   parent_dist = parent_distances(nodes, parent), **kwargs)
+
+    @classmethod
+    def from_neuron(cls, x):
+        """ Builds a Skeleton from a CatmaidNeuron """
+
+        soma = x.soma
+        if isinstance(soma, (list, np.ndarray)):
+            soma = soma[0] if len(soma) else None
+
+        return cls.from_tables(int(x.skeleton_id), x.nodes, x.connectors, soma = soma,
+                               neuron_name = getattr(x, 'neuron_name', None))
+
+    def to_neuron(self):
+        """ Converts back to a pymaid CatmaidNeuron """
+
+        tags = {'soma':[self.soma]} if self.soma is not None else {}
+
+        return neuron_from_tables(self.skeleton_id, self.nodes.drop(columns = 'parent_dist'),
+                                  self.connectors, neuron_name = self.neuron_name, tags = tags)
+
+    @property
+    def children(self):
+        """ Children of every node in CSR form (indptr, indices),
+        see Skeleton_Data.tree.children """
+        if self._children is None:
+            self._children = children(self.parent)
+        return self._children
+
+    @property
+    def soma(self):
+        """ treenode_id of the soma (None if unknown) """
+        return None if self._soma is None else int(self.treenode_id[self._soma])
+
+    @property
+    def root(self):
+        """ treenode_id of the root """
+        return int(self.treenode_id[np.flatnonzero(self.parent < 0)[0]])
+
+    def reroot(self, treenode_id):
+        """ Makes the given treenode the root, in place, by reversing the parent
+        pointers on the path between it and the current root """
+
+        new_root = int(np.flatnonzero(self.treenode_id == int(treenode_id))[0])
+
+        path = [new_root]
+        while self.parent[path[-1]] >= 0:
+            path.append(int(self.parent[path[-1]]))
+        path = np.array(path, dtype = np.int64)
+
+        dist = self.parent_dist[path].copy()
+
+        #Arrays mapped read-only from a SkeletonStore are copied first
+        if not self.parent.flags.writeable:
+            self.parent = self.parent.copy()
+        if not self.parent_dist.flags.writeable:
+            self.parent_dist = self.parent_dist.copy()
+
+        self.parent[path[1:]] = path[:-1]
+        self.parent[new_root] = -1
+        self.parent_dist[path[1:]] = dist[:-1]
+        self.parent_dist[new_root] = 0
+
+        self._reset()
+
+    @property
+    def nodes(self):
+        """ Node table in the format of CatmaidNeuron.nodes (parent_dist in µm,
+        like pymaid.calc_cable). Built on first access. """
+
+        if self._nodes is None:
+            parent_id = np.where(self.parent >= 0, self.treenode_id[self.parent], -1)
+            self._nodes = ps.DataFrame({'treenode_id':self.treenode_id,
+                                        'parent_id':ps.Series(parent_id, dtype = object).where(self.parent >= 0, None),
+                                        'x':self.xyz[:, 0], 'y':self.xyz[:, 1], 'z':self.xyz[:, 2],
+                                        'radius':self.radius,
+                                        'parent_dist':self.parent_dist / 1000})
+        return self._nodes
+
+    @property
+    def connectors(self):
+        """ Connector table in the format of CatmaidNeuron.connectors """
+
+        return ps.DataFrame({'treenode_id':self.treenode_id[self.connector_node],
+                             'connector_id':self.connector_id,
+                             'relation':self.relation.astype(np.int64),
+                             'x':self.connector_xyz[:, 0],
+                             'y':self.connector_xyz[:, 1],
+                             'z':self.connector_xyz[:, 2]})
+
+
+def tree_arrays(x):
+    """ Parent index & parent distance (nm) arrays of a Skeleton or a node table
+
+    Parameters
+    ----------
+    x :     Skeleton | pandas.DataFrame
+
+    Returns
+    -------
+    parent, parent_dist : numpy.ndarray
+    """
+
+    if isinstance(x, Skeleton):
+        return x.parent, x.parent_dist.astype(np.float64)
+
+    parent = parent_index(x)
+
+    return parent, parent_distances(x, parent)
@@ -0,0 +1,352 @@
+#Local store of many skeletons, for random access to any of them without pymaid or a server.
+#
+#Every array of a Skeleton (treenode_id, parent, xyz, ... see skeleton.py) is one flat binary
+#file in the store folder, holding the arrays of all skeletons one after another. An sqlite
+#index has the offset & length of every skeleton in these files. Opening a skeleton maps the
+#files into memory (once per process) and slices them, so nothing is read or copied until it
+#is used, and worker processes opening the same skeletons share the pages of the operating
+#system's file cache. The files are mapped read-only; Skeleton.reroot copies the arrays it
+#changes, so rerooting a skeleton does not change the store.
+#
+#Treenodes without a radius (CATMAID's default of -1) are given one estimated from the
+#connectors (see radii.py) when they are stored, so stored skeletons are ready for the
+#electrotonic code.
+#
+#New skeletons are appended to the end of the files. Storing a skeleton that is already in
+#the store appends the new version and points the index at it; compact() drops the old
+#versions. Only one process should write at a time (writes are serialised by the index),
+#and compact() must not run while others are reading.
+
+import os
+import sqlite3
+
+import numpy as np
+
+from Skeleton_Data.skeleton import Skeleton
+from Skeleton_Data.radii import skeleton_radii
+from Skeleton_Data.instrument import progress
+
+#name, dtype & values per row of every array
+NODE_FIELDS = [('treenode_id', np.int64, 1),
+               ('parent', np.int64, 1),
+               ('parent_dist', np.float32, 1),
+               ('radius', np.float32, 1),
+               ('xyz', np.float32, 3)]
+
+CONNECTOR_FIELDS = [('connector_id', np.int64, 1),
+                    ('connector_node', np.int64, 1),
+                    ('relation', np.int8, 1),
+                    ('connector_xyz', np.float32, 3)]
+
+
+#Stores opened by open_store, by folder
+_OPEN = {}
+
+
+def open_store(path):
+    """ SkeletonStore of a folder, opened only once per process (e.g. in the
+    workers of batch_electrotonic_properties) """
+
+    path = os.path.abspath(path)
+    if path not in _OPEN:
+        _OPEN[path] = SkeletonStore(path)
+    return _OPEN[path]
+
+
+class SkeletonStore:
+    """ Skeletons packed into flat memory-mapped files with an index by
+    skeleton_id (see top of this file).
+
+    Parameters
+    ----------
+    path :      str
+                Store folder, created if necessary
+
+    Examples
+    --------
+    >>> store = SkeletonStore('lineage_store')
+    >>> store.add(nl)                   # CatmaidNeurons or Skeletons
+    >>> sk = store.get(16)              # a Skeleton, without copying its arrays
+    >>> plot_nx(sk, prog = 'tree')
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        os.makedirs(path, exist_ok = True)
+
+        with self._index() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS skeletons '
+                       '(skeleton_id INTEGER PRIMARY KEY, neuron_name TEXT, soma INTEGER, '
+                       'node_start INTEGER, n_nodes INTEGER, connector_start INTEGER, n_connectors INTEGER)')
+            db.execute('CREATE TABLE IF NOT EXISTS extent (n_nodes INTEGER, n_connectors INTEGER)')
+            if db.execute('SELECT COUNT(*) FROM extent').fetchone()[0] == 0:
+                db.execute('INSERT INTO extent VALUES (0, 0)')
+
+        self.refresh()
+
+    def __reduce__(self):
+        #Worker processes open the store (once) and map the files themselves
+        return open_store, (self.path,)
+
+    def __repr__(self):
+        return '<SkeletonStore of {} skeletons ({:.1f} MB) at {}>'.format(len(self), self.size / 1e6, self.path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, skeleton_id):
+        return int(skeleton_id) in self._entries
+
+    def __iter__(self):
+        return self.iter_skeletons()
+
+    @property
+    def skeleton_ids(self):
+        """ skeleton_ids in the store, in the order they were stored """
+        return sorted(self._entries, key = lambda s: self._entries[s][2])
+
+    @property
+    def size(self):
+        """ Total size of the files in bytes, including old versions """
+        return sum(os.path.getsize(self._file(name)) for name, _, _ in NODE_FIELDS + CONNECTOR_FIELDS
+                   if os.path.exists(self._file(name)))
+
+    def _index(self):
+        return sqlite3.connect(os.path.join(self.path, 'index.sqlite'), timeout = 60)
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def refresh(self):
+        """ Reloads the index, e.g. to see skeletons stored by other processes
+        since this store was opened """
+
+        with self._index() as db:
+            rows = db.execute('SELECT skeleton_id, neuron_name, soma, node_start, n_nodes, connector_start, n_connectors '
+                              'FROM skeletons').fetchall()
+
+        self._entries = {r[0]: r[1:] for r in rows}
+        self._arrays = None
+
+    def _map(self):
+        """ All files, mapped into memory (read-only) """
+
+        if self._arrays is None:
+            arrays = {}
+            for name, dtype, width in NODE_FIELDS + CONNECTOR_FIELDS:
+                file = self._file(name)
+                n = os.path.getsize(file) // (np.dtype(dtype).itemsize * width) if os.path.exists(file) else 0
+                shape = (n, width) if width > 1 else (n,)
+                arrays[name] = np.memmap(file, dtype = dtype, mode = 'r', shape = shape) if n else np.zeros(shape, dtype = dtype)
+            self._arrays = arrays
+
+        return self._arrays
+
+    def n_nodes(self, skeleton_id):
+        """ Number of treenodes of a stored skeleton """
+        return self._entry(skeleton_id)[3]
+
+    def _entry(self, skeleton_id):
+        entry = self._entries.get(int(skeleton_id))
+        if entry is None:
+            self.refresh()
+            entry = self._entries.get(int(skeleton_id))
+        if entry is None:
+            raise KeyError('Skeleton {} is not in the store'.format(skeleton_id))
+        return entry
+
+    def get(self, skeleton_id):
+        """ A stored skeleton, its arrays mapped from disk without copying.
+
+        Parameters
+        ----------
+        skeleton_id :   int
+
+        Returns
+        -------
+        Skeleton
+        """
+
+        neuron_name, soma, node_start, n_nodes, connector_start, n_connectors = self._entry(skeleton_id)
+
+        a = self._map()
+        n = slice(node_start, node_start + n_nodes)
+        c = slice(connector_start, connector_start + n_connectors)
+
+        sk = Skeleton(int(skeleton_id), a['treenode_id'][n], a['parent'][n], a['xyz'][n], radius = a['radius'][n],
+                      connector_id = a['connector_id'][c], connector_node = a['connector_node'][c],
+                      relation = a['relation'][c], connector_xyz = a['connector_xyz'][c],
+                      neuron_name = neuron_name, parent_dist = a['parent_dist'][n])
+
+        #The row of the soma is stored, so its treenode_id does not have to be looked up
+        sk._soma = soma
+
+        return sk
+
+    def iter_skeletons(self, skeleton_ids = None):
+        """ Yields stored skeletons (all of them by default) """
+
+        for skid in (self.skeleton_ids if skeleton_ids is None else skeleton_ids):
+            yield self.get(skid)
+
+    def add(self, neurons):
+        """ Appends skeletons to the store, in a single write. Skeletons that are
+        already in the store are replaced. Radii that are not set are estimated
+        (see Skeleton_Data/radii.py).
+
+        Parameters
+        ----------
+        neurons :   Skeleton | CatmaidNeuron | list of these
+        """
+
+        if isinstance(neurons, Skeleton):
+            neurons = [neurons]
+        elif not isinstance(neurons, (list, tuple)):
+            import pymaid
+            if isinstance(neurons, pymaid.CatmaidNeuron):
+                neurons = [neurons]
+
+        skeletons = [x if isinstance(x, Skeleton) else Skeleton.from_neuron(x) for x in neurons]
+        if not skeletons:
+            return
+
+        #Estimated before the index is locked
+        radii = [skeleton_radii(sk).values for sk in skeletons]
+
+        with self._index() as db:
+            #Blocks other writers until this write is committed
+            db.execute('BEGIN IMMEDIATE')
+
+            node_end, connector_end = db.execute('SELECT n_nodes, n_connectors FROM extent').fetchone()
+
+            rows = []
+            node_start, connector_start = node_end, connector_end
+            for sk in skeletons:
+                rows.append((int(sk.skeleton_id), sk.neuron_name, sk._soma,
+                             node_start, len(sk), connector_start, len(sk.connector_id)))
+                node_start += len(sk)
+                connector_start += len(sk.connector_id)
+
+            for fields, end in ((NODE_FIELDS, node_end), (CONNECTOR_FIELDS, connector_end)):
+                for name, dtype, width in fields:
+                    data = np.concatenate([np.asarray(r if name == 'radius' else getattr(sk, name), dtype = dtype).reshape(-1)
+                                           for sk, r in zip(skeletons, radii)])
+                    self._append(name, end * np.dtype(dtype).itemsize * width, data)
+
+            db.executemany('INSERT OR REPLACE INTO skeletons VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            db.execute('UPDATE extent SET n_nodes = ?, n_connectors = ?', (node_start, connector_start))
+
+        self.refresh()
+
+    def _append(self, name, offset, data):
+        #Anything beyond the last committed skeleton is left over from an interrupted write
+        with open(self._file(name), 'ab') as f:
+            f.truncate(offset)
+            f.write(data.tobytes())
+
+    def compact(self):
+        """ Rewrites the files without old versions of replaced skeletons. No
+        other process may read the store meanwhile. """
+
+        skids = self.skeleton_ids
+        a = self._map()
+
+        with self._index() as db:
+            db.execute('BEGIN IMMEDIATE')
+
+            rows, nodes, connectors = [], [], []
+            node_start, connector_start = 0, 0
+            for skid in skids:
+                neuron_name, soma, ns, nn, cs, nc = self._entries[skid]
+                rows.append((skid, neuron_name, soma, node_start, nn, connector_start, nc))
+                nodes.append(slice(ns, ns + nn))
+                connectors.append(slice(cs, cs + nc))
+                node_start += nn
+                connector_start += nc
+
+            for fields, slices in ((NODE_FIELDS, nodes), (CONNECTOR_FIELDS, connectors)):
+                for name, dtype, width in fields:
+                    tmp = self._file(name) + '.tmp'
+                    with open(tmp, 'wb') as f:
+                        for s in slices:
+                            f.write(np.ascontiguousarray(a[name][s]).tobytes())
+
+            self._arrays = None
+            a = None
+
+            for name, _, _ in NODE_FIELDS + CONNECTOR_FIELDS:
+                os.replace(self._file(name) + '.tmp', self._file(name))
+
+            db.execute('DELETE FROM skeletons')
+            db.executemany('INSERT INTO skeletons VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            db.execute('UPDATE extent SET n_nodes = ?, n_connectors = ?', (node_start, connector_start))
+
+        self.refresh()
+
+
+def import_neurons(x, store, fetcher = None, batch_size = 100, skip_existing = False, errors = 'skip'):
+    """ Downloads neurons into a SkeletonStore, as they arrive, in batches.
+
+    Parameters
+    ----------
+    x :             list of int | CatmaidNeuronList
+    store :         SkeletonStore
+    fetcher :       CatmaidFetcher, optional
+                    Downloads skeletons concurrently. Defaults to one using pymaid's
+                    CATMAID connection
+    batch_size :    int
+                    Neurons written at once
+    skip_existing : bool
+                    Do not download neurons that are already in the store
+    errors :        {'skip','raise'}
+                    What to do with skeletons that could not be fetched
+
+    Returns
+    -------
+    list of int
+                    skeleton_ids that were stored
+
+    Examples
+    --------
+    >>> store = SkeletonStore('lineage_store')
+    >>> import_neurons(skids, store, fetcher = fetcher)
+    >>> segment_matrix = batch_electrotonic_properties(skids, store = store)
+    """
+
+    import pymaid
+    from Skeleton_Data.fetch import CatmaidFetcher
+
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+
+    if isinstance(x, pymaid.CatmaidNeuronList):
+        neurons = iter(x)
+        n_neurons = len(x)
+    else:
+        skids = [int(s) for s in x]
+        if skip_existing:
+            skids = [s for s in skids if s not in store]
+        if fetcher is None:
+            fetcher = CatmaidFetcher.from_pymaid(max_workers = 8)
+        neurons = fetcher.iter_neurons(skids, errors = errors)
+        n_neurons = len(skids)
+
+    progress('Storing %i neurons in %s...', n_neurons, store.path)
+
+    stored, batch = [], []
+    for neuron in neurons:
+        batch.append(Skeleton.from_neuron(neuron))
+        if len(batch) == batch_size:
+            store.add(batch)
+            stored += [sk.skeleton_id for sk in batch]
+            progress('%i of %i neurons stored', len(stored), n_neurons)
+            batch = []
+
+    if batch:
+        store.add(batch)
+        stored += [sk.skeleton_id for sk in batch]
+
+    progress('Stored %i neurons', len(stored))
+
+    return stored
@@ -0,0 +1,300 @@
+#Array primitives for rooted skeleton trees.
+#
+#A CATMAID skeleton is a tree: every treenode has exactly one parent, except the root.
+#Instead of walking the tree in Python (or building a networkx graph), everything here
+#works on a single 'parent index' array, where parent[i] is the row of node i's parent
+#and -1 marks the root. Whole-tree quantities are then computed with numpy using
+#pointer jumping, which needs only ~log2(tree depth) vectorised passes, or with
+#scipy's compiled graph traversal.
+
+import numpy as np
+import pandas as ps
+
+
+def parent_index(nodes):
+    """ Converts the treenode_id/parent_id columns of a node table into
+    a parent index array.
+
+    Parameters
+    ----------
+    nodes :     pandas.DataFrame
+                Node table of a CatmaidNeuron (needs treenode_id & parent_id)
+
+    Returns
+    -------
+    numpy.ndarray
+                int64 array; parent[i] is the row of node i's parent, -1 for the root
+    """
+
+    ids = ps.Index(nodes.treenode_id.values.astype(np.int64))
+
+    #Root nodes have parent_id None/NaN - these are coerced to NaN and won't be found
+    parents = ps.to_numeric(nodes.parent_id, errors = 'coerce').values
+
+    return ids.get_indexer(parents).astype(np.int64)
+
+
+def parent_distances(nodes, parent):
+    """ Euclidean distance (in the units of x/y/z, i.e. nm) from each node
+    to its parent. The root has a distance of 0.
+
+    Parameters
+    ----------
+    nodes :     pandas.DataFrame
+                Node table with x, y & z columns
+    parent :    numpy.ndarray
+                Parent index array, see parent_index()
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    xyz = nodes[['x','y','z']].values.astype(np.float64)
+
+    has_parent = parent >= 0
+
+    dist = np.zeros(len(parent), dtype = np.float64)
+    dist[has_parent] = np.sqrt(((xyz[has_parent] - xyz[parent[has_parent]])**2).sum(axis = 1))
+
+    return dist
+
+
+def accumulate_to_root(parent, values):
+    """ Sums values along the path from every node to the root (inclusive).
+
+    Uses pointer jumping: each pass adds the sum accumulated by the current
+    ancestor and then jumps to that ancestor's ancestor, so the number of passes
+    is logarithmic in the depth of the tree.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array, see parent_index()
+    values :    numpy.ndarray
+                One value (or row of values) per node
+
+    Returns
+    -------
+    numpy.ndarray
+                Same shape as values
+    """
+
+    acc = np.array(values, dtype = np.float64)
+    jump = np.asarray(parent, dtype = np.int64).copy()
+
+    active = np.flatnonzero(jump >= 0)
+
+    while len(active):
+        up = jump[active]
+        acc[active] += acc[up]
+        jump[active] = jump[up]
+        active = active[jump[active] >= 0]
+
+    return acc
+
+
+def distance_to_root(parent, parent_dist):
+    """ Cumulative geodesic distance from every node to the root.
+
+    Parameters
+    ----------
+    parent :        numpy.ndarray
+                    Parent index array, see parent_index()
+    parent_dist :   numpy.ndarray
+                    Distance from each node to its parent (0 for the root)
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    return accumulate_to_root(parent, parent_dist)
+
+
+def depth(parent):
+    """ Number of edges between every node and the root.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array, see parent_index()
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    steps = (np.asarray(parent) >= 0).astype(np.float64)
+
+    return accumulate_to_root(parent, steps).astype(np.int64)
+
+
+def children(parent):
+    """ Children of every node in compressed sparse row (CSR) form: the children
+    of node i are indices[indptr[i]:indptr[i+1]], in ascending row order.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array, see parent_index()
+
+    Returns
+    -------
+    indptr :    numpy.ndarray
+    indices :   numpy.ndarray
+    """
+
+    parent = np.asarray(parent, dtype = np.int64)
+
+    has_parent = np.flatnonzero(parent >= 0)
+    indices = has_parent[np.argsort(parent[has_parent], kind = 'stable')]
+
+    indptr = np.zeros(len(parent) + 1, dtype = np.int64)
+    np.cumsum(child_counts(parent), out = indptr[1:])
+
+    return indptr, indices
+
+
+def roots(parent):
+    """ Rows of the root node(s) """
+
+    return np.flatnonzero(np.asarray(parent) < 0)
+
+
+def depth_first_order(parent):
+    """ Nodes in depth-first (pre-)order, starting at the root. Every subtree
+    occupies a contiguous stretch of this order.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array of a tree with a single root
+
+    Returns
+    -------
+    numpy.ndarray
+                Rows of the nodes in depth-first order
+    """
+
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import depth_first_order as _dfo
+
+    root = roots(parent)
+    if len(root) != 1:
+        raise ValueError('Need a tree with a single root, found {} roots'.format(len(root)))
+
+    indptr, indices = children(parent)
+    n = len(parent)
+
+    adj = csr_matrix((np.ones(len(indices), dtype = np.int8), indices, indptr), shape = (n, n))
+
+    return _dfo(adj, root[0], directed = True, return_predecessors = False).astype(np.int64)
+
+
+def child_counts(parent):
+    """ Number of children of each node.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array, see parent_index()
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    parent = np.asarray(parent)
+
+    return np.bincount(parent[parent >= 0], minlength = len(parent))
+
+
+def subtree_sizes(parent):
+    """ Number of nodes in the subtree of every node, including the node itself.
+
+    The subtree of a node is a contiguous stretch of the depth-first order that
+    ends with the subtree of its last visited child, so its size follows from
+    pointer jumping along the last children.
+
+    Parameters
+    ----------
+    parent :    numpy.ndarray
+                Parent index array of a tree with a single root
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+
+    parent = np.asarray(parent, dtype = np.int64)
+    n = len(parent)
+
+    order = depth_first_order(parent)
+    pre = np.empty(n, dtype = np.int64)
+    pre[order] = np.arange(n)
+
+    has_parent = np.flatnonzero(parent >= 0)
+    last_child = np.full(n, -1, dtype = np.int64)
+    np.maximum.at(last_child, parent[has_parent], pre[has_parent])
+
+    #Last node of every subtree in the depth-first order
+    last = np.where(last_child < 0, np.arange(n), order[np.maximum(last_child, 0)])
+    while True:
+        nxt = last[last]
+        if np.array_equal(nxt, last):
+            break
+        last = nxt
+
+    return pre[last] - pre + 1
+
+
+def segments(parent, parent_dist = None):
+    """ Splits the tree into unbranched segments, the same way as the segments
+    of a CatmaidNeuron (and the review widget of CATMAID): each segment starts at
+    a leaf or branch point and runs towards the root until the next branch point
+    (or the root itself), which is included as its end node.
+
+    Parameters
+    ----------
+    parent :        numpy.ndarray
+                    Parent index array, see parent_index()
+    parent_dist :   numpy.ndarray, optional
+                    If given, segments are sorted by length (longest first),
+                    like pymaid does
+
+    Returns
+    -------
+    start :         numpy.ndarray
+                    Row of the distal (start) node of each segment
+    end :           numpy.ndarray
+                    Row of the proximal (end) node of each segment
+    """
+
+    parent = np.asarray(parent, dtype = np.int64)
+    n_children = child_counts(parent)
+
+    is_root = parent < 0
+
+    #Leaves and branch points start segments; branch points and the root end them
+    is_start = (n_children != 1) & ~is_root
+    is_stop = (n_children > 1) | is_root
+
+    #Every node points at the nearest 'stop' node at or above it
+    stop = np.where(is_stop, np.arange(len(parent)), parent)
+    while True:
+        nxt = stop[stop]
+        if np.array_equal(nxt, stop):
+            break
+        stop = nxt
+
+    start = np.flatnonzero(is_start)
+    end = stop[parent[start]]
+
+    if parent_dist is not None:
+        to_root = distance_to_root(parent, parent_dist)
+        order = np.argsort(-(to_root[start] - to_root[end]), kind = 'stable')
+        start = start[order]
+        end = end[order]
+
+    return start, end
@@ -0,0 +1,295 @@
+#Which treenodes lie inside a neuropil volume (e.g. mushroom body compartments).
+#
+#pymaid.in_volume fetches the volume mesh from CATMAID every time it is called. Here:
+#
+#  - meshes are fetched once per session, and once ever with a SkeletonCache (see
+#    cached_volume in cache.py)
+#  - the triangles of a mesh are binned into a uniform grid over the xy plane, once per
+#    volume. A point is inside if a ray from it in +z crosses the surface an odd number
+#    of times, and only the triangles of the grid cell the point falls into can be crossed
+#  - all points of a neuron are tested at once: points outside the bounding box of the
+#    mesh are discarded first, the rest are paired with the triangles of their cell and
+#    the crossings are counted with numpy
+#
+#Points on the surface (on a face, edge or vertex) count as inside. The ray alone would
+#decide these by which side of the surface a ray happens to start on, so they are found
+#separately: every triangle a point lies on is among the triangles of its cell.
+#
+#Meshes must be closed (watertight), as for pymaid.in_volume.
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.skeleton import Skeleton
+
+#Roughly this many (point, triangle) pairs are tested at a time
+CHUNK_PAIRS = 2000000
+
+#Points closer to the surface than this fraction of the size of the mesh are on it
+SURFACE_TOLERANCE = 1e-9
+
+#Meshes fetched in this session, by name
+_MESHES = {}
+
+
+class VolumeMesh:
+    """ A closed triangle mesh with a grid of its triangles for fast
+    point-in-mesh tests.
+
+    Parameters
+    ----------
+    vertices :  numpy.ndarray
+                (N, 3) vertex coordinates (nm)
+    faces :     numpy.ndarray
+                (M, 3) vertex indices of the triangles
+    name :      str, optional
+
+    Examples
+    --------
+    >>> mesh = get_volume('MB_CA_R')
+    >>> inside = mesh.contains(x.nodes[['x','y','z']].values)
+    """
+
+    def __init__(self, vertices, faces, name = None):
+        vertices = np.asarray(vertices, dtype = np.float64).reshape(-1, 3)
+        faces = np.asarray(faces, dtype = np.int64).reshape(-1, 3)
+
+        if len(faces) == 0:
+            raise ValueError('Volume {} has no faces'.format(name))
+
+        self.name = name
+        self.triangles = vertices[faces]
+        self.bbox_min = vertices.min(axis = 0)
+        self.bbox_max = vertices.max(axis = 0)
+        self._grid = None
+
+    def __repr__(self):
+        return '<VolumeMesh {} of {} triangles>'.format(self.name, len(self.triangles))
+
+    @classmethod
+    def from_triangles(cls, triangles, name = None):
+        """ From an (M, 3, 3) array of triangle corners, as stored by cached_volume """
+
+        triangles = np.asarray(triangles, dtype = np.float64).reshape(-1, 3, 3)
+
+        return cls(triangles.reshape(-1, 3), np.arange(3 * len(triangles)).reshape(-1, 3), name = name)
+
+    @classmethod
+    def from_pymaid(cls, volume, name = None):
+        """ From what pymaid.get_volume returns (a Volume, or a dict of
+        vertices & faces in older versions) """
+
+        if isinstance(volume, dict):
+            return cls(volume['vertices'], volume['faces'], name = name)
+
+        return cls(volume.vertices, volume.faces, name = name or getattr(volume, 'name', None))
+
+    def _build_grid(self):
+        """ Bins the triangles into cells of a uniform grid over the xy plane
+        (a triangle goes into every cell its xy bounding box touches) """
+
+        t = self.triangles
+        lo = self.bbox_min[:2]
+        extent = np.maximum(self.bbox_max[:2] - lo, 1e-9)
+
+        #About one cell per triangle
+        n_cells = np.clip(np.ceil(np.sqrt(len(t)) * extent / np.sqrt(extent.prod())), 1, 4096).astype(np.int64)
+        cell_size = extent / n_cells
+
+        c0 = np.clip(((t[:, :, :2].min(axis = 1) - lo) // cell_size).astype(np.int64), 0, n_cells - 1)
+        c1 = np.clip(((t[:, :, :2].max(axis = 1) - lo) // cell_size).astype(np.int64), 0, n_cells - 1)
+
+        #One (triangle, cell) pair per covered cell
+        span = c1 - c0 + 1
+        count = span[:, 0] * span[:, 1]
+        tri = np.repeat(np.arange(len(t)), count)
+        k = np.arange(len(tri)) - np.repeat(np.cumsum(count) - count, count)
+        cx = c0[tri, 0] + k % span[tri, 0]
+        cy = c0[tri, 1] + k // span[tri, 0]
+        cell = cx * n_cells[1] + cy
+
+        order = np.argsort(cell, kind = 'stable')
+        start = np.searchsorted(cell[order], np.arange(n_cells.prod() + 1))
+
+        self._grid = (lo, cell_size, n_cells, tri[order], start)
+
+    def contains(self, points):
+        """ Which points are inside the mesh. Points on its surface are inside.
+
+        Parameters
+        ----------
+        points :    numpy.ndarray
+                    (N, 3) coordinates (nm)
+
+        Returns
+        -------
+        numpy.ndarray
+                    Boolean mask over points
+        """
+
+        points = np.asarray(points, dtype = np.float64).reshape(-1, 3)
+        inside = np.zeros(len(points), dtype = bool)
+
+        #Bounding box prefilter
+        rows = np.flatnonzero(np.all((points >= self.bbox_min) & (points <= self.bbox_max), axis = 1))
+        if len(rows) == 0:
+            return inside
+
+        if self._grid is None:
+            self._build_grid()
+        lo, cell_size, n_cells, cell_tri, start = self._grid
+
+        #Rays that pass exactly through an edge or vertex would be counted twice; shifting
+        #them by a tiny, irregular amount makes that practically impossible
+        shift = 1e-7 * cell_size * np.array([0.5377, 0.8431])
+
+        p = points[rows]
+        c = np.minimum(((p[:, :2] - lo) // cell_size).astype(np.int64), n_cells - 1)
+        cell = c[:, 0] * n_cells[1] + c[:, 1]
+        n_candidates = start[cell + 1] - start[cell]
+
+        crossings = np.zeros(len(p), dtype = np.int64)
+        on_surface = np.zeros(len(p), dtype = bool)
+        tolerance = SURFACE_TOLERANCE * np.linalg.norm(self.bbox_max - self.bbox_min)
+
+        #Chunks of points, so that memory stays bounded for large neurons & meshes
+        bounds = np.searchsorted(np.cumsum(n_candidates), np.arange(0, n_candidates.sum(), CHUNK_PAIRS), side = 'right')
+        bounds = np.unique(np.append(bounds, len(p)))
+
+        for a, b in zip(np.append(0, bounds[:-1]), bounds):
+            count = n_candidates[a:b]
+            pt = np.repeat(np.arange(a, b), count)
+            k = np.arange(len(pt)) - np.repeat(np.cumsum(count) - count, count)
+            tri = self.triangles[cell_tri[start[cell[pt]] + k]]
+
+            q = p[pt, :2] + shift
+            A, B, C = tri[:, 0], tri[:, 1], tri[:, 2]
+
+            #Edge functions: the point is inside the projected triangle if all have the same sign
+            w_a = (C[:, 0] - B[:, 0]) * (q[:, 1] - B[:, 1]) - (C[:, 1] - B[:, 1]) * (q[:, 0] - B[:, 0])
+            w_b = (A[:, 0] - C[:, 0]) * (q[:, 1] - C[:, 1]) - (A[:, 1] - C[:, 1]) * (q[:, 0] - C[:, 0])
+            w_c = (B[:, 0] - A[:, 0]) * (q[:, 1] - A[:, 1]) - (B[:, 1] - A[:, 1]) * (q[:, 0] - A[:, 0])
+            area = w_a + w_b + w_c
+
+            hit = (((w_a > 0) & (w_b > 0) & (w_c > 0)) | ((w_a < 0) & (w_b < 0) & (w_c < 0))) & (area != 0)
+
+            #Height of the surface above the point
+            z = (w_a[hit] * A[hit, 2] + w_b[hit] * B[hit, 2] + w_c[hit] * C[hit, 2]) / area[hit]
+            above = z > p[pt[hit], 2]
+
+            crossings += np.bincount(pt[hit][above], minlength = len(p))
+
+            #Only points within the z range of a triangle can lie on it
+            pz = p[pt, 2]
+            near = np.flatnonzero((pz >= np.minimum(np.minimum(A[:, 2], B[:, 2]), C[:, 2]) - tolerance)
+                                  & (pz <= np.maximum(np.maximum(A[:, 2], B[:, 2]), C[:, 2]) + tolerance))
+            on_surface[pt[near[_on_triangles(p[pt[near]], tri[near], tolerance)]]] = True
+
+        inside[rows] = (crossings % 2 == 1) | on_surface
+
+        return inside
+
+
+def _on_triangles(points, triangles, tolerance):
+    """ Whether each point lies on the triangle paired with it (within
+    tolerance of its plane, and inside or on its edges) """
+
+    A = triangles[:, 0]
+    e0 = triangles[:, 1] - A
+    e1 = triangles[:, 2] - A
+    v = points - A
+
+    normal = np.cross(e0, e1)
+    norm = np.sqrt((normal**2).sum(axis = 1))
+
+    #Barycentric coordinates of the point projected onto the plane
+    d00 = (e0 * e0).sum(axis = 1)
+    d01 = (e0 * e1).sum(axis = 1)
+    d11 = (e1 * e1).sum(axis = 1)
+    d20 = (v * e0).sum(axis = 1)
+    d21 = (v * e1).sum(axis = 1)
+    denom = d00 * d11 - d01**2
+
+    #Degenerate triangles have no area to lie on
+    valid = (norm > 0) & (denom > 0)
+    denom = np.where(valid, denom, 1)
+
+    b1 = (d11 * d20 - d01 * d21) / denom
+    b2 = (d00 * d21 - d01 * d20) / denom
+
+    #Barycentric slack that corresponds to the tolerance along the shortest altitude
+    slack = tolerance * np.sqrt(np.maximum(d00, np.maximum(d11, ((e1 - e0)**2).sum(axis = 1)))) / np.where(valid, norm, 1)
+
+    in_plane = np.abs((v * normal).sum(axis = 1)) <= tolerance * norm
+
+    return valid & in_plane & (b1 >= -slack) & (b2 >= -slack) & (b1 + b2 <= 1 + slack)
+
+
+def get_volume(volume, cache = None, remote_instance = None):
+    """ A CATMAID volume as VolumeMesh, fetched at most once per session
+    (or once ever, with a cache).
+
+    Parameters
+    ----------
+    volume :            str | VolumeMesh
+                        Name of the volume in CATMAID
+    cache :             SkeletonCache, optional
+                        Keep the mesh on disk
+    remote_instance :   CatmaidInstance, optional
+
+    Returns
+    -------
+    VolumeMesh
+    """
+
+    if isinstance(volume, VolumeMesh):
+        return volume
+
+    if volume not in _MESHES:
+        if cache is None:
+            import pymaid
+            _MESHES[volume] = VolumeMesh.from_pymaid(pymaid.get_volume(volume, remote_instance = remote_instance),
+                                                     name = volume)
+        else:
+            from Skeleton_Data.cache import cached_volume
+            _MESHES[volume] = VolumeMesh.from_triangles(cached_volume(volume, cache, remote_instance = remote_instance),
+                                                        name = volume)
+
+    return _MESHES[volume]
+
+
+def in_volumes(x, volumes, cache = None, remote_instance = None):
+    """ Which treenodes of a neuron are inside each of several volumes.
+    Unlike pymaid.in_volume, the neuron is not modified.
+
+    Parameters
+    ----------
+    x :                 CatmaidNeuron | Skeleton | pandas.DataFrame
+                        Neuron or node table (treenode_id, x, y, z)
+    volumes :           str | VolumeMesh | list of these
+    cache :             SkeletonCache, optional
+                        Keep fetched meshes on disk
+    remote_instance :   CatmaidInstance, optional
+
+    Returns
+    -------
+    pandas.DataFrame
+                        One boolean column per volume, indexed by treenode_id
+
+    Examples
+    --------
+    >>> inside = in_volumes(x, ['MB_CA_R', 'MB_PED_R'])
+    >>> inside.sum()
+    """
+
+    if isinstance(volumes, (str, VolumeMesh)):
+        volumes = [volumes]
+
+    meshes = [get_volume(v, cache = cache, remote_instance = remote_instance) for v in volumes]
+
+    nodes = x if isinstance(x, (Skeleton, ps.DataFrame)) else x.nodes
+    xyz = nodes.xyz if isinstance(nodes, Skeleton) else nodes[['x','y','z']].values
+
+    return ps.DataFrame({m.name:m.contains(xyz) for m in meshes},
+                        index = ps.Index(np.asarray(nodes.treenode_id).astype(np.int64), name = 'treenode_id'),
+                        columns = [m.name for m in meshes])
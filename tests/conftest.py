@@ -0,0 +1,6 @@
+#Tests are run from the top folder of this repository: python -m pytest -q
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
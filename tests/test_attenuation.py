@@ -0,0 +1,98 @@
+#Attenuation against the inverse of the dense conductance matrix of a small neuron
+
+import numpy as np
+import pytest
+
+from Electrotonic_Properties.attenuation import (input_resistances, transfer_resistances, node_attenuation,
+                                                 synapse_attenuation, synapse_transfer_matrix)
+from Electrotonic_Properties.passive_cable import PassiveCable
+from Skeleton_Data.skeleton import Skeleton
+
+#      0 (soma)
+#      |
+#      1
+#     / \
+#    2   3
+#    |  / \
+#    4 5   6
+PARENT = [-1, 0, 1, 1, 2, 3, 3]
+XYZ = [[0, 0, 0], [0, 2000, 0], [-1500, 4000, 0], [1500, 3500, 0], [-1500, 9000, 0], [500, 6000, 0], [4000, 5000, 0]]
+RADIUS = [2000, 300, 150, 200, 80, 100, 120]
+
+
+def small_neuron():
+    #Connectors 100 & 101 share treenode 14
+    return Skeleton(1, np.arange(10, 17), PARENT, XYZ, radius = RADIUS, soma = 10,
+                    connector_id = [100, 101, 102, 103, 104], connector_node = [4, 4, 5, 6, 2],
+                    relation = [1, 0, 1, 1, 0], connector_xyz = np.zeros((5, 3)))
+
+
+def inverse_conductance(cable):
+    G = np.diag(cable.g_membrane)
+    for i, p in enumerate(cable.parent):
+        if p >= 0:
+            g = cable.g_axial[i]
+            G[[i, p], [i, p]] += g
+            G[i, p] -= g
+            G[p, i] -= g
+    return np.linalg.inv(G)
+
+
+def test_node_resistances():
+    cable = PassiveCable.from_nodes(small_neuron())
+    Z = inverse_conductance(cable)
+
+    assert np.allclose(input_resistances(cable).values, np.diag(Z))
+    assert np.allclose(transfer_resistances(cable, 10).values, Z[:, 0])
+    assert np.allclose(node_attenuation(cable, 10).values, Z[:, 0] / np.diag(Z))
+
+
+def test_reciprocity():
+    #Current into the soma gives the transfer resistance of every node in one solve,
+    #because injecting at a node and recording at the soma gives the same
+    cable = PassiveCable.from_nodes(small_neuron())
+    transfer = transfer_resistances(cable, 10)
+
+    for tn in cable.treenode_id:
+        assert np.isclose(cable.steady_state(tn)[10], transfer[tn])
+
+    Z = inverse_conductance(cable)
+    assert np.allclose(Z, Z.T)
+
+
+def test_synapse_attenuation():
+    x = small_neuron()
+    cable = PassiveCable.from_nodes(x)
+    Z = inverse_conductance(cable)
+    rows = x.connector_node
+
+    att = synapse_attenuation(x, cable = cable)
+
+    assert list(att.index) == [100, 101, 102, 103, 104]
+    assert np.allclose(att['input_resistance (MΩ)'].values, np.diag(Z)[rows])
+    assert np.allclose(att['transfer_resistance (MΩ)'].values, Z[rows, 0])
+    assert np.allclose(att.attenuation.values, Z[rows, 0] / np.diag(Z)[rows])
+    assert (att.attenuation <= 1).all()
+
+    #Defaults to a full resolution model with the radii of the skeleton
+    assert np.allclose(synapse_attenuation(x).values, att.values)
+
+    #To another treenode than the soma
+    att = synapse_attenuation(x, cable = cable, target = 16)
+    assert np.allclose(att['transfer_resistance (MΩ)'].values, Z[rows, 6])
+
+
+def test_synapse_transfer_matrix():
+    x = small_neuron()
+    cable = PassiveCable.from_nodes(x)
+    Z = inverse_conductance(cable)
+
+    m = synapse_transfer_matrix(x, [102, 100, 104], cable = cable)
+
+    rows = [5, 4, 2]
+    assert list(m.index) == list(m.columns) == [102, 100, 104]
+    assert np.allclose(m.values, Z[np.ix_(rows, rows)])
+    assert np.allclose(np.diag(m.values), input_resistances(cable).values[rows])
+
+    with pytest.raises(ValueError):
+        synapse_transfer_matrix(x, [100, 999], cable = cable)
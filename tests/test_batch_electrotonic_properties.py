@@ -0,0 +1,28 @@
+#Batches of stored skeletons, which need neither pymaid nor a CATMAID server
+
+import sys
+
+import numpy as np
+
+from Electrotonic_Properties.batch_electrotonic_properties import batch_electrotonic_properties
+from Electrotonic_Properties.electrotonic_properties_dataframe import electrotonic_properties_dataframe
+from Skeleton_Data.store import SkeletonStore
+from Skeleton_Data.synthetic import synthetic_skeleton
+
+
+def test_store_only(tmp_path, monkeypatch):
+    #Any import of pymaid fails
+    monkeypatch.setitem(sys.modules, 'pymaid', None)
+
+    store = SkeletonStore(str(tmp_path))
+    store.add([synthetic_skeleton(400 * i, skeleton_id = i, seed = i) for i in (1, 2, 3)])
+
+    skids = [3, 1, 2]
+    segment_matrix = batch_electrotonic_properties(skids, store = store, n_cores = 1)
+
+    assert list(segment_matrix.skeleton_id.unique()) == skids
+    for skid in skids:
+        expected = electrotonic_properties_dataframe(store.get(skid))
+        result = segment_matrix[segment_matrix.skeleton_id == skid]
+        assert len(result) == len(expected)
+        assert np.allclose(result.ri.values, expected.ri.values)
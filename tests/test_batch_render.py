@@ -0,0 +1,25 @@
+#Headless dendrogram renders of a synthetic skeleton, with the 'tree' layout (no graphviz needed)
+
+import os
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pytest
+
+from Dendrogram_code.batch_render import render_neuron
+from Skeleton_Data.synthetic import synthetic_skeleton
+
+
+@pytest.mark.parametrize('fmt', ['svg', 'html'])
+def test_render(tmp_path, fmt):
+    path = str(tmp_path / 'neuron.{}'.format(fmt))
+    render_neuron(synthetic_skeleton(3000), path, fmt = fmt, prog = 'tree')
+
+    assert os.path.getsize(path) > 0
+    assert os.listdir(str(tmp_path)) == ['neuron.{}'.format(fmt)]
+
+    with open(path) as f:
+        text = f.read()
+
+    assert ('<svg' if fmt == 'svg' else 'Plotly.newPlot') in text
@@ -0,0 +1,116 @@
+#SkeletonCache against the FakeCatmaid stand-in
+
+import sys
+import time
+import types
+
+import numpy as np
+import pandas as ps
+
+from Skeleton_Data.cache import SkeletonCache, FakeCatmaid, cached_tables, node_table_digest, last_edition
+from Skeleton_Data.synthetic import synthetic_neuron
+
+
+def _source():
+    return FakeCatmaid({skid: synthetic_neuron(300, seed = skid) + ('neuron {}'.format(skid),) for skid in (1, 2)})
+
+
+def test_hit(tmp_path):
+    cache = SkeletonCache(str(tmp_path))
+    source = _source()
+
+    nodes, connectors = cached_tables(1, cache, source = source)
+    again, _ = cached_tables(1, cache, source = source)
+
+    assert source.n_downloads == 1
+    assert np.array_equal(again.treenode_id.values, nodes.treenode_id.values)
+    assert np.allclose(again[['x','y','z']].values, nodes[['x','y','z']].values)
+
+
+def test_edit(tmp_path):
+    cache = SkeletonCache(str(tmp_path))
+    source = _source()
+
+    nodes, _ = cached_tables(1, cache, source = source)
+    n_entries = len(cache)
+
+    moved = nodes.copy()
+    moved.loc[moved.index[5], 'x'] += 1000
+    source.edit(1, moved)
+
+    edited, _ = cached_tables(1, cache, source = source)
+
+    assert source.n_downloads == 2
+    assert edited.x.values[5] == nodes.x.values[5] + 1000
+    #The entries of the old edition were replaced
+    assert len(cache) == n_entries
+
+    #Other downsample factors are cached separately and do not replace each other
+    cached_tables(1, cache, source = source, downsample_factor = 10)
+    cached_tables(1, cache, source = source)
+    assert source.n_downloads == 3
+
+
+def test_lru_eviction(tmp_path):
+    table = ps.DataFrame({'a':np.arange(10000, dtype = np.float64)})
+
+    cache = SkeletonCache(str(tmp_path))
+    cache.put('table', 1, '0', table)
+    size = cache.size
+
+    cache.max_bytes = int(2.5 * size)
+    time.sleep(0.01)
+    cache.put('table', 2, '0', table)
+    time.sleep(0.01)
+    assert cache.get('table', 1, '0') is not None
+    time.sleep(0.01)
+    cache.put('table', 3, '0', table)
+
+    #Skeleton 2 was used least recently
+    assert len(cache) == 2
+    assert cache.size <= cache.max_bytes
+    assert cache.get('table', 2, '0') is None
+    assert cache.get('table', 1, '0') is not None
+    assert cache.get('table', 3, '0') is not None
+
+
+def test_digest():
+    nodes, connectors = synthetic_neuron(300)
+
+    digest = node_table_digest(nodes, connectors)
+    assert node_table_digest(nodes.copy(), connectors.copy()) == digest
+    assert node_table_digest(nodes) != digest
+
+    moved = connectors.copy()
+    moved.loc[moved.index[0], 'z'] += 40
+    assert node_table_digest(nodes, moved) != digest
+
+    relinked = connectors.copy()
+    relinked.loc[relinked.index[0], 'treenode_id'] = nodes.treenode_id.values[-1]
+    assert node_table_digest(nodes, relinked) != digest
+
+
+def test_last_edition(monkeypatch):
+    nodes, connectors = synthetic_neuron(300)
+    links = ps.DataFrame({'skeleton_id':1, 'connector_id':connectors.connector_id.values,
+                          'x':connectors.x.values, 'y':connectors.y.values, 'z':connectors.z.values,
+                          'node_id':connectors.treenode_id.values, 'relation':connectors.relation.values,
+                          'edition_time':'2020-01-01'})
+    state = {'cable':1234.5, 'links':links}
+
+    pymaid = types.ModuleType('pymaid')
+    pymaid.get_cable_lengths = lambda skids, remote_instance = None: {str(skids[0]): state['cable']}
+    pymaid.get_review = lambda skids, remote_instance = None: ps.DataFrame({'skeleton_id':skids,
+                                                                            'total_node_count':[len(nodes)]})
+    pymaid.get_connector_links = lambda skids, remote_instance = None: state['links'].copy()
+    monkeypatch.setitem(sys.modules, 'pymaid', pymaid)
+
+    edition = last_edition(1)
+    assert last_edition(1) == edition
+
+    state['links'] = links.assign(x = links.x + np.where(np.arange(len(links)) == 0, 100, 0))
+    assert last_edition(1) != edition
+
+    state['links'] = links
+    state['cable'] = 1300.0
+    assert last_edition(1) != edition
@@ -0,0 +1,34 @@
+#Layout of the target neuron of compare_dendrograms
+
+import numpy as np
+
+from Dendrogram_code import compare_dendrograms
+from Dendrogram_code.compare_dendrograms import target_layout
+from Dendrogram_code.tree_layout import tree_layout
+from Skeleton_Data.synthetic import synthetic_skeleton
+
+
+def test_native_layout():
+    sk = synthetic_skeleton(1000)
+
+    xy = target_layout(sk, prog = 'tree')
+
+    pos = tree_layout(sk.nodes, prog = 'tree')
+    assert np.array_equal(xy, [pos[tn] for tn in sk.nodes.treenode_id.values])
+
+
+def test_graphviz_layout(monkeypatch):
+    calls = []
+
+    def layout(nodes, prog = 'dot'):
+        calls.append(prog)
+        return {tn:(float(i), -float(i)) for i, tn in enumerate(nodes.treenode_id.values)}
+
+    monkeypatch.setattr(compare_dendrograms, 'graphviz_layout', layout)
+
+    sk = synthetic_skeleton(1000)
+    xy = target_layout(sk, prog = 'neato')
+
+    assert calls == ['neato']
+    assert np.array_equal(xy[:, 0], np.arange(len(sk)))
+    assert np.array_equal(xy[:, 1], -np.arange(len(sk)))
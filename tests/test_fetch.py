@@ -0,0 +1,77 @@
+#CatmaidFetcher against a local FakeCatmaidServer
+
+import time
+
+import numpy as np
+import pytest
+
+from Skeleton_Data.fetch import CatmaidFetcher
+from Skeleton_Data.fake_catmaid_server import FakeCatmaidServer
+from Skeleton_Data.synthetic import synthetic_neuron
+
+
+@pytest.fixture(scope = 'module')
+def skeletons():
+    return {skid: synthetic_neuron(200 + skid, seed = skid) for skid in range(1, 9)}
+
+
+def test_tables(skeletons):
+    with FakeCatmaidServer(skeletons) as server:
+        fetcher = CatmaidFetcher(server.url, project_id = 1)
+        fetched = fetcher.get_skeletons(skeletons)
+
+    assert sorted(fetched) == sorted(skeletons)
+    for skid, (nodes, connectors) in fetched.items():
+        assert np.array_equal(nodes.treenode_id.values, skeletons[skid][0].treenode_id.values)
+        assert np.allclose(nodes[['x','y','z']].values, skeletons[skid][0][['x','y','z']].values)
+        assert nodes.parent_id.isnull().sum() == 1
+        assert np.array_equal(connectors.connector_id.values, skeletons[skid][1].connector_id.values)
+
+
+def test_retry(skeletons):
+    with FakeCatmaidServer(skeletons, fail_first = 2) as server:
+        fetcher = CatmaidFetcher(server.url, project_id = 1, max_retries = 3, backoff = 0.01)
+        fetched = fetcher.get_skeletons(skeletons)
+
+        assert sorted(fetched) == sorted(skeletons)
+        assert server.n_requests == 3 * len(skeletons)
+
+
+def test_retries_exhausted(skeletons):
+    with FakeCatmaidServer(skeletons, fail_first = 5) as server:
+        fetcher = CatmaidFetcher(server.url, project_id = 1, max_retries = 1, backoff = 0.01)
+
+        with pytest.raises(Exception):
+            fetcher.get_skeleton(1)
+
+        assert dict(fetcher.get_skeletons([1, 2], errors = 'skip')) == {}
+
+
+def test_missing_skeleton(skeletons):
+    with FakeCatmaidServer(skeletons) as server:
+        fetcher = CatmaidFetcher(server.url, project_id = 1)
+
+        with pytest.raises(ValueError):
+            fetcher.get_skeleton(100)
+
+        assert sorted(fetcher.get_skeletons([1, 100, 2], errors = 'skip')) == [1, 2]
+
+
+def test_rate_limit(skeletons):
+    with FakeCatmaidServer(skeletons) as server:
+        fetcher = CatmaidFetcher(server.url, project_id = 1, max_workers = 4, rate = 20)
+        start = time.monotonic()
+        fetched = fetcher.get_skeletons(skeletons)
+        elapsed = time.monotonic() - start
+
+    assert len(fetched) == len(skeletons)
+    #A burst of max_workers requests right away, then one every 1/20 s
+    assert elapsed >= (len(skeletons) - 4) / 20 * 0.9
+
+
+def test_concurrency(skeletons):
+    with FakeCatmaidServer(skeletons, delay = 0.05) as server:
+        fetcher = CatmaidFetcher(server.url, project_id = 1, max_workers = 3)
+        fetcher.get_skeletons(skeletons)
+
+        assert server.max_concurrent <= 3
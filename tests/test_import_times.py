@@ -0,0 +1,10 @@
+#Importing the packages must stay fast and must not load the heavy plotting packages
+#or pymaid (see Benchmarks/import_times.py)
+
+from Benchmarks.import_times import import_times
+
+
+def test_import_times():
+    results = import_times(repeat = 3)
+
+    assert results.ok.all(), '\n' + results[~results.ok].to_string(index = False)
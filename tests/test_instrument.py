@@ -0,0 +1,39 @@
+#Stage timings & memory peaks (Skeleton_Data/instrument.py)
+
+import numpy as np
+
+from Skeleton_Data.instrument import recording, stage, collect, track_memory
+
+
+def test_nested_stage_peaks():
+    track_memory()
+    try:
+        with collect() as runs:
+            with recording('test'):
+                with stage('outer'):
+                    big = np.ones(10_000_000)      # 80 MB
+                    del big
+                    with stage('inner'):
+                        small = np.ones(1_000_000) # 8 MB
+                        del small
+    finally:
+        track_memory(False)
+
+    peaks = {s: m for s, _, m in runs[0].stages}
+
+    assert 7 < peaks['inner'] < 20
+    #The inner stage must not hide the larger peak before it
+    assert peaks['outer'] >= 79
+
+
+def test_stages_recorded():
+    with collect() as runs:
+        with recording('test', skeleton_id = 16):
+            with stage('a'):
+                pass
+            with stage('b'):
+                pass
+
+    assert runs[0].skeleton_id == 16
+    assert [s for s, _, _ in runs[0].stages] == ['a', 'b']
+    assert np.isnan(runs[0].stages[0][2])
@@ -0,0 +1,79 @@
+#SWC & NEURON export of synthetic skeletons, checked with check_swc & check_hoc
+
+import os
+
+import numpy as np
+import pandas as ps
+import pytest
+
+from Electrotonic_Properties.neuron_export import (export_neuron, export_neurons, check_swc, check_hoc,
+                                                   model_arrays, sections, output_file)
+from Skeleton_Data.skeleton import Skeleton
+from Skeleton_Data.synthetic import synthetic_skeleton
+
+
+def test_swc(tmp_path):
+    sk = synthetic_skeleton(2000)
+    export_neuron(sk, str(tmp_path), formats = ['swc'])
+
+    swc = check_swc(output_file(str(tmp_path), 1, 'swc'))
+
+    assert len(swc) == len(sk)
+    assert swc.type.values[0] == 1
+    assert swc.parent.values[0] == -1
+
+
+def test_hoc(tmp_path):
+    sk = synthetic_skeleton(2000)
+    export_neuron(sk, str(tmp_path), formats = ['hoc'], Rm = 20.8, Cm = 0.8, Ri = 266.1)
+
+    hoc = check_hoc(output_file(str(tmp_path), 1, 'hoc'))
+    n_sections = len(sections(model_arrays(sk)['parent'])[2])
+
+    assert hoc['template'] == 'skeleton_1'
+    assert hoc['n_sections'] == n_sections
+    #Every section has its attachment point and its treenodes, the soma two points
+    assert hoc['n_points'] == n_sections + len(sk) - 1 + 2
+    assert np.isclose(hoc['parameters']['g_pas'], 1 / 20.8e3)
+    assert hoc['parameters']['cm'] == 0.8
+    assert hoc['parameters']['Ra'] == 266.1
+
+
+def test_soma_only(tmp_path):
+    sk = Skeleton(5, [10], [-1], [[1000, 2000, 3000]], radius = [2500], soma = 10)
+    export_neuron(sk, str(tmp_path))
+
+    assert len(check_swc(output_file(str(tmp_path), 5, 'swc'))) == 1
+    assert check_hoc(output_file(str(tmp_path), 5, 'hoc'))['n_sections'] == 0
+
+
+def test_export_neurons(tmp_path):
+    skeletons = [synthetic_skeleton(500 + 100 * i, skeleton_id = i, seed = i) for i in range(1, 4)]
+
+    manifest = export_neurons(skeletons, str(tmp_path), n_cores = 1)
+
+    assert (manifest.status == 'ok').all()
+    assert sorted(manifest.skeleton_id) == [1, 2, 3]
+    assert len(ps.read_csv(os.path.join(str(tmp_path), 'manifest.csv'))) == 3
+    for sk in skeletons:
+        check_swc(output_file(str(tmp_path), sk.skeleton_id, 'swc'))
+        check_hoc(output_file(str(tmp_path), sk.skeleton_id, 'hoc'))
+
+
+def test_invalid_files(tmp_path):
+    sk = synthetic_skeleton(500)
+    export_neuron(sk, str(tmp_path))
+
+    swc = output_file(str(tmp_path), 1, 'swc')
+    lines = open(swc).read().splitlines(True)
+    with open(swc, 'w') as f:
+        f.writelines(lines[:-2] + lines[-1:])
+    with pytest.raises(ValueError):
+        check_swc(swc)
+
+    hoc = output_file(str(tmp_path), 1, 'hoc')
+    text = open(hoc).read()
+    with open(hoc, 'w') as f:
+        f.write(text.replace('\tconnect dend[0](0)', '\t//', 1))
+    with pytest.raises(ValueError):
+        check_hoc(hoc)
@@ -0,0 +1,133 @@
+#Splitting, laying out & stitching subtrees, with a stand-in for graphviz
+
+import numpy as np
+import pytest
+
+from Dendrogram_code import parallel_layout
+from Dendrogram_code.parallel_layout import parallel_graphviz_layout, _split, _tasks
+from Skeleton_Data.tree import parent_index, depth, depth_first_order
+from Skeleton_Data.synthetic import synthetic_skeleton
+
+#The tree of test_tree.py: backbone 0, 1, 2 & 5 for max_subtree = 2
+PARENT = np.array([-1, 0, 1, 2, 3, 2, 5, 5])
+
+
+def fake_graphviz_layout(nodes, prog = 'dot'):
+    """ Deterministic tree layout in points: depth-first position across,
+    depth downwards (like dot, the root is at the top) """
+
+    parent = parent_index(nodes)
+    pre = np.empty(len(parent), dtype = np.int64)
+    pre[depth_first_order(parent)] = np.arange(len(parent))
+
+    xy = np.column_stack((20. * pre, -72. * depth(parent)))
+    if prog != 'dot':
+        #Any orientation: neato & fdp layouts are turned around their root
+        xy = xy @ np.array([[0.6, -0.8], [0.8, 0.6]])
+
+    return dict(zip(nodes.treenode_id.values.astype(np.int64).tolist(), map(tuple, xy.tolist())))
+
+
+@pytest.fixture
+def layouts(monkeypatch):
+    calls = []
+
+    def layout(nodes, prog = 'dot'):
+        calls.append(nodes)
+        return fake_graphviz_layout(nodes, prog = prog)
+
+    monkeypatch.setattr(parallel_layout, 'graphviz_layout', layout)
+    return calls
+
+
+def test_split():
+    piece, heads, pre, size = _split(PARENT, 2)
+
+    assert list(heads) == [3, 6, 7]
+    assert list(piece) == [-1, -1, -1, 0, 0, -1, 1, 2]
+    assert list(size) == [8, 7, 6, 2, 1, 3, 1, 1]
+    assert sorted(pre) == list(range(8))
+
+
+def test_tasks():
+    tasks = _tasks(np.array([5, 1, 8, 3, 2]), 8)
+
+    assert sorted(sum(tasks, [])) == [0, 1, 2, 3, 4]
+    assert tasks[0] == [2]
+    assert all(sum([5, 1, 8, 3, 2][k] for k in task) <= 8 for task in tasks)
+
+
+def subtrees(nodes, max_subtree):
+    parent = parent_index(nodes)
+    piece, heads, _, _ = _split(parent, max_subtree)
+    return parent, piece, heads
+
+
+@pytest.mark.parametrize('prog', ['dot', 'neato'])
+def test_layout(layouts, prog):
+    nodes = synthetic_skeleton(3000).nodes
+    ids = nodes.treenode_id.values.astype(np.int64)
+
+    pos = parallel_graphviz_layout(nodes, prog = prog, n_cores = 1, max_subtree = 200)
+
+    assert sorted(pos) == sorted(ids.tolist())
+    xy = np.array([pos[tn] for tn in ids.tolist()])
+    assert np.isfinite(xy).all()
+
+    #Every subtree was laid out on its own, as a tree with a single root
+    parent, piece, heads = subtrees(nodes, 200)
+    assert len(layouts) == len(heads)
+    assert all(len(t) <= 200 and t.parent_id.isnull().sum() == 1 for t in layouts)
+
+    #...and keeps its own layout, up to a shift (dot) or a turn around its root (neato)
+    for k, table in enumerate(layouts):
+        own = fake_graphviz_layout(table, prog = prog)
+        rows = np.flatnonzero(np.isin(ids, table.treenode_id.values.astype(np.int64)))
+        assert len(np.unique(piece[rows])) == 1
+
+        before = np.array([own[tn] for tn in ids[rows].tolist()])
+        after = xy[rows]
+        if prog == 'dot':
+            assert np.allclose(after - after[0], before - before[0])
+        else:
+            dist = lambda p: np.hypot(*(p[:, None] - p[None]).transpose(2, 0, 1))
+            assert np.allclose(dist(after), dist(before))
+
+
+def test_dot_side_by_side(layouts):
+    nodes = synthetic_skeleton(3000).nodes
+    ids = nodes.treenode_id.values.astype(np.int64)
+
+    pos = parallel_graphviz_layout(nodes, prog = 'dot', n_cores = 1, max_subtree = 200)
+    xy = np.array([pos[tn] for tn in ids.tolist()])
+    parent, piece, heads = subtrees(nodes, 200)
+
+    #Subtrees do not overlap & follow each other in depth-first order
+    lo = np.array([xy[piece == k, 0].min() for k in range(len(heads))])
+    hi = np.array([xy[piece == k, 0].max() for k in range(len(heads))])
+    assert np.all(lo[1:] > hi[:-1])
+
+    #The backbone is one rank (72 points down) per level, every subtree root one rank below its parent
+    backbone = piece < 0
+    assert np.allclose(xy[backbone, 1], -72 * depth(parent)[backbone])
+    assert np.allclose(xy[heads, 1], xy[parent[heads], 1] - 72)
+
+
+def test_small_neuron(layouts):
+    nodes = synthetic_skeleton(500).nodes
+
+    pos = parallel_graphviz_layout(nodes, prog = 'dot', n_cores = 1)
+
+    #Below max_subtree the whole neuron goes to graphviz in one go
+    assert len(layouts) == 1
+    assert pos == fake_graphviz_layout(nodes)
+
+
+def test_invalid():
+    nodes = synthetic_skeleton(500).nodes
+
+    with pytest.raises(ValueError):
+        parallel_graphviz_layout(nodes, prog = 'twopi')
+
+    with pytest.raises(ValueError):
+        parallel_graphviz_layout(nodes, n_cores = 0)
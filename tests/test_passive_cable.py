@@ -0,0 +1,98 @@
+#PassiveCable against dense solves of the conductance matrix of a small tree
+
+import numpy as np
+import pytest
+
+from Electrotonic_Properties.passive_cable import PassiveCable
+
+#      0
+#      |
+#      1
+#     / \
+#    2   3
+#    |  / \
+#    4 5   6
+PARENT = np.array([-1, 0, 1, 1, 2, 3, 3])
+IDS = np.array([10, 11, 12, 13, 14, 15, 16])
+
+
+def small_cable():
+    rng = np.random.RandomState(0)
+    n = len(PARENT)
+    return PassiveCable(IDS, PARENT, rng.uniform(0.5, 2, n), rng.uniform(0.01, 0.1, n), rng.uniform(0.5, 1, n))
+
+
+def dense_conductance(cable):
+    G = np.diag(cable.g_membrane)
+    for i, p in enumerate(cable.parent):
+        if p >= 0:
+            g = cable.g_axial[i]
+            G[[i, p], [i, p]] += g
+            G[i, p] -= g
+            G[p, i] -= g
+    return G
+
+
+def test_steady_state():
+    cable = small_cable()
+    G = dense_conductance(cable)
+
+    for site in range(len(cable)):
+        current = np.zeros(len(cable))
+        current[site] = 0.5
+        v = cable.steady_state(IDS[site], amplitude = 0.5)
+        assert np.allclose(v.values, np.linalg.solve(G, current))
+
+    #Several sites at once add up
+    v = cable.steady_state([14, 16], amplitude = [1, 2])
+    assert np.allclose(v.values, np.linalg.solve(G, np.array([0, 0, 0, 0, 1, 0, 2])))
+
+
+def test_transient():
+    cable = small_cable()
+    G = dense_conductance(cable)
+    dt = 0.1
+    C = np.diag(cable.capacitance / dt)
+
+    trace = cable.transient([14, 16], amplitude = [1, 2], t_stop = 2, dt = dt, record = IDS)
+
+    #Backward Euler, step by step
+    current = np.array([0, 0, 0, 0, 1, 0, 2])
+    v = np.zeros(len(cable))
+    for k in range(1, len(trace)):
+        v = np.linalg.solve(G + C, C @ v + current)
+        assert np.allclose(trace.values[k], v)
+
+    #Late times reach the steady state
+    late = cable.transient([14, 16], amplitude = [1, 2], t_stop = 500, dt = 0.5, record = IDS)
+    assert np.allclose(late.values[-1], np.linalg.solve(G, current), rtol = 1e-6)
+
+
+def test_transient_step():
+    cable = small_cable()
+
+    trace = cable.transient(15, t_stop = 5, dt = 0.1, delay = 1, duration = 2)
+
+    assert list(trace.columns) == [10, 15]
+    assert (trace.loc[:1].values == 0).all()
+    assert trace.loc[3].values[1] > trace.loc[5].values[1] > 0
+
+
+def test_transient_separate():
+    cable = small_cable()
+    sites = [14, 15, 12]
+
+    trace = cable.transient(sites, amplitude = [1, 2, 3], t_stop = 3, dt = 0.1, record = [10, 16], separate = True)
+
+    assert trace.columns.names == ['inject', 'record']
+    for site, amplitude in zip(sites, [1, 2, 3]):
+        alone = cable.transient(site, amplitude = amplitude, t_stop = 3, dt = 0.1, record = [10, 16])
+        assert np.allclose(trace[site].values, alone.values)
+
+    together = cable.transient(sites, amplitude = [1, 2, 3], t_stop = 3, dt = 0.1, record = [10, 16])
+    assert np.allclose(trace.T.groupby(level = 'record').sum().T.values, together.values)
+
+
+def test_unknown_treenode():
+    with pytest.raises(ValueError):
+        small_cable().steady_state(99)
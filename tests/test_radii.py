@@ -0,0 +1,87 @@
+#Radius estimates of a small hand-built tree with connectors at known distances
+
+import numpy as np
+import pandas as ps
+import pytest
+
+from Skeleton_Data.radii import estimate_radii, skeleton_radii
+from Skeleton_Data.skeleton import Skeleton
+
+#Rows of the tree (treenode_id = 10 * row), in the z = 0 plane:
+#
+#    0 (0,0) - 1 (0,100) - 2 (0,150) - 3 (0,300) - 4 (0,400) - 5 (0,500) - 6 (0,600) - 7 (0,700)
+#                                                      |
+#                                                      8 (100,400) - 9 (200,400)
+#
+#Runs: [0], [1 2 3 4], [5 6 7] & [8 9]. Connectors sit 10 nm from 1, 30 nm from 3 & 60 nm from 6
+PARENT = [-1, 0, 1, 2, 3, 4, 5, 6, 4, 8]
+XY = [[0, 0], [0, 100], [0, 150], [0, 300], [0, 400], [0, 500], [0, 600], [0, 700], [100, 400], [200, 400]]
+
+
+def tables():
+    nodes = ps.DataFrame({'treenode_id':10 * np.arange(10),
+                          'parent_id':[None if p < 0 else 10 * p for p in PARENT],
+                          'x':[x for x, y in XY], 'y':[y for x, y in XY], 'z':0})
+    connectors = ps.DataFrame({'connector_id':[1, 2, 3], 'treenode_id':[10, 30, 60], 'relation':[0, 1, 1],
+                               'x':[0, 0, 0], 'y':[100, 300, 600], 'z':[10, 30, 60]})
+    return nodes, connectors
+
+
+def test_interpolation():
+    nodes, connectors = tables()
+    radii = estimate_radii(nodes, connectors, smooth = False)
+
+    assert list(radii.index) == list(nodes.treenode_id)
+    #1 & 3 are measured, 2 is interpolated by cable length, 4 takes the radius above it
+    assert np.allclose(radii.loc[[10, 20, 30, 40]], [10, 15, 30, 30])
+    #5 & 7 take the radius of 6, the only measurement of their run
+    assert np.allclose(radii.loc[[50, 60, 70]], 60)
+
+
+def test_ancestor_fill():
+    nodes, connectors = tables()
+    radii = estimate_radii(nodes, connectors, smooth = False)
+
+    #The run 8-9 has no measurements and takes the radius of the branch point 4
+    assert np.allclose(radii.loc[[80, 90]], 30)
+    #The root has no measured ancestor and takes the median radius
+    assert radii.loc[0] == np.median(radii.values[1:])
+    assert not radii.isnull().any()
+
+
+def test_smoothing():
+    nodes, connectors = tables()
+    radii = estimate_radii(nodes, connectors, smooth = True, window = 3)
+
+    #Moving average of 3 within every run, not across branch points
+    assert np.allclose(radii.loc[[10, 20, 30, 40]], [12.5, 55 / 3, 25, 30])
+    assert np.allclose(radii.loc[[50, 60, 70, 80, 90]], [60, 60, 60, 30, 30])
+    assert np.allclose(estimate_radii(nodes, connectors, smooth = True, window = 1),
+                       estimate_radii(nodes, connectors, smooth = False))
+
+
+def test_max_distance():
+    nodes, connectors = tables()
+    radii = estimate_radii(nodes, connectors, max_distance = 65, smooth = False)
+
+    #2 is now measured itself (51 nm from the connector of 1); 5 & 7 are too far from any
+    assert np.allclose(radii.loc[[10, 20, 30, 40]], [10, np.hypot(50, 10), 30, 30])
+    assert np.allclose(radii.loc[[50, 60, 70, 80, 90]], [60, 60, 60, 30, 30])
+
+    with pytest.raises(ValueError):
+        estimate_radii(nodes, connectors, max_distance = 5)
+
+    with pytest.raises(ValueError):
+        estimate_radii(nodes, connectors.iloc[:0])
+
+
+def test_skeleton_radii():
+    nodes, connectors = tables()
+    nodes['radius'] = [-1, -1, 500, -1, -1, -1, -1, -1, -1, -1]
+    sk = Skeleton.from_tables(1, nodes, connectors)
+
+    radii = skeleton_radii(sk, smooth = False)
+
+    #Set radii are kept, the others estimated
+    assert radii.loc[20] == 500
+    assert np.allclose(radii.drop(20), estimate_radii(sk, sk.connectors, smooth = False).drop(20))
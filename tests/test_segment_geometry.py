@@ -0,0 +1,89 @@
+#Segment geometry & ri/rm/cm of a small hand-built tree
+
+import numpy as np
+import pandas as ps
+import pytest
+
+from Electrotonic_Properties.segment_geometry import SegmentGeometry, segment_geometry, electrical_properties, NM_TO_CM
+
+#Same tree as in test_tree.py, with treenode_id = 100 + row and one radius (nm) per node:
+#segments 102->100 (15 nm), 107->105 (10), 104->102 (8), 105->102 (5), 106->105 (1)
+NODES = ps.DataFrame({'treenode_id':np.arange(100, 108),
+                      'parent_id':[None, 100, 101, 102, 103, 102, 105, 105],
+                      'x':[0, 3, 3, 3, 3, 6, 6, 6],
+                      'y':[0, 4, 14, 14, 14, 18, 18, 28],
+                      'z':[0, 0, 0, 6, 8, 0, 1, 0],
+                      'radius':[50, 40, 30, 20, 10, 25, 5, 15]})
+
+START = [102, 107, 104, 105, 106]
+END = [100, 105, 102, 102, 105]
+LENGTH = np.array([15, 10, 8, 5, 1]) * NM_TO_CM
+RADIUS = np.array([30, 15, 10, 25, 5]) * NM_TO_CM
+
+
+def test_geometry():
+    geometry = segment_geometry(NODES)
+
+    assert list(geometry.start_node) == START
+    assert list(geometry.end_node) == END
+    assert np.allclose(geometry['length (cm)'], LENGTH)
+    assert np.allclose(geometry['radii (cm)'], RADIUS)
+    assert np.allclose(geometry['surface_area (cm^2)'], 2 * np.pi * RADIUS * LENGTH)
+    assert np.allclose(geometry['cross_sectional_area (cm^2)'], np.pi * RADIUS**2)
+
+    #Radii given separately take precedence over the radius column
+    radii = ps.Series(2 * NODES.radius.values, index = NODES.treenode_id.values)
+    assert np.allclose(segment_geometry(NODES, radii = radii)['radii (cm)'], 2 * RADIUS)
+
+
+def test_electrical_properties():
+    Rm, Cm, Ri = 20.8, 0.8, 266.1
+    segment_matrix = electrical_properties(segment_geometry(NODES), Rm = Rm, Cm = Cm, Ri = Ri)
+
+    a = 2 * np.pi * RADIUS * LENGTH
+    A = np.pi * RADIUS**2
+
+    assert np.allclose(segment_matrix.ri, Ri * LENGTH / A)
+    assert np.allclose(segment_matrix.rm, Rm / a)
+    assert np.allclose(segment_matrix.cm, Cm * a)
+
+    #The same from a SegmentGeometry
+    geo = SegmentGeometry.from_nodes(NODES)
+    assert np.allclose(electrical_properties(geo, Rm = Rm, Cm = Cm, Ri = Ri)[['ri', 'rm', 'cm']].values,
+                       segment_matrix[['ri', 'rm', 'cm']].values)
+
+
+def test_sweep_grid():
+    geo = SegmentGeometry.from_nodes(NODES)
+    Rm, Cm, Ri = [10, 20, 30], 0.8, [100, 200]
+
+    res = geo.sweep(Rm = Rm, Cm = Cm, Ri = Ri, grid = True)
+
+    #Every combination, Ri varying fastest
+    assert res['ri'].shape == res['rm'].shape == res['cm'].shape == (6, len(START))
+    assert list(res['Rm']) == [10, 10, 20, 20, 30, 30]
+    assert list(res['Ri']) == [100, 200] * 3
+    assert list(res['Cm']) == [0.8] * 6
+
+    for p in range(6):
+        single = electrical_properties(geo, Rm = res['Rm'][p], Cm = res['Cm'][p], Ri = res['Ri'][p])
+        assert np.allclose(res['ri'][p], single.ri)
+        assert np.allclose(res['rm'][p], single.rm)
+        assert np.allclose(res['cm'][p], single.cm)
+
+
+def test_sweep_broadcast():
+    geo = SegmentGeometry.from_nodes(NODES)
+
+    res = geo.sweep(Rm = [10, 20], Cm = 0.8, Ri = [100, 200])
+
+    assert res['ri'].shape == (2, len(START))
+    assert list(res['Cm']) == [0.8, 0.8]
+    assert np.allclose(res['rm'][1], electrical_properties(geo, Rm = 20).rm)
+    assert np.allclose(res['ri'][1], electrical_properties(geo, Ri = 200).ri)
+
+    with pytest.raises(ValueError):
+        geo.sweep(Rm = [10, 20, 30], Ri = [100, 200])
+
+    with pytest.raises(ValueError):
+        geo.sweep(Rm = [[10, 20]])
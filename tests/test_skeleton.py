@@ -0,0 +1,34 @@
+#Skeleton built from node & connector tables
+
+import numpy as np
+import pandas as ps
+import pytest
+
+from Skeleton_Data.skeleton import Skeleton
+from Skeleton_Data.synthetic import synthetic_neuron
+
+
+def test_from_tables():
+    nodes, connectors = synthetic_neuron(500)
+    sk = Skeleton.from_tables(1, nodes, connectors)
+
+    assert len(sk) == len(nodes)
+    assert np.array_equal(sk.connectors.treenode_id.values, connectors.treenode_id.values)
+    assert np.array_equal(sk.connectors.connector_id.values, connectors.connector_id.values)
+
+
+def test_connectors_without_treenode():
+    nodes, connectors = synthetic_neuron(500)
+    missing = connectors.iloc[:3].copy()
+    missing['treenode_id'] = nodes.treenode_id.max() + 1 + np.arange(3)
+    connectors = connectors.iloc[3:]
+
+    sk = Skeleton.from_tables(1, nodes, ps.concat([missing, connectors]))
+
+    assert np.array_equal(sk.connector_id, connectors.connector_id.values)
+    assert np.array_equal(sk.connectors.treenode_id.values, connectors.treenode_id.values)
+
+
+def test_connector_rows_checked():
+    with pytest.raises(ValueError):
+        Skeleton(1, [1, 2], [-1, 0], np.zeros((2, 3)), connector_id = [5], connector_node = [-1], relation = [0])
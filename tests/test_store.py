@@ -0,0 +1,57 @@
+#SkeletonStore: stored skeletons & their radii
+
+import numpy as np
+
+from Skeleton_Data.store import SkeletonStore
+from Skeleton_Data.radii import estimate_radii
+from Skeleton_Data.synthetic import synthetic_skeleton
+from Electrotonic_Properties.neuron_export import model_arrays
+from Electrotonic_Properties.electrotonic_distance import electrotonic_distances
+
+
+def test_roundtrip(tmp_path):
+    store = SkeletonStore(str(tmp_path))
+    skeletons = [synthetic_skeleton(300 * i, skeleton_id = i, seed = i) for i in (1, 2, 3)]
+    store.add(skeletons)
+
+    assert len(store) == 3
+    for sk in skeletons:
+        stored = store.get(sk.skeleton_id)
+        assert np.array_equal(stored.treenode_id, sk.treenode_id)
+        assert np.array_equal(stored.parent, sk.parent)
+        assert np.array_equal(stored.connector_id, sk.connector_id)
+        assert stored.soma == sk.soma
+
+
+def test_radii_estimated(tmp_path):
+    sk = synthetic_skeleton(2000)
+    assert (sk.radius < 0).all()
+
+    store = SkeletonStore(str(tmp_path))
+    store.add(sk)
+    stored = store.get(sk.skeleton_id)
+
+    assert (stored.radius > 0).all()
+    assert np.allclose(stored.radius, estimate_radii(sk, sk.connectors).values)
+
+
+def test_set_radii_kept(tmp_path):
+    sk = synthetic_skeleton(2000)
+    sk.radius[:100] = 5000
+
+    store = SkeletonStore(str(tmp_path))
+    store.add(sk)
+    stored = store.get(sk.skeleton_id)
+
+    assert (stored.radius[:100] == 5000).all()
+    assert (stored.radius[100:] > 0).all()
+
+
+def test_unset_radii_estimated():
+    #Skeletons that did not come from the store are handled the same way
+    sk = synthetic_skeleton(2000)
+    radius = model_arrays(sk)['radius']
+
+    assert np.allclose(radius * 1000, estimate_radii(sk, sk.connectors).values)
+    #With radii of 1 nm, this would be above 1
+    assert electrotonic_distances(sk).electrotonic_distance.max() < 0.5
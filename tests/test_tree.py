@@ -0,0 +1,84 @@
+#Parent index primitives on a small hand-built tree
+
+import numpy as np
+import pandas as ps
+import pytest
+
+from Skeleton_Data.tree import (parent_index, parent_distances, distance_to_root, depth, children, child_counts,
+                                depth_first_order, subtree_sizes, segments)
+
+#Rows of the tree, with the distance to the parent in brackets:
+#
+#    0 (root)
+#    |  (5)
+#    1
+#    |  (10)
+#    2 ---(6)--- 3 ---(2)--- 4
+#    |  (5)
+#    5 ---(1)--- 6
+#    |  (10)
+#    7
+PARENT = np.array([-1, 0, 1, 2, 3, 2, 5, 5])
+XYZ = np.array([[0, 0, 0], [3, 4, 0], [3, 14, 0], [3, 14, 6], [3, 14, 8], [6, 18, 0], [6, 18, 1], [6, 28, 0]])
+TO_ROOT = np.array([0, 5, 15, 21, 23, 20, 21, 30])
+
+
+def node_table():
+    #Rows in a different order than the tree, with treenode_id = 100 + row of the tree
+    perm = np.array([4, 0, 6, 2, 7, 1, 5, 3])
+    return ps.DataFrame({'treenode_id':100 + perm,
+                         'parent_id':[None if PARENT[p] < 0 else 100 + PARENT[p] for p in perm],
+                         'x':XYZ[perm, 0], 'y':XYZ[perm, 1], 'z':XYZ[perm, 2]}), perm
+
+
+def test_parent_index():
+    nodes, perm = node_table()
+    parent = parent_index(nodes)
+
+    #Map the rows of the table back to the rows of the tree
+    assert np.array_equal(np.where(parent < 0, -1, perm[parent]), PARENT[perm])
+    assert np.allclose(distance_to_root(parent, parent_distances(nodes, parent)), TO_ROOT[perm])
+
+
+def test_distance_to_root():
+    parent_dist = parent_distances(ps.DataFrame(XYZ, columns = ['x', 'y', 'z']), PARENT)
+
+    assert np.allclose(parent_dist, [0, 5, 10, 6, 2, 5, 1, 10])
+    assert np.allclose(distance_to_root(PARENT, parent_dist), TO_ROOT)
+    assert np.array_equal(depth(PARENT), [0, 1, 2, 3, 4, 3, 4, 4])
+
+
+def test_children():
+    indptr, indices = children(PARENT)
+
+    assert np.array_equal(child_counts(PARENT), [1, 1, 2, 1, 0, 2, 0, 0])
+    assert [list(indices[indptr[i]:indptr[i + 1]]) for i in range(len(PARENT))] == [[1], [2], [3, 5], [4], [], [6, 7], [], []]
+
+
+def test_depth_first_order():
+    order = depth_first_order(PARENT)
+    sizes = subtree_sizes(PARENT)
+
+    assert sorted(order) == list(range(len(PARENT)))
+    assert np.array_equal(sizes, [8, 7, 6, 2, 1, 3, 1, 1])
+
+    #Every subtree is a contiguous stretch of the order
+    pre = np.empty(len(order), dtype = np.int64)
+    pre[order] = np.arange(len(order))
+    assert set(order[pre[5]:pre[5] + sizes[5]]) == {5, 6, 7}
+    assert set(order[pre[3]:pre[3] + sizes[3]]) == {3, 4}
+
+    with pytest.raises(ValueError):
+        depth_first_order(np.array([-1, 0, -1]))
+
+
+def test_segments():
+    start, end = segments(PARENT)
+
+    #Leaves & branch points start segments, which end at the next branch point or the root
+    assert sorted(zip(start, end)) == [(2, 0), (4, 2), (5, 2), (6, 5), (7, 5)]
+
+    #Sorted longest first
+    start, end = segments(PARENT, [0, 5, 10, 6, 2, 5, 1, 10])
+    assert list(zip(start, end)) == [(2, 0), (7, 5), (4, 2), (5, 2), (6, 5)]
+    assert np.allclose(TO_ROOT[start] - TO_ROOT[end], [15, 10, 8, 5, 1])
@@ -0,0 +1,86 @@
+#Point-in-mesh tests against convex meshes, where the answer is known exactly
+
+import numpy as np
+import pandas as ps
+from scipy.spatial import ConvexHull
+
+from Skeleton_Data.volumes import VolumeMesh, in_volumes
+
+
+def cube(size = 10):
+    corners = np.array([[x, y, z] for x in (0, size) for y in (0, size) for z in (0, size)], dtype = np.float64)
+    hull = ConvexHull(corners)
+    return VolumeMesh(corners, hull.simplices, name = 'cube'), hull
+
+
+def sphere(radius = 1000, n = 500):
+    #Fibonacci lattice on the sphere
+    i = np.arange(n) + 0.5
+    phi = np.arccos(1 - 2 * i / n)
+    theta = np.pi * (1 + 5**0.5) * i
+    vertices = radius * np.column_stack((np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)))
+    hull = ConvexHull(vertices)
+    return VolumeMesh(vertices, hull.simplices, name = 'sphere'), hull
+
+
+def hull_contains(hull, points, tolerance = 1e-6):
+    #Inside a convex mesh = not in front of any of its faces
+    return (points @ hull.equations[:, :3].T + hull.equations[:, 3] <= tolerance).all(axis = 1)
+
+
+def test_cube_surface():
+    mesh, _ = cube()
+
+    #Faces, edges & vertices count as inside, whichever side of the cube they are on
+    surface = np.array([[0, 0, 5], [10, 10, 5], [0, 10, 5], [10, 0, 5],
+                        [5, 5, 0], [5, 5, 10], [0, 5, 5], [10, 5, 5], [5, 0, 5], [5, 10, 5],
+                        [0, 0, 0], [10, 10, 10], [10, 0, 10], [5, 0, 10], [0, 5, 0], [10, 10, 0],
+                        [2.5, 2.5, 10], [7.5, 2.5, 0], [3, 7, 0]])
+    assert mesh.contains(surface).all()
+
+    inside = np.array([[5, 5, 5], [0.001, 0.001, 5], [9.999, 9.999, 9.999], [5, 5, 1e-3]])
+    assert mesh.contains(inside).all()
+
+    outside = np.array([[-0.001, 0, 5], [10.001, 10, 5], [5, 5, -0.001], [5, 5, 10.001], [10, 10, 10.001],
+                        [20, 5, 5], [5, 5, -20]])
+    assert not mesh.contains(outside).any()
+
+
+def test_cube_random():
+    mesh, hull = cube()
+    rng = np.random.RandomState(0)
+
+    points = rng.uniform(-2, 12, (20000, 3))
+    #Snap some points onto the faces & edges
+    points[:5000] = np.clip(points[:5000], 0, 10)
+    points[5000:7000, :2] = np.round(points[5000:7000, :2] / 10) * 10
+
+    assert np.array_equal(mesh.contains(points), hull_contains(hull, points))
+
+
+def test_sphere():
+    mesh, hull = sphere()
+    rng = np.random.RandomState(1)
+
+    points = rng.uniform(-1100, 1100, (20000, 3))
+    assert np.array_equal(mesh.contains(points), hull_contains(hull, points))
+
+    #Vertices, edge midpoints & face centres of the mesh
+    t = mesh.triangles
+    surface = np.concatenate((t.reshape(-1, 3), (t[:, 0] + t[:, 1]) / 2, t.mean(axis = 1)))
+    assert mesh.contains(surface).all()
+
+    #Just off the surface, along the normals of the faces
+    normals = hull.equations[:, :3]
+    assert mesh.contains(t.mean(axis = 1) - 1e-3 * normals).all()
+    assert not mesh.contains(t.mean(axis = 1) + 1e-3 * normals).any()
+
+
+def test_in_volumes():
+    mesh, _ = cube()
+    nodes = ps.DataFrame({'treenode_id':[1, 2, 3], 'x':[5, 10, 11], 'y':[5, 10, 5], 'z':[5, 5, 5]})
+
+    inside = in_volumes(nodes, [mesh])
+
+    assert list(inside.columns) == ['cube']
+    assert list(inside.cube) == [True, True, False]